@@ -0,0 +1,237 @@
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gp
+from gurobipy import GRB
+
+# Shared container loading formulation. Variables are created in blocks with addMVar and every
+# constraint family is assembled as one sparse matrix and added with a single addMConstr call,
+# instead of one addConstr call per row.
+
+ORIENTATIONS = ["lx", "ly", "lz", "wx", "wy", "wz", "hx", "hy", "hz"]
+RELATIVE_POSITIONS = ["aik", "bik", "cik", "dik", "eik", "fik"]
+AXES = ["x", "y", "z"]
+
+
+def labels(names, prefix, rows, cols = None):
+    """
+    Build the names of a vector or matrix of variables or constraints.
+    Args:
+        names (bool): If False no names are built and Gurobi assigns its default ones.
+        prefix (str): Prefix of every name.
+        rows (list): Ids of the first dimension.
+        cols (list, optional): Ids of the second dimension.
+    Returns:
+        numpy.ndarray or None: Names of the form prefix + row (+ "_" + col), or None if naming is skipped.
+    """
+    if not names:
+        return None
+    if cols is None:
+        return np.array([f"{prefix}{row}" for row in rows])
+    return np.array([[f"{prefix}{row}_{col}" for col in cols] for row in rows])
+
+
+def sum_terms(index, coeff = 1):
+    """
+    Split an index array whose last axis enumerates variables into one term per variable,
+    e.g. the six relative position variables of every pair of cartons. coeff is broadcast to the index array.
+    """
+    coeff = np.broadcast_to(np.asarray(coeff, dtype=float), index.shape)
+    return [(index[..., t], coeff[..., t]) for t in range(index.shape[-1])]
+
+
+class BigM:
+    """
+    Tightest valid big-M constants of the container loading constraints. A carton lying in a container has
+    every coordinate between 0 and the largest container extent minus its shortest side, and a carton left out
+    can stay at the origin, so the coordinates are bounded by upper. The constant of a constraint is the
+    largest value its left hand side reaches over these bounds, so switching it off never cuts a solution.
+    If a constant is given it is used for every constraint instead, as in the original models.
+    """
+
+    def __init__(self, cartons, containers, constant = None):
+        dims = np.array([[carton['length'], carton['width'], carton['height']] for carton in cartons], dtype=float).reshape(-1, 3)
+        self.extents = np.array([[container['length'], container['width'], container['height']] for container in containers],
+                                dtype=float).reshape(-1, 3)
+        self.shortest = dims.min(axis=1, initial=np.inf)
+        self.longest = dims.max(axis=1, initial=0)
+        reach = self.extents.max(axis=0, initial=0)
+        self.upper = np.maximum(reach[None, :] - self.shortest[:, None], 0)     # carton x axis
+        self.constant = constant
+
+    def value(self, M):
+        """
+        Get the given constants, or the fixed constant in their shape if one was given.
+        """
+        M = np.asarray(M, dtype=float)
+        return M if self.constant is None else np.full(M.shape, float(self.constant))
+
+    def fit(self, axis):
+        """
+        Constants of x_i + dim_i <= extent_j + (1 - s_ij) * M, carton x container.
+        """
+        return self.value(np.maximum(self.upper[:, axis, None] + self.longest[:, None] - self.extents[None, :, axis], 0))
+
+    def overlap(self, axis, rows):
+        """
+        Constants of x_i + dim_i <= x_k + (1 - aik) * M for the cartons i in rows.
+        """
+        return self.value(self.upper[rows, axis] + self.longest[rows])
+
+
+class Formulation:
+    """
+    Variables and constraints of a model addressed by integer indices. A family of constraints is given as
+    a list of terms (variable index array, coefficient array); the arrays of all terms and the right hand
+    side are broadcast against each other and every element of the result is one constraint row.
+    """
+
+    def __init__(self, model, names = True):
+        self.model = model
+        self.names = names
+        self.blocks = []        # flattened MVar of every variable block, in index order
+        self.variables = []     # Gurobi variable of every index
+        self.size = 0
+        self.X = None           # all variables as one MVar, rebuilt after new blocks are added
+
+    def add_vars(self, shape, vtype, name = None, ub = GRB.INFINITY):
+        """
+        Add a block of variables.
+        Returns:
+            numpy.ndarray: Indices of the new variables, with the given shape.
+        """
+        block = self.model.addMVar(shape, vtype=vtype, ub=ub, name=name if self.names else None).reshape(-1)
+        index = np.arange(self.size, self.size + block.size).reshape(shape)
+        self.size += block.size
+        self.blocks.append(block)
+        self.variables.extend(block.tolist())
+        self.X = None
+        return index
+
+    def add_rows(self, terms, sense, rhs, name = None):
+        """
+        Add the family of constraints sum(coeff * var for each term) sense rhs.
+        Args:
+            terms (list): (variable index array, coefficient array) pairs, broadcast to the shape of the family.
+            sense (str): GRB.LESS_EQUAL, GRB.GREATER_EQUAL or GRB.EQUAL.
+            rhs (float or numpy.ndarray): Right hand side, broadcast to the shape of the family.
+            name (numpy.ndarray, optional): Names of the constraints, with the shape of the family.
+        """
+        arrays = np.broadcast_arrays(*[np.asarray(index) for index, _ in terms],
+                                     *[np.asarray(coeff, dtype=float) for _, coeff in terms],
+                                     np.asarray(rhs, dtype=float))
+        t = len(terms)
+        b = arrays[-1].ravel()
+        if b.size == 0:
+            return
+        cols = np.stack([array.ravel() for array in arrays[:t]], axis=1)
+        vals = np.stack([array.ravel() for array in arrays[t:2 * t]], axis=1)
+        rows = np.repeat(np.arange(b.size), t)
+        # duplicate (row, variable) entries are summed by the sparse matrix
+        A = sp.csr_matrix((vals.ravel(), (rows, cols.ravel())), shape=(b.size, self.size))
+        if self.X is None:
+            self.X = gp.hstack(self.blocks)
+        self.model.addMConstr(A, self.X, sense, b, name=np.asarray(name).ravel() if self.names and name is not None else None)
+
+    def dims(self, axis, rows = slice(None), scale = 1):
+        """
+        Get the terms of scale times the dimension of cartons along an axis for their chosen orientation,
+        rows selects the cartons.
+        """
+        L, W, H = self.extents
+        O = self.O
+        return [(O[:, axis][rows], scale * L[rows]), (O[:, axis + 3][rows], scale * W[rows]), (O[:, axis + 6][rows], scale * H[rows])]
+
+    def vars(self, index):
+        """
+        Get the Gurobi variables at the given indices, as a flat list in the (row major) order of index.
+        """
+        variables = self.variables
+        return [variables[i] for i in np.ravel(index).tolist()]
+
+
+def build_formulation(model, cartons, containers, M = None, assign_sense = GRB.LESS_EQUAL,
+                      coordinate_type = GRB.INTEGER, names = True):
+    """
+    Add the variables and constraints shared by the container loading models: assignment, orientation,
+    fitting inside the containers, weight limits and the relative positioning (aik ... fik) of every pair of cartons.
+    Args:
+        model (gurobipy.Model): Model the formulation is added to.
+        cartons (list): Cartons with keys 'id', 'length', 'width', 'height' and 'weight'.
+        containers (list): Containers with keys 'id', 'length', 'width', 'height' and 'weight'.
+        M (float, optional): Constant used in every big-M constraint. By default the tightest valid constant of
+            each constraint is derived with BigM and the coordinates are bounded accordingly.
+        assign_sense (str, optional): GRB.LESS_EQUAL if a carton may be left out, GRB.EQUAL if it must be assigned.
+        coordinate_type (str, optional): Variable type of the carton coordinates. Defaults to GRB.INTEGER.
+        names (bool, optional): Name variables and constraints as the per-row models did. Naming is
+            a large part of the build time, skip it when the model is only solved. Defaults to True.
+    Returns:
+        Formulation: The formulation, with the variables indexed like the initial solutions of package_to_carton
+        in the dictionaries sij, xi, yi, zi, orientation and relative_position, and as index arrays in
+        one (variable fixed to 1), S (carton x container), P (carton x axis), O (carton x orientation)
+        and R (pair x relative position). pairs holds the carton indices (I, K) of the rows of R and big_m the BigM
+        used, for the constraints added on top of the formulation.
+    """
+    form = Formulation(model, names)
+    big_m = BigM(cartons, containers, M)
+    ids = [carton['id'] for carton in cartons]
+    container_ids = [container['id'] for container in containers]
+    n = len(cartons)
+    L = np.array([carton['length'] for carton in cartons], dtype=float)
+    W = np.array([carton['width'] for carton in cartons], dtype=float)
+    H = np.array([carton['height'] for carton in cartons], dtype=float)
+    weights = np.array([carton['weight'] for carton in cartons], dtype=float)
+    I, K = np.triu_indices(n, 1)
+    pair_ids = [f"{ids[i]}_{ids[k]}" for i, k in zip(I, K)]
+
+    # Variables
+    one = form.add_vars(1, GRB.BINARY, np.array(["1"]))
+    form.add_rows([(one, 1)], GRB.EQUAL, 1)
+    S = form.add_vars((n, len(containers)), GRB.BINARY, labels(names, "s_", ids, container_ids))
+    P = form.add_vars((n, 3), coordinate_type, np.array([[f"{axis}_{id}" for axis in AXES] for id in ids]) if names else None,
+                      ub=big_m.upper if M is None else GRB.INFINITY)
+    O = form.add_vars((n, 9), GRB.BINARY, np.array([[f"{orient}_{id}" for orient in ORIENTATIONS] for id in ids]) if names else None)
+    R = form.add_vars((len(I), 6), GRB.BINARY,
+                      np.array([[f"{rel}_{pair}" for rel in RELATIVE_POSITIONS] for pair in pair_ids]) if names else None)
+    form.add_rows([(P, 1)], GRB.GREATER_EQUAL, 0)
+    form.one, form.S, form.P, form.O, form.R, form.pairs, form.big_m = one, S, P, O, R, (I, K), big_m
+    form.extents = (L, W, H)
+
+    # 1. Assign each carton to at most (or exactly) one container
+    form.add_rows(sum_terms(S), assign_sense, 1, labels(names, "assign_", ids))
+
+    # 2. Orientation consistency: each dimension aligns with exactly one axis and each axis has one dimension
+    for dimension, columns in (("length", [0, 1, 2]), ("width", [3, 4, 5]), ("height", [6, 7, 8])):
+        form.add_rows(sum_terms(O[:, columns]), GRB.EQUAL, 1, labels(names, f"orient_{dimension}_", ids))
+    for a, axis in enumerate(AXES):
+        form.add_rows(sum_terms(O[:, [a, a + 3, a + 6]]), GRB.EQUAL, 1, labels(names, f"axis_{axis}_", ids))
+
+    # 3. Fit cartons within container dimensions: x_i + dim_i <= length_j + (1 - s_ij) * M
+    for a, axis in enumerate(AXES):
+        fit = big_m.fit(a)
+        form.add_rows([(P[:, a, None], 1)] + form.dims(a, np.s_[:, None]) + [(S, fit)], GRB.LESS_EQUAL, big_m.extents[None, :, a] + fit,
+                      labels(names, f"fit_{axis}_", ids, container_ids))
+
+    # 4. Weight limits, and two cartons in the same container must be separated along some axis
+    capacity = np.array([container['weight'] for container in containers], dtype=float)
+    form.add_rows(sum_terms(S.T, weights[None, :]), GRB.LESS_EQUAL, capacity, labels(names, "weight_limit_constr", container_ids))
+    form.add_rows(sum_terms(R[:, None, :]) + [(S[I, :], -1), (S[K, :], -1), (one, 1)], GRB.GREATER_EQUAL, 0,
+                  labels(names, "relative_sum_", pair_ids, container_ids))
+
+    # 5. Prevent overlapping of cartons with aik, bik, cik, dik, eik, fik: x_i + dim_i <= x_k + (1 - aik) * M
+    for a, axis in enumerate(AXES):
+        before, after = RELATIVE_POSITIONS[2 * a][0], RELATIVE_POSITIONS[2 * a + 1][0]
+        first, second = big_m.overlap(a, I), big_m.overlap(a, K)
+        form.add_rows([(P[I, a], 1)] + form.dims(a, I) + [(P[K, a], -1), (R[:, 2 * a], first)], GRB.LESS_EQUAL, first,
+                      labels(names, f"no_overlap_{axis}_{before}_", pair_ids))
+        form.add_rows([(P[K, a], 1)] + form.dims(a, K) + [(P[I, a], -1), (R[:, 2 * a + 1], second)], GRB.LESS_EQUAL, second,
+                      labels(names, f"no_overlap_{axis}_{after}_", pair_ids))
+
+    s, p, o, r = form.vars(S), form.vars(P), form.vars(O), form.vars(R)
+    form.sij = dict(zip(((id, container_id) for id in ids for container_id in container_ids), s))
+    form.xi = dict(zip(ids, p[0::3]))
+    form.yi = dict(zip(ids, p[1::3]))
+    form.zi = dict(zip(ids, p[2::3]))
+    form.orientation = {id: dict(zip(ORIENTATIONS, o[9 * i:9 * i + 9])) for i, id in enumerate(ids)}
+    form.relative_position = {(ids[i], ids[k]): dict(zip(RELATIVE_POSITIONS, r[6 * j:6 * j + 6]))
+                              for j, (i, k) in enumerate(zip(I.tolist(), K.tolist()))}
+    return form
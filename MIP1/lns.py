@@ -0,0 +1,222 @@
+import random
+import time
+from MIP1.model import all_swaps
+from MIP1.package_to_carton import get_specific_from_greedy
+from MIP1.carton_to_package import sol_to_package
+from utils.structs import CartonPackage, replaceAxis
+from utils.updatePackages import updatePackages, snapshotPackages, restorePackages
+
+# Large neighbourhood search around all_swaps. Every step destroys a neighbourhood, re-optimizes it with a short
+# all_swaps solve and keeps the result if the cost went down. all_swaps has no fixed obstacles, so a neighbourhood
+# is made of slabs: the part of a ULD beyond a cut along an axis that no package crosses. The packages of the slab
+# are solved in a container the size of the slab, together with a sample of the unassigned packages, and nothing
+# outside the slab can be hit.
+
+
+def guillotine_cuts(uld, axis):
+    """
+    Find the cuts of a ULD along an axis that no package crosses.
+    Args:
+        uld (ULD): The ULD to cut.
+        axis (int): The axis to cut along.
+    Returns:
+        list: (cut, slab) pairs, slab being the packages at or beyond the cut. Every other package ends before the cut.
+    """
+    packages = sorted(uld.packages, key=lambda package: package.position[axis])
+    cuts = []
+    end = 0
+    for i, package in enumerate(packages):
+        if package.position[axis] >= end:
+            cuts.append((end, packages[i:]))
+        end = max(end, package.position[axis] + package.getDimensions()[axis])
+    if end < [uld.length, uld.width, uld.height][axis]:
+        cuts.append((end, []))
+    return cuts
+
+
+class LargeNeighbourhoodSearch:
+    """
+    LNS driver re-optimizing slabs of the ULDs with all_swaps until a deadline.
+    Neighbourhoods are picked in turn from:
+        - slab: a random slab of a random ULD.
+        - pair: a random slab in each of two ULDs, so packages can move between them.
+        - worst: the slab whose packages bring the least cost per volume, among the slabs not tried since the last improvement.
+    Args:
+        packages (list): All Package objects.
+        ulds (list): All ULD objects.
+        ledger (CostLedger): Ledger of the packages and ULDs, used to accept or reject every step.
+        max_cartons (int, optional): Most packed packages in a neighbourhood. Defaults to 12.
+        pool_size (int, optional): Unassigned packages offered to every neighbourhood. Defaults to 8.
+        step_timeout (float, optional): Time limit of every all_swaps solve. Defaults to 5 seconds.
+        seed (int, optional): Seed of the neighbourhood choices. Defaults to None.
+    """
+
+    def __init__(self, packages, ulds, ledger, max_cartons = 12, pool_size = 8, step_timeout = 5, seed = None):
+        self.packages = packages
+        self.ulds = ulds
+        self.ledger = ledger
+        self.max_cartons = max_cartons
+        self.pool_size = pool_size
+        self.step_timeout = step_timeout
+        self.random = random.Random(seed)
+        self.tried = set()      # (uld id, axis, cut) of the slabs tried since the last improvement
+        self.solve_time = 0     # seconds spent in all_swaps by the last repair
+        self.trace = []         # (seconds since start, cost, neighbourhood) of every improvement
+
+    def slabs(self, uld, max_cartons):
+        """
+        List the slabs of a ULD with at most max_cartons packages.
+        Returns:
+            list: (uld, axis, cut, packages) tuples.
+        """
+        return [(uld, axis, cut, slab) for axis in range(3) for cut, slab in guillotine_cuts(uld, axis) if len(slab) <= max_cartons]
+
+    def slab(self):
+        slabs = self.slabs(self.random.choice(self.ulds), self.max_cartons)
+        return [self.random.choice(slabs)] if slabs else []
+
+    def pair(self):
+        if len(self.ulds) < 2:
+            return []
+        neighbourhood = []
+        for uld in self.random.sample(self.ulds, 2):
+            slabs = self.slabs(uld, self.max_cartons // 2)
+            if slabs:
+                neighbourhood.append(self.random.choice(slabs))
+        return neighbourhood
+
+    def worst(self):
+        def density(slab):
+            # cost per volume of the packages in the slab, an empty slab has nothing to lose
+            volume = sum(package.getVolume() for package in slab[3])
+            return sum(package.cost for package in slab[3]) / volume if volume else float('inf')
+        slabs = [slab for uld in self.ulds for slab in self.slabs(uld, self.max_cartons)]
+        untried = [slab for slab in slabs if (slab[0].id, slab[1], slab[2]) not in self.tried]
+        if slabs and not untried:
+            # every slab was tried since the last improvement, start over as the pools they were tried with are random
+            self.tried.clear()
+            untried = slabs
+        return [min(untried, key=density)] if untried else []
+
+    def pool(self):
+        """
+        Sample the unassigned packages offered to a neighbourhood, from the ones with the best cost density.
+        """
+        unassigned = [package for package in self.packages if str(package.ULD) == '-1']
+        unassigned.sort(key=lambda package: -(package.cost**2)/package.getVolume())
+        best = unassigned[:3*self.pool_size]
+        return self.random.sample(best, min(self.pool_size, len(best)))
+
+    def repair(self, neighbourhood, pool, timeout):
+        """
+        Re-optimize a neighbourhood with all_swaps.
+        Args:
+            neighbourhood (list): (uld, axis, cut, packages) slabs, in different ULDs.
+            pool (list): Unassigned packages offered to the slabs.
+            timeout (float): Time limit of the solve.
+        Returns:
+            list or None: Solution of all_swaps in ULD coordinates, None if no feasible solution was found.
+        """
+        self.solve_time = 0
+        copies = []
+        containers = []
+        offsets = {}
+        for uld, axis, cut, slab in neighbourhood:
+            dimensions = replaceAxis((uld.length, uld.width, uld.height), axis, [uld.length, uld.width, uld.height][axis] - cut)
+            containers.append({
+                "id": uld.id,
+                "length": dimensions[0],
+                "width": dimensions[1],
+                "height": dimensions[2],
+                "weight": uld.weightLeft() + sum(package.weight for package in slab)
+            })
+            offsets[uld.id] = (axis, cut)
+            for package in slab:
+                position = replaceAxis(package.position, axis, package.position[axis] - cut)
+                copies.append(CartonPackage(package.id, uld.id, position, package.getDimensions(), package.weight, package.cost, package.rotation))
+        for package in pool:
+            copies.append(CartonPackage(package.id, package.ULD, package.position, package.getDimensions(), package.weight, package.cost, package.rotation))
+        for copy, package in zip(copies, [package for slab in neighbourhood for package in slab[3]] + pool):
+            copy.priority = package.priority
+        if len(copies) < 2:
+            return None
+
+        init, cartons, _, _ = get_specific_from_greedy(list(offsets), packageArray=copies)
+        start = time.time()
+        solution = all_swaps(cartons=cartons, containers=containers, init=init, assigned_solutions=[], timeout=timeout)
+        self.solve_time = time.time() - start
+        if solution is None:
+            return None
+        for carton in solution:
+            if carton['container_id'] in offsets:
+                axis, cut = offsets[carton['container_id']]
+                position = [round(carton['x']), round(carton['y']), round(carton['z'])]
+                position[axis] += cut
+                carton['x'], carton['y'], carton['z'] = position
+            carton['DimX'], carton['DimY'], carton['DimZ'] = round(carton['DimX']), round(carton['DimY']), round(carton['DimZ'])
+        return solution
+
+    def step(self, neighbourhood, timeout):
+        """
+        Destroy and repair a neighbourhood, keeping the result only if the cost went down.
+        The repair goes through updatePackages, whose replacement and projection passes may move packages of any ULD,
+        so every package is snapshotted and a rejected step puts all of them back exactly.
+        Returns:
+            bool: If the cost went down.
+        Raises:
+            RuntimeError: If a rejected step did not leave the packing as it was.
+        """
+        pool = self.pool()
+        snapshot = snapshotPackages(self.packages, self.ulds)
+        before = self.ledger.cost
+        solution = self.repair(neighbourhood, pool, timeout)
+        if solution is None:
+            return False
+        updatePackages(self.packages, sol_to_package(solution), self.ulds)
+        self.settle_priority(neighbourhood)
+        if self.ledger.cost < before:
+            return True
+        restorePackages(snapshot, self.ulds)
+        if self.ledger.cost != before or snapshotPackages(self.packages, self.ulds) != snapshot:
+            raise RuntimeError("LNS rollback did not restore the packing")
+        return False
+
+    def settle_priority(self, neighbourhood):
+        # priority packages may have moved between the ULDs of the neighbourhood
+        for uld, _, _, _ in neighbourhood:
+            uld.isPriority = any(package.priority == "Priority" for package in uld.packages)
+
+    def run(self, timeout):
+        """
+        Run the search until the deadline.
+        Args:
+            timeout (float): Seconds to search for. A step is only started if its time limit fits before the deadline, together with
+                the overhead of the last step: the time it took beyond its time limit or outside all_swaps.
+        Returns:
+            list: Improvement trace, (seconds since start, cost, neighbourhood) for the start and every improvement.
+        """
+        start = time.time()
+        deadline = start + timeout
+        self.trace = [(0, self.ledger.cost, "start")]
+        kinds = [("slab", self.slab), ("pair", self.pair), ("worst", self.worst)]
+        turn = 0
+        overhead = 0
+        while deadline - time.time() >= self.step_timeout + overhead:
+            name, pick = kinds[turn % len(kinds)]
+            turn += 1
+            neighbourhood = pick()
+            if not neighbourhood:
+                # worst only comes out empty if no ULD has a small enough slab
+                if name == "worst": break
+                continue
+            self.tried.update((uld.id, axis, cut) for uld, axis, cut, _ in neighbourhood)
+            started = time.time()
+            improved = self.step(neighbourhood, self.step_timeout)
+            # the time limit covers neither the model building of all_swaps nor the package updates around it
+            elapsed = time.time() - started
+            overhead = max(0, elapsed - self.step_timeout, elapsed - self.solve_time)
+            if improved:
+                self.tried.clear()
+                self.trace.append((time.time() - start, self.ledger.cost, name))
+                print("LNS {0} improved the cost to {1} after {2:.1f}s".format(name, self.ledger.cost, time.time() - start))
+        return self.trace
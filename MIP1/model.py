@@ -1,8 +1,11 @@
+import time
+import numpy as np
 import gurobipy as gp
 from gurobipy import GRB
 # from utils.cartons import cartons
 # from utils.containers import containers
 from MIP1.package_to_carton import get_from_greedy, get_specific_from_greedy
+from MIP1.formulation import build_formulation, labels, sum_terms
 
 
 # containers = containers_specific(specific_container)
@@ -33,15 +36,16 @@ def cut_short_rem_adding(cartons, length):
     print("rem ")
     print(ass)
     return ass, rem
-def all_swaps(cartons, containers, init, assigned_solutions, timeout = 600):
+def all_swaps(cartons, containers, init, assigned_solutions, timeout = 600, names = True, threads = 0, deadline = None):
     print(containers)
     print(len(cartons))
     # print(len(assigned_solutions))
     model = gp.Model("3D_Container_Loading_with_Relative_Positioning")
     # model.Params.LogToConsole = 1  # Show optimization logs
     model.setParam('TimeLimit', timeout)  # Set time limit to 10 minutes
+    model.setParam('Threads', threads)  # 0 lets Gurobi decide
     # Define constants
-    M = 100000  # Large constant for "big-M" constraints
+    M = None  # Constant for "big-M" constraints, None derives the tightest one of each constraint (see BigM)
     cartons, rem = cut_short_rem(cartons, 40)
     rem_to_sol = []
     for obj in rem:
@@ -60,139 +64,12 @@ def all_swaps(cartons, containers, init, assigned_solutions, timeout = 600):
     assigned_solutions += rem_to_sol
     additional_cost = 0 + sum(carton['cost'] for carton in rem)
     cartons.sort(key=lambda x: x['id'])
-    # Decision variables
-    sij = {}  # Binary: carton i assigned to container j
-    xi, yi, zi = {}, {}, {}  # Continuous: coordinates of FLB corner of carton i
-    nj = {}
-    orientation = {}  # Binary variables for carton orientation (rotation matrix)
-    relative_position = {}  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
-    # Add variables
-    x = model.addVar(vtype=GRB.BINARY, name="1")
-    model.addConstr(x == 1)
-    # extra constraints redundant
-    # for container in containers:
-    #     nj[container['id']] = model.addVar(vtype=GRB.INTEGER, name=f"n_{container['id']}")
-    print(containers)
-    for carton in cartons:
-        for container in containers:
-            sij[(carton['id'], container['id'])] = model.addVar(vtype=GRB.BINARY,
-                                                                name=f"s_{carton['id']}_{container['id']}")
-        xi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"x_{carton['id']}")
-        yi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"y_{carton['id']}")
-        zi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"z_{carton['id']}")
-        model.addConstr(xi[carton['id']] >= 0)
-        model.addConstr(yi[carton['id']] >= 0)
-        model.addConstr(zi[carton['id']] >= 0)
-        # Add 9 binary orientation variables for each carton
-        orientation[carton['id']] = {
-            "lx": model.addVar(vtype=GRB.BINARY, name=f"lx_{carton['id']}"),
-            "ly": model.addVar(vtype=GRB.BINARY, name=f"ly_{carton['id']}"),
-            "lz": model.addVar(vtype=GRB.BINARY, name=f"lz_{carton['id']}"),
-            "wx": model.addVar(vtype=GRB.BINARY, name=f"wx_{carton['id']}"),
-            "wy": model.addVar(vtype=GRB.BINARY, name=f"wy_{carton['id']}"),
-            "wz": model.addVar(vtype=GRB.BINARY, name=f"wz_{carton['id']}"),
-            "hx": model.addVar(vtype=GRB.BINARY, name=f"hx_{carton['id']}"),
-            "hy": model.addVar(vtype=GRB.BINARY, name=f"hy_{carton['id']}"),
-            "hz": model.addVar(vtype=GRB.BINARY, name=f"hz_{carton['id']}"),
-        }
-
-    # Relative positioning variables: aik, bik, cik, dik, eik, fik
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            relative_position[(carton_i['id'], carton_k['id'])] = {
-                "aik": model.addVar(vtype=GRB.BINARY, name=f"aik_{carton_i['id']}_{carton_k['id']}"),
-                "bik": model.addVar(vtype=GRB.BINARY, name=f"bik_{carton_i['id']}_{carton_k['id']}"),
-                "cik": model.addVar(vtype=GRB.BINARY, name=f"cik_{carton_i['id']}_{carton_k['id']}"),
-                "dik": model.addVar(vtype=GRB.BINARY, name=f"dik_{carton_i['id']}_{carton_k['id']}"),
-                "eik": model.addVar(vtype=GRB.BINARY, name=f"eik_{carton_i['id']}_{carton_k['id']}"),
-                "fik": model.addVar(vtype=GRB.BINARY, name=f"fik_{carton_i['id']}_{carton_k['id']}"),
-            }
-
-    # Constraints
-    # 1. Assign each carton to exactly one container
-    for carton in cartons:
-        model.addConstr(sum(sij[(carton['id'], container['id'])] for container in containers) <= 1,
-                        name=f"assign_{carton['id']}")
-
-    # 2. Orientation consistency: Each dimension aligns with exactly one axis
-    for carton in cartons:
-        orients = orientation[carton['id']]
-        model.addConstr(orients["lx"] + orients["ly"] + orients["lz"] == 1, name=f"orient_length_{carton['id']}")
-        model.addConstr(orients["wx"] + orients["wy"] + orients["wz"] == 1, name=f"orient_width_{carton['id']}")
-        model.addConstr(orients["hx"] + orients["hy"] + orients["hz"] == 1, name=f"orient_height_{carton['id']}")
-
-        # Each axis has one dimension
-        model.addConstr(orients["lx"] + orients["wx"] + orients["hx"] == 1, name=f"axis_x_{carton['id']}")
-        model.addConstr(orients["ly"] + orients["wy"] + orients["hy"] == 1, name=f"axis_y_{carton['id']}")
-        model.addConstr(orients["lz"] + orients["wz"] + orients["hz"] == 1, name=f"axis_z_{carton['id']}")
-
-    # 3. Fit cartons within container dimensions
-    for carton in cartons:
-        for container in containers:
-            orients = orientation[carton['id']]
-            model.addConstr(xi[carton['id']] + carton['length'] * orients["lx"] +
-                            carton['width'] * orients["wx"] +
-                            carton['height'] * orients["hx"] <= container['length'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_x_{carton['id']}_{container['id']}")
-
-            model.addConstr(yi[carton['id']] + carton['length'] * orients["ly"] +
-                            carton['width'] * orients["wy"] +
-                            carton['height'] * orients["hy"] <= container['width'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_y_{carton['id']}_{container['id']}")
-
-            model.addConstr(zi[carton['id']] + carton['length'] * orients["lz"] +
-                            carton['width'] * orients["wz"] +
-                            carton['height'] * orients["hz"] <= container['height'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_z_{carton['id']}_{container['id']}")
-
-    # 4. Prevent overlapping of cartons with aik, bik, cik, dik, eik, fik
-    for container in containers:
-        # weight constraints
-        model.addConstr(
-            sum((sij[(carton['id'], container['id'])] * carton['weight']) for carton in cartons) <= container['weight'],
-            name=f"weight_limit_constr{container['id']}")
-        for i in range(len(cartons)):
-            for k in range(i + 1, len(cartons)):
-                carton_i = cartons[i]
-                carton_k = cartons[k]
-                rel = relative_position[(carton_i['id'], carton_k['id'])]
-                model.addConstr((rel["aik"] + rel["bik"] + rel["cik"] + rel["dik"] + rel["eik"] + rel["fik"] >=
-                                 sij[(carton_i['id'], container['id'])] + sij[(carton_k['id'], container['id'])] - x),
-                                name=f"relative_sum_{carton_i['id']}_{carton_k['id']}_{container['id']}")
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            rel = relative_position[(carton_i['id'], carton_k['id'])]
-            model.addConstr(
-                xi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lx"] + carton_i['width'] *
-                orientation[carton_i['id']]["wx"] + carton_i['height'] * orientation[carton_i['id']]["hx"] <= xi[
-                    carton_k['id']] + (1 - rel["aik"]) * M, name=f"no_overlap_x_a_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                xi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lx"] + carton_k['width'] *
-                orientation[carton_k['id']]["wx"] + carton_k['height'] * orientation[carton_k['id']]["hx"] <= xi[
-                    carton_i['id']] + (1 - rel["bik"]) * M, name=f"no_overlap_x_b_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["ly"] + carton_i['width'] *
-                orientation[carton_i['id']]["wy"] + carton_i['height'] * orientation[carton_i['id']]["hy"] <= yi[
-                    carton_k['id']] + (1 - rel["cik"]) * M, name=f"no_overlap_y_c_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["ly"] + carton_k['width'] *
-                orientation[carton_k['id']]["wy"] + carton_k['height'] * orientation[carton_k['id']]["hy"] <= yi[
-                    carton_i['id']] + (1 - rel["dik"]) * M, name=f"no_overlap_y_d_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lz"] + carton_i['width'] *
-                orientation[carton_i['id']]["wz"] + carton_i['height'] * orientation[carton_i['id']]["hz"] <= zi[
-                    carton_k['id']] + (1 - rel["eik"]) * M, name=f"no_overlap_z_e_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lz"] + carton_k['width'] *
-                orientation[carton_k['id']]["wz"] + carton_k['height'] * orientation[carton_k['id']]["hz"] <= zi[
-                    carton_i['id']] + (1 - rel["fik"]) * M, name=f"no_overlap_z_f_{carton_i['id']}_{carton_k['id']}")
+    # Decision variables and the shared constraints: assignment, orientation, fit, weight and no overlap
+    form = build_formulation(model, cartons, containers, M, names=names)
+    sij = form.sij  # Binary: carton i assigned to container j
+    xi, yi, zi = form.xi, form.yi, form.zi  # Coordinates of FLB corner of carton i
+    orientation = form.orientation  # Binary variables for carton orientation (rotation matrix)
+    relative_position = form.relative_position  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
 
     # add MIP here
     initcost = 0
@@ -242,6 +119,9 @@ def all_swaps(cartons, containers, init, assigned_solutions, timeout = 600):
         (1 - (sum(sij[(carton['id'], container['id'])] for container in containers))) * carton['cost'] for carton in
         cartons) + additional_cost
     model.setObjective(penalty, GRB.MINIMIZE)
+    if deadline is not None:
+        # a wall clock deadline also covers the time spent building the model
+        model.setParam('TimeLimit', min(timeout, max(0, deadline - time.time())))
     model.optimize()
     # Extract the solution
     if model.status == GRB.OPTIMAL or model.status == GRB.TIME_LIMIT or model.status == GRB.INTERRUPTED or model.status == GRB.SUBOPTIMAL:
@@ -297,14 +177,14 @@ def all_swaps(cartons, containers, init, assigned_solutions, timeout = 600):
     else:
         print("No feasible solution found.")
 
-def multi_containers_extra(cartons, containers, assigned_solutions, length, timeout = 60):
+def multi_containers_extra(cartons, containers, assigned_solutions, length, timeout = 60, names = True):
     print("MODEL STARTED")
     model = gp.Model("3D_Container_Loading_with_Relative_Positioning")
     model.setParam('TimeLimit', timeout)    # Stop after 120 seconds
     # model.Params.LogToConsole = 1  # Show optimization logs
     # model.setParam('TimeLimit', timeout)  # Set time limit to 10 minutes
     # Define constants
-    M = 100000  # Large constant for "big-M" constraints
+    M = None  # Constant for "big-M" constraints, None derives the tightest one of each constraint (see BigM)
     additional_cost = 0
     cartons, rem = cut_short_rem_adding(cartons, length)
     rem_to_sol = []
@@ -321,426 +201,130 @@ def multi_containers_extra(cartons, containers, assigned_solutions, length, time
         }
         rem_to_sol.append(cart)
 
-    assigned_solutions += rem_to_sol
-    cartons.sort(key=lambda x: x['id'])
-    for carton in rem:
-        if carton['container_id'] == "-1" or carton['container_id'] == -1:
-            additional_cost += carton['cost']
-
-    new_cost = additional_cost
-
-    # Decision variables
-    sij = {}  # Binary: carton i assigned to container j
-    xi, yi, zi = {}, {}, {}  # Continuous: coordinates of FLB corner of carton i
-    nj = {}
-    orientation = {}  # Binary variables for carton orientation (rotation matrix)
-    relative_position = {}  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
-    # Add variables
-    x = model.addVar(vtype=GRB.BINARY, name="1")
-    model.addConstr(x == 1)
-    # extra constraints redundant
-    # for container in containers:
-    #     nj[container['id']] = model.addVar(vtype=GRB.INTEGER, name=f"n_{container['id']}")
-    for carton in cartons:
-        for container in containers:
-            sij[(carton['id'], container['id'])] = model.addVar(vtype=GRB.BINARY,
-                                                                name=f"s_{carton['id']}_{container['id']}")
-        xi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"x_{carton['id']}")
-        yi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"y_{carton['id']}")
-        zi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"z_{carton['id']}")
-        model.addConstr(xi[carton['id']] >= 0)
-        model.addConstr(yi[carton['id']] >= 0)
-        model.addConstr(zi[carton['id']] >= 0)
-        # Add 9 binary orientation variables for each carton
-        orientation[carton['id']] = {
-            "lx": model.addVar(vtype=GRB.BINARY, name=f"lx_{carton['id']}"),
-            "ly": model.addVar(vtype=GRB.BINARY, name=f"ly_{carton['id']}"),
-            "lz": model.addVar(vtype=GRB.BINARY, name=f"lz_{carton['id']}"),
-            "wx": model.addVar(vtype=GRB.BINARY, name=f"wx_{carton['id']}"),
-            "wy": model.addVar(vtype=GRB.BINARY, name=f"wy_{carton['id']}"),
-            "wz": model.addVar(vtype=GRB.BINARY, name=f"wz_{carton['id']}"),
-            "hx": model.addVar(vtype=GRB.BINARY, name=f"hx_{carton['id']}"),
-            "hy": model.addVar(vtype=GRB.BINARY, name=f"hy_{carton['id']}"),
-            "hz": model.addVar(vtype=GRB.BINARY, name=f"hz_{carton['id']}"),
-        }
-
-    # Relative positioning variables: aik, bik, cik, dik, eik, fik
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            relative_position[(carton_i['id'], carton_k['id'])] = {
-                "aik": model.addVar(vtype=GRB.BINARY, name=f"aik_{carton_i['id']}_{carton_k['id']}"),
-                "bik": model.addVar(vtype=GRB.BINARY, name=f"bik_{carton_i['id']}_{carton_k['id']}"),
-                "cik": model.addVar(vtype=GRB.BINARY, name=f"cik_{carton_i['id']}_{carton_k['id']}"),
-                "dik": model.addVar(vtype=GRB.BINARY, name=f"dik_{carton_i['id']}_{carton_k['id']}"),
-                "eik": model.addVar(vtype=GRB.BINARY, name=f"eik_{carton_i['id']}_{carton_k['id']}"),
-                "fik": model.addVar(vtype=GRB.BINARY, name=f"fik_{carton_i['id']}_{carton_k['id']}"),
-            }
-
-    # Constraints
-    # 1. Assign each carton to exactly one container
-    for carton in cartons:
-        model.addConstr(sum(sij[(carton['id'], container['id'])] for container in containers) == 1,
-                        name=f"assign_{carton['id']}")
-
-    # 2. Orientation consistency: Each dimension aligns with exactly one axis
-    for carton in cartons:
-        orients = orientation[carton['id']]
-        model.addConstr(orients["lx"] + orients["ly"] + orients["lz"] == 1, name=f"orient_length_{carton['id']}")
-        model.addConstr(orients["wx"] + orients["wy"] + orients["wz"] == 1, name=f"orient_width_{carton['id']}")
-        model.addConstr(orients["hx"] + orients["hy"] + orients["hz"] == 1, name=f"orient_height_{carton['id']}")
-
-        # Each axis has one dimension
-        model.addConstr(orients["lx"] + orients["wx"] + orients["hx"] == 1, name=f"axis_x_{carton['id']}")
-        model.addConstr(orients["ly"] + orients["wy"] + orients["hy"] == 1, name=f"axis_y_{carton['id']}")
-        model.addConstr(orients["lz"] + orients["wz"] + orients["hz"] == 1, name=f"axis_z_{carton['id']}")
-
-    # 3. Fit cartons within container dimensions
-    for carton in cartons:
-        for container in containers:
-            orients = orientation[carton['id']]
-            model.addConstr(xi[carton['id']] + carton['length'] * orients["lx"] +
-                            carton['width'] * orients["wx"] +
-                            carton['height'] * orients["hx"] <= container['length'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_x_{carton['id']}_{container['id']}")
-
-            model.addConstr(yi[carton['id']] + carton['length'] * orients["ly"] +
-                            carton['width'] * orients["wy"] +
-                            carton['height'] * orients["hy"] <= container['width'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_y_{carton['id']}_{container['id']}")
-
-            model.addConstr(zi[carton['id']] + carton['length'] * orients["lz"] +
-                            carton['width'] * orients["wz"] +
-                            carton['height'] * orients["hz"] <= container['height'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_z_{carton['id']}_{container['id']}")
-
-    # 4. Prevent overlapping of cartons with aik, bik, cik, dik, eik, fik
-    for container in containers:
-        # weight constraints
-        model.addConstr(
-            sum((sij[(carton['id'], container['id'])] * carton['weight']) for carton in cartons) <= container['weight'],
-            name=f"weight_limit_constr{container['id']}")
-        for i in range(len(cartons)):
-            for k in range(i + 1, len(cartons)):
-                carton_i = cartons[i]
-                carton_k = cartons[k]
-                rel = relative_position[(carton_i['id'], carton_k['id'])]
-                model.addConstr((rel["aik"] + rel["bik"] + rel["cik"] + rel["dik"] + rel["eik"] + rel["fik"] >=
-                                 sij[(carton_i['id'], container['id'])] + sij[(carton_k['id'], container['id'])] - x),
-                                name=f"relative_sum_{carton_i['id']}_{carton_k['id']}_{container['id']}")
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            rel = relative_position[(carton_i['id'], carton_k['id'])]
-            model.addConstr(
-                xi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lx"] + carton_i['width'] *
-                orientation[carton_i['id']]["wx"] + carton_i['height'] * orientation[carton_i['id']]["hx"] <= xi[
-                    carton_k['id']] + (1 - rel["aik"]) * M, name=f"no_overlap_x_a_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                xi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lx"] + carton_k['width'] *
-                orientation[carton_k['id']]["wx"] + carton_k['height'] * orientation[carton_k['id']]["hx"] <= xi[
-                    carton_i['id']] + (1 - rel["bik"]) * M, name=f"no_overlap_x_b_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["ly"] + carton_i['width'] *
-                orientation[carton_i['id']]["wy"] + carton_i['height'] * orientation[carton_i['id']]["hy"] <= yi[
-                    carton_k['id']] + (1 - rel["cik"]) * M, name=f"no_overlap_y_c_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["ly"] + carton_k['width'] *
-                orientation[carton_k['id']]["wy"] + carton_k['height'] * orientation[carton_k['id']]["hy"] <= yi[
-                    carton_i['id']] + (1 - rel["dik"]) * M, name=f"no_overlap_y_d_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lz"] + carton_i['width'] *
-                orientation[carton_i['id']]["wz"] + carton_i['height'] * orientation[carton_i['id']]["hz"] <= zi[
-                    carton_k['id']] + (1 - rel["eik"]) * M, name=f"no_overlap_z_e_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lz"] + carton_k['width'] *
-                orientation[carton_k['id']]["wz"] + carton_k['height'] * orientation[carton_k['id']]["hz"] <= zi[
-                    carton_i['id']] + (1 - rel["fik"]) * M, name=f"no_overlap_z_f_{carton_i['id']}_{carton_k['id']}")
-    model.optimize()
-    # Extract the solution
-    if model.status == GRB.OPTIMAL or model.status == GRB.SUBOPTIMAL:
-        print("Optimal solution found. Checking constraints:")
-        model.printQuality()
-        solution = []
-        print("succesfully added new cost = ", new_cost)
-        for container in containers:
-            for carton in cartons:
-                if sij[(carton['id'], container['id'])].X > 0.5:
-                    solution.append({
-                        "carton_id": carton['id'],
-                        "container_id": container['id'],
-                        "x": xi[carton['id']].X,
-                        "y": yi[carton['id']].X,
-                        "z": zi[carton['id']].X,
-                        "DimX": carton['length'] * orientation[carton['id']]["lx"].X + carton['width'] *
-                                orientation[carton['id']]["wx"].X + carton['height'] * orientation[carton['id']][
-                                    "hx"].X,
-                        "DimY": carton['length'] * orientation[carton['id']]["ly"].X + carton['width'] *
-                                orientation[carton['id']]["wy"].X + carton['height'] * orientation[carton['id']][
-                                    "hy"].X,
-                        "DimZ": carton['length'] * orientation[carton['id']]["lz"].X + carton['width'] *
-                                orientation[carton['id']]["wz"].X + carton['height'] * orientation[carton['id']][
-                                    "hz"].X,
-                        "weight": carton['weight'],
-                        "cost": carton['cost']
-                    })
-                    # Print aik and bik variables
-        for sol in assigned_solutions:
-            solution.append(sol)
-        for carton in cartons:
-            if sum(sij[(carton['id'], container['id'])].X for container in containers) == 0:
-                solution.append({
-                    "carton_id": carton['id'],
-                    "container_id": -1,
-                    "x": -1,
-                    "y": -1,
-                    "z": -1,
-                    "DimX": carton['length'] * orientation[carton['id']]["lx"].X + carton['width'] *
-                            orientation[carton['id']]["wx"].X + carton['height'] * orientation[carton['id']][
-                                "hx"].X,
-                    "DimY": carton['length'] * orientation[carton['id']]["ly"].X + carton['width'] *
-                            orientation[carton['id']]["wy"].X + carton['height'] * orientation[carton['id']][
-                                "hy"].X,
-                    "DimZ": carton['length'] * orientation[carton['id']]["lz"].X + carton['width'] *
-                            orientation[carton['id']]["wz"].X + carton['height'] * orientation[carton['id']][
-                                "hz"].X,
-                    "weight": carton['weight'],
-                    "cost": carton['cost']
-                })
-        print("printing solution ", solution)
-        return solution
-    else:
-        print("No feasible solution found. checking next")
-def with_stability(cartons, containers, init, assigned_solutions, stability_constraints):
-    # print(containers)
-    # print(len(cartons))
-    # cartons = cartons[:2]
-    # print(cartons)
-    # print(len(assigned_solutions))
-    model = gp.Model("3D_Container_Loading_with_Relative_Positioning")
-    # model.Params.LogToConsole = 1  # Show optimization logs
-    # model.setParam('TimeLimit', timeout)  # Set time limit to 10 minutes
-    # Define constants
-    M = 100000  # Large constant for "big-M" constraints
-    f = 1
-    # Decision variables
-    sij = {}  # Binary: carton i assigned to container j
-    xi, yi, zi = {}, {}, {}  # Continuous: coordinates of FLB corner of carton i
-    orientation = {}  # Binary variables for carton orientation (rotation matrix)
-    relative_position = {}  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
-    wij = {}
-    wi = {}
-    Pcij = {}
-    # Add variables
-    x = model.addVar(vtype=GRB.BINARY, name="1")
-    model.addConstr(x == 1)
-    # extra constraints redundant
-    # for container in containers:
-    #     nj[container['id']] = model.addVar(vtype=GRB.INTEGER, name=f"n_{container['id']}")
-    print(containers)
-    for container in containers:
-        for carton1 in cartons:
-            for carton2 in cartons:
-                if carton1['id'] == carton2['id']:
-                    continue
-                Pcij[(carton1['id'], carton2['id'], container['id'])] = model.addVar(vtype=GRB.BINARY,
-                                                                                     name=f"Pcij_{carton1['id']}_{carton2['id']}_{container['id']}")
-    for carton in cartons:
-        wi[carton['id']] = model.addVar(vtype=GRB.BINARY, name=f"weight_{carton['id']}")
-        for container in containers:
-            sij[(carton['id'], container['id'])] = model.addVar(vtype=GRB.BINARY,
-                                                                name=f"s_{carton['id']}_{container['id']}")
-        xi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"x_{carton['id']}")
-        yi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"y_{carton['id']}")
-        zi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"z_{carton['id']}")
-        model.addConstr(xi[carton['id']] >= 0)
-        model.addConstr(yi[carton['id']] >= 0)
-        model.addConstr(zi[carton['id']] >= 0)
-        # Add 9 binary orientation variables for each carton
-        orientation[carton['id']] = {
-            "lx": model.addVar(vtype=GRB.BINARY, name=f"lx_{carton['id']}"),
-            "ly": model.addVar(vtype=GRB.BINARY, name=f"ly_{carton['id']}"),
-            "lz": model.addVar(vtype=GRB.BINARY, name=f"lz_{carton['id']}"),
-            "wx": model.addVar(vtype=GRB.BINARY, name=f"wx_{carton['id']}"),
-            "wy": model.addVar(vtype=GRB.BINARY, name=f"wy_{carton['id']}"),
-            "wz": model.addVar(vtype=GRB.BINARY, name=f"wz_{carton['id']}"),
-            "hx": model.addVar(vtype=GRB.BINARY, name=f"hx_{carton['id']}"),
-            "hy": model.addVar(vtype=GRB.BINARY, name=f"hy_{carton['id']}"),
-            "hz": model.addVar(vtype=GRB.BINARY, name=f"hz_{carton['id']}"),
-        }
-
-    # Relative positioning variables: aik, bik, cik, dik, eik, fik
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            relative_position[(carton_i['id'], carton_k['id'])] = {
-                "aik": model.addVar(vtype=GRB.BINARY, name=f"aik_{carton_i['id']}_{carton_k['id']}"),
-                "bik": model.addVar(vtype=GRB.BINARY, name=f"bik_{carton_i['id']}_{carton_k['id']}"),
-                "cik": model.addVar(vtype=GRB.BINARY, name=f"cik_{carton_i['id']}_{carton_k['id']}"),
-                "dik": model.addVar(vtype=GRB.BINARY, name=f"dik_{carton_i['id']}_{carton_k['id']}"),
-                "eik": model.addVar(vtype=GRB.BINARY, name=f"eik_{carton_i['id']}_{carton_k['id']}"),
-                "fik": model.addVar(vtype=GRB.BINARY, name=f"fik_{carton_i['id']}_{carton_k['id']}"),
-            }
-
-    # stability :
-    for carton1 in cartons:
-        for carton2 in cartons:
-            if carton1['id'] == carton2['id']:
-                continue
-            wij[(carton1['id'], carton2['id'])] = model.addVar(vtype=GRB.BINARY,
-                                                               name=f"wij_{carton1['id']}_{carton2['id']}")
-    for carton in cartons:
-        model.addConstr(zi[carton['id']] <= (1 - wi[carton['id']]) * M, name=f"doesnt_go_underground{carton['id']}")
-        model.addConstr(wi[carton['id']] + sum(
-            wij[(carton['id'], carton2['id'])] for carton2 in cartons if carton['id'] != carton2['id']) + (
-                                    1 - sum(sij[(carton['id'], container['id'])] for container in containers)) * M >= 1,
-                        name=f"platform_{carton['id']}")
-    for carton1 in cartons:
-        for carton2 in cartons:
-            if carton1['id'] == carton2['id']:
-                continue
-            orients1 = orientation[carton1['id']]
-            orients2 = orientation[carton2['id']]
-            model.addConstr(zi[carton1['id']] <= zi[carton2['id']] + carton2['length'] * orients2["lz"] +
-                            carton2['width'] * orients2["wz"] +
-                            carton2['height'] * orients2["hz"] + (1 - wij[(carton1['id'], carton2['id'])]) * M,
-                            name=f"stability_z_{carton1['id']}_{carton2['id']}")
-            model.addConstr(
-                zi[carton1['id']] + (1 - wij[(carton1['id'], carton2['id'])]) * M >= zi[carton2['id']] + zi[
-                    carton2['id']] + carton2['length'] * orients2["lz"] +
-                carton2['width'] * orients2["wz"] +
-                carton2['height'] * orients2["hz"],
-                name=f"stability_z_{carton1['id']}_{carton2['id']}")
-            model.addConstr(
-                xi[carton1['id']] + carton1['length'] * orients1["lx"] + carton1['width'] * orients1["wx"] + carton1[
-                    'height'] * orients1["hx"]
-                <= xi[carton2['id']] + carton2['length'] * orients2["lx"] + carton2['width'] * orients2["wx"] + carton2[
-                    'height'] * orients2["hx"] +
-                f * (carton1['length'] * orients1["lx"] + carton1['width'] * orients1["wx"] + carton1['height'] *
-                     orients1["hx"]) +
-                M * (1 - wij[(carton1['id'], carton2['id'])]), name=f"stability_x_1{carton1['id']}_{carton2['id']}")
-            model.addConstr(xi[carton1['id']] <= xi[carton2['id']] +
-                            f * (carton1['length'] * orients1["lx"] + carton1['width'] * orients1["wx"] + carton1['height'] * orients1["hx"]) +
-                            M * (1 - wij[(carton1['id'], carton2['id'])]),
-                            name=f"stability_x_2{carton1['id']}_{carton2['id']}")
-            model.addConstr(
-                yi[carton1['id']] + carton1['length'] * orients1["ly"] + carton1['width'] * orients1["wy"] + carton1[
-                    'height'] * orients1["hy"]
-                <= yi[carton2['id']] + carton2['length'] * orients2["ly"] + carton2['width'] * orients2["wy"] + carton2[
-                    'height'] * orients2["hy"] +
-                f * (carton1['length'] * orients1["ly"] + carton1['width'] * orients1["wy"] + carton1['height'] *
-                     orients1["hy"]) +
-                M * (1 - wij[(carton1['id'], carton2['id'])]), name=f"stability_y_1{carton1['id']}_{carton2['id']}")
-            model.addConstr(yi[carton1['id']] <= yi[carton2['id']] +
-                            f * (carton1['length'] * orients1["ly"] + carton1['width'] * orients1["wy"] + carton1[
-                'height'] * orients1["hy"]) +
-                            M * (1 - wij[(carton1['id'], carton2['id'])]),
-                            name=f"stability_y_2{carton1['id']}_{carton2['id']}")
-            model.addConstr(sum(Pcij[(carton1['id'], carton2['id'], container['id'])] for container in containers) >=
-                            wij[(carton1['id'], carton2['id'])], name=f"stability_sum_{carton1['id']}_{carton2['id']}")
-    for container in containers:
-        for carton1 in cartons:
-            for carton2 in cartons:
-                if carton1['id'] == carton2['id']:
-                    continue
-                model.addConstr(
-                    2 * Pcij[(carton1['id'], carton2['id'], container['id'])] <= sij[(carton1['id'], container['id'])] +
-                    sij[(carton2['id'], container['id'])],
-                    name=f"stability_{carton1['id']}_{carton2['id']}_{container['id']}")
-                model.addConstr(
-                    2 * Pcij[(carton1['id'], carton2['id'], container['id'])] >= sij[carton1['id'], container['id']] +
-                    sij[(carton2['id'], container['id'])],
-                    name=f"stability_{carton1['id']}_{carton2['id']}_{container['id']}")
-
-    # Constraints
-    # 1. Assign each carton to exactly one container
-    for carton in cartons:
-        model.addConstr(sum(sij[(carton['id'], container['id'])] for container in containers) <= 1,
-                        name=f"assign_{carton['id']}")
-
-    # 2. Orientation consistency: Each dimension aligns with exactly one axis
-    for carton in cartons:
-        orients = orientation[carton['id']]
-        model.addConstr(orients["lx"] + orients["ly"] + orients["lz"] == 1, name=f"orient_length_{carton['id']}")
-        model.addConstr(orients["wx"] + orients["wy"] + orients["wz"] == 1, name=f"orient_width_{carton['id']}")
-        model.addConstr(orients["hx"] + orients["hy"] + orients["hz"] == 1, name=f"orient_height_{carton['id']}")
-
-        # Each axis has one dimension
-        model.addConstr(orients["lx"] + orients["wx"] + orients["hx"] == 1, name=f"axis_x_{carton['id']}")
-        model.addConstr(orients["ly"] + orients["wy"] + orients["hy"] == 1, name=f"axis_y_{carton['id']}")
-        model.addConstr(orients["lz"] + orients["wz"] + orients["hz"] == 1, name=f"axis_z_{carton['id']}")
-
-    # 3. Fit cartons within container dimensions
-    for carton in cartons:
-        for container in containers:
-            orients = orientation[carton['id']]
-            model.addConstr(xi[carton['id']] + carton['length'] * orients["lx"] +
-                            carton['width'] * orients["wx"] +
-                            carton['height'] * orients["hx"] <= container['length'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_x_{carton['id']}_{container['id']}")
-
-            model.addConstr(yi[carton['id']] + carton['length'] * orients["ly"] +
-                            carton['width'] * orients["wy"] +
-                            carton['height'] * orients["hy"] <= container['width'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_y_{carton['id']}_{container['id']}")
-
-            model.addConstr(zi[carton['id']] + carton['length'] * orients["lz"] +
-                            carton['width'] * orients["wz"] +
-                            carton['height'] * orients["hz"] <= container['height'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_z_{carton['id']}_{container['id']}")
+    assigned_solutions += rem_to_sol
+    cartons.sort(key=lambda x: x['id'])
+    for carton in rem:
+        if carton['container_id'] == "-1" or carton['container_id'] == -1:
+            additional_cost += carton['cost']
 
-    # 4. Prevent overlapping of cartons with aik, bik, cik, dik, eik, fik
-    for container in containers:
-        # weight constraints
-        model.addConstr(
-            sum((sij[(carton['id'], container['id'])] * carton['weight']) for carton in cartons) <= container['weight'],
-            name=f"weight_limit_constr{container['id']}")
-        for i in range(len(cartons)):
-            for k in range(i + 1, len(cartons)):
-                carton_i = cartons[i]
-                carton_k = cartons[k]
-                rel = relative_position[(carton_i['id'], carton_k['id'])]
-                model.addConstr((rel["aik"] + rel["bik"] + rel["cik"] + rel["dik"] + rel["eik"] + rel["fik"] >=
-                                 sij[(carton_i['id'], container['id'])] + sij[(carton_k['id'], container['id'])] - x),
-                                name=f"relative_sum_{carton_i['id']}_{carton_k['id']}_{container['id']}")
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            rel = relative_position[(carton_i['id'], carton_k['id'])]
-            model.addConstr(
-                xi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lx"] + carton_i['width'] *
-                orientation[carton_i['id']]["wx"] + carton_i['height'] * orientation[carton_i['id']]["hx"] <= xi[
-                    carton_k['id']] + (1 - rel["aik"]) * M, name=f"no_overlap_x_a_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                xi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lx"] + carton_k['width'] *
-                orientation[carton_k['id']]["wx"] + carton_k['height'] * orientation[carton_k['id']]["hx"] <= xi[
-                    carton_i['id']] + (1 - rel["bik"]) * M, name=f"no_overlap_x_b_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["ly"] + carton_i['width'] *
-                orientation[carton_i['id']]["wy"] + carton_i['height'] * orientation[carton_i['id']]["hy"] <= yi[
-                    carton_k['id']] + (1 - rel["cik"]) * M, name=f"no_overlap_y_c_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["ly"] + carton_k['width'] *
-                orientation[carton_k['id']]["wy"] + carton_k['height'] * orientation[carton_k['id']]["hy"] <= yi[
-                    carton_i['id']] + (1 - rel["dik"]) * M, name=f"no_overlap_y_d_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lz"] + carton_i['width'] *
-                orientation[carton_i['id']]["wz"] + carton_i['height'] * orientation[carton_i['id']]["hz"] <= zi[
-                    carton_k['id']] + (1 - rel["eik"]) * M, name=f"no_overlap_z_e_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lz"] + carton_k['width'] *
-                orientation[carton_k['id']]["wz"] + carton_k['height'] * orientation[carton_k['id']]["hz"] <= zi[
-                    carton_i['id']] + (1 - rel["fik"]) * M, name=f"no_overlap_z_f_{carton_i['id']}_{carton_k['id']}")
+    new_cost = additional_cost
+
+    # Decision variables and the shared constraints: assignment, orientation, fit, weight and no overlap
+    form = build_formulation(model, cartons, containers, M, assign_sense=GRB.EQUAL, names=names)
+    sij = form.sij  # Binary: carton i assigned to container j
+    xi, yi, zi = form.xi, form.yi, form.zi  # Coordinates of FLB corner of carton i
+    orientation = form.orientation  # Binary variables for carton orientation (rotation matrix)
+    relative_position = form.relative_position  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
+    model.optimize()
+    # Extract the solution
+    if model.status == GRB.OPTIMAL or model.status == GRB.SUBOPTIMAL:
+        print("Optimal solution found. Checking constraints:")
+        model.printQuality()
+        solution = []
+        print("succesfully added new cost = ", new_cost)
+        for container in containers:
+            for carton in cartons:
+                if sij[(carton['id'], container['id'])].X > 0.5:
+                    solution.append({
+                        "carton_id": carton['id'],
+                        "container_id": container['id'],
+                        "x": xi[carton['id']].X,
+                        "y": yi[carton['id']].X,
+                        "z": zi[carton['id']].X,
+                        "DimX": carton['length'] * orientation[carton['id']]["lx"].X + carton['width'] *
+                                orientation[carton['id']]["wx"].X + carton['height'] * orientation[carton['id']][
+                                    "hx"].X,
+                        "DimY": carton['length'] * orientation[carton['id']]["ly"].X + carton['width'] *
+                                orientation[carton['id']]["wy"].X + carton['height'] * orientation[carton['id']][
+                                    "hy"].X,
+                        "DimZ": carton['length'] * orientation[carton['id']]["lz"].X + carton['width'] *
+                                orientation[carton['id']]["wz"].X + carton['height'] * orientation[carton['id']][
+                                    "hz"].X,
+                        "weight": carton['weight'],
+                        "cost": carton['cost']
+                    })
+                    # Print aik and bik variables
+        for sol in assigned_solutions:
+            solution.append(sol)
+        for carton in cartons:
+            if sum(sij[(carton['id'], container['id'])].X for container in containers) == 0:
+                solution.append({
+                    "carton_id": carton['id'],
+                    "container_id": -1,
+                    "x": -1,
+                    "y": -1,
+                    "z": -1,
+                    "DimX": carton['length'] * orientation[carton['id']]["lx"].X + carton['width'] *
+                            orientation[carton['id']]["wx"].X + carton['height'] * orientation[carton['id']][
+                                "hx"].X,
+                    "DimY": carton['length'] * orientation[carton['id']]["ly"].X + carton['width'] *
+                            orientation[carton['id']]["wy"].X + carton['height'] * orientation[carton['id']][
+                                "hy"].X,
+                    "DimZ": carton['length'] * orientation[carton['id']]["lz"].X + carton['width'] *
+                            orientation[carton['id']]["wz"].X + carton['height'] * orientation[carton['id']][
+                                "hz"].X,
+                    "weight": carton['weight'],
+                    "cost": carton['cost']
+                })
+        print("printing solution ", solution)
+        return solution
+    else:
+        print("No feasible solution found. checking next")
+def with_stability(cartons, containers, init, assigned_solutions, stability_constraints, names = True):
+    # print(containers)
+    # print(len(cartons))
+    # cartons = cartons[:2]
+    # print(cartons)
+    # print(len(assigned_solutions))
+    model = gp.Model("3D_Container_Loading_with_Relative_Positioning")
+    # model.Params.LogToConsole = 1  # Show optimization logs
+    # model.setParam('TimeLimit', timeout)  # Set time limit to 10 minutes
+    # Define constants
+    M = None  # Constant for "big-M" constraints, None derives the tightest one of each constraint (see BigM)
+    f = 1
+    # Decision variables and the shared constraints: assignment, orientation, fit, weight and no overlap
+    form = build_formulation(model, cartons, containers, M, names=names)
+    sij = form.sij  # Binary: carton i assigned to container j
+    xi, yi, zi = form.xi, form.yi, form.zi  # Coordinates of FLB corner of carton i
+    orientation = form.orientation  # Binary variables for carton orientation (rotation matrix)
+    relative_position = form.relative_position  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
+    S, P, big_m = form.S, form.P, form.big_m
+
+    # stability : ordered pairs (carton1, carton2) of different cartons, grouped by carton1
+    n = len(cartons)
+    ids = [carton['id'] for carton in cartons]
+    container_ids = [container['id'] for container in containers]
+    A, B = np.nonzero(~np.eye(n, dtype=bool))
+    ordered_ids = [f"{ids[a]}_{ids[b]}" for a, b in zip(A, B)]
+    Pcij = form.add_vars((len(A), len(containers)), GRB.BINARY, labels(names, "Pcij_", ordered_ids, container_ids))
+    wi = form.add_vars(n, GRB.BINARY, labels(names, "weight_", ids))
+    wij = form.add_vars(len(A), GRB.BINARY, labels(names, "wij_", ordered_ids))
+
+    # z_i <= (1 - wi) * M, and a placed carton lies on the ground or on another carton
+    upper, shortest, longest = big_m.upper, big_m.shortest, big_m.longest
+    ground = big_m.value(upper[:, 2])
+    form.add_rows([(P[:, 2], 1), (wi, ground)], GRB.LESS_EQUAL, ground, labels(names, "doesnt_go_underground", ids))
+    platform = big_m.value(np.ones(n))
+    form.add_rows([(wi, 1)] + sum_terms(wij.reshape(n, max(n - 1, 0))) + sum_terms(S, -platform[:, None]), GRB.GREATER_EQUAL,
+                  1 - platform, labels(names, "platform_", ids))
+    # if carton1 rests on carton2: z1 == z2 + dimz2 and both faces overlap along x and y
+    below = big_m.value(np.maximum(upper[A, 2] - shortest[B], 0))
+    form.add_rows([(P[A, 2], 1), (P[B, 2], -1)] + form.dims(2, B, -1) + [(wij, below)], GRB.LESS_EQUAL, below,
+                  labels(names, "stability_z_", ordered_ids))
+    above = big_m.value(2 * upper[B, 2] + longest[B])
+    form.add_rows([(P[A, 2], 1), (P[B, 2], -2)] + form.dims(2, B, -1) + [(wij, -above)], GRB.GREATER_EQUAL, -above,
+                  labels(names, "stability_z_", ordered_ids))
+    for a, axis in ((0, "x"), (1, "y")):
+        end = big_m.value(np.maximum(upper[A, a] + np.maximum((1 - f) * longest[A], (1 - f) * shortest[A]) - shortest[B], 0))
+        form.add_rows([(P[A, a], 1), (P[B, a], -1)] + form.dims(a, A, 1 - f) + form.dims(a, B, -1) + [(wij, end)], GRB.LESS_EQUAL, end,
+                      labels(names, f"stability_{axis}_1", ordered_ids))
+        start = big_m.value(np.maximum(upper[A, a] + np.maximum(-f * longest[A], -f * shortest[A]), 0))
+        form.add_rows([(P[A, a], 1), (P[B, a], -1)] + form.dims(a, A, -f) + [(wij, start)], GRB.LESS_EQUAL, start,
+                      labels(names, f"stability_{axis}_2", ordered_ids))
+    form.add_rows(sum_terms(Pcij) + [(wij, -1)], GRB.GREATER_EQUAL, 0, labels(names, "stability_sum_", ordered_ids))
+    # Pcij is 1 iff both cartons are in container j
+    form.add_rows([(Pcij, 2), (S[A, :], -1), (S[B, :], -1)], GRB.LESS_EQUAL, 0, labels(names, "stability_", ordered_ids, container_ids))
+    form.add_rows([(Pcij, 2), (S[A, :], -1), (S[B, :], -1)], GRB.GREATER_EQUAL, 0, labels(names, "stability_", ordered_ids, container_ids))
 
     # add MIP here
     initcost = 0
@@ -1092,7 +676,7 @@ def add_extra(cartons, containers, init, assigned_solutions):
     else:
         print("No feasible solution found.")
 
-def complete_LPP(cartons, containers, init):
+def complete_LPP(cartons, containers, init, names = True):
     # Create a model
     model = gp.Model("3D_Container_Loading_with_Relative_Positioning")
     # model.Params.LogToConsole = 1  # Show optimization logs
@@ -1101,153 +685,24 @@ def complete_LPP(cartons, containers, init):
 
     # redefine termination criteria
     # Define constants
-    M = 100000  # Large constant for "big-M" constraints
-
-    # Decision variables
-    sij = {}  # Binary: carton i assigned to container j
-    xi, yi, zi = {}, {}, {}  # Continuous: coordinates of FLB corner of carton i
-    pj = {}
-    orientation = {}  # Binary variables for carton orientation (rotation matrix)
-    relative_position = {}  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
-    # Add variables
-    x = model.addVar(vtype=GRB.BINARY, name="1")
-    model.addConstr(x == 1)
-    # extra constraints redundant
-    # for container in containers:
-    #     nj[container['id']] = model.addVar(vtype=GRB.INTEGER, name=f"n_{container['id']}")
+    M = None  # Constant for "big-M" constraints, None derives the tightest one of each constraint (see BigM)
+
+    # Decision variables and the shared constraints: assignment, orientation, fit, weight and no overlap
+    form = build_formulation(model, cartons, containers, M, coordinate_type=GRB.CONTINUOUS, names=names)
+    sij = form.sij  # Binary: carton i assigned to container j
+    xi, yi, zi = form.xi, form.yi, form.zi  # Coordinates of FLB corner of carton i
+    orientation = form.orientation  # Binary variables for carton orientation (rotation matrix)
+    relative_position = form.relative_position  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
+    container_ids = [container['id'] for container in containers]
     for container in containers:
         print(container['id'])
-        pj[container['id']] = model.addVar(vtype=GRB.BINARY, name=f"contains_priority_{container['id']}")
-    for carton in cartons:
-        for container in containers:
-            sij[(carton['id'], container['id'])] = model.addVar(vtype=GRB.BINARY,
-                                                                name=f"s_{carton['id']}_{container['id']}")
-        xi[carton['id']] = model.addVar(vtype=GRB.CONTINUOUS, name=f"x_{carton['id']}")
-        yi[carton['id']] = model.addVar(vtype=GRB.CONTINUOUS, name=f"y_{carton['id']}")
-        zi[carton['id']] = model.addVar(vtype=GRB.CONTINUOUS, name=f"z_{carton['id']}")
-        model.addConstr(xi[carton['id']] >= 0)
-        model.addConstr(yi[carton['id']] >= 0)
-        model.addConstr(zi[carton['id']] >= 0)
-        # Add 9 binary orientation variables for each carton
-        orientation[carton['id']] = {
-            "lx": model.addVar(vtype=GRB.BINARY, name=f"lx_{carton['id']}"),
-            "ly": model.addVar(vtype=GRB.BINARY, name=f"ly_{carton['id']}"),
-            "lz": model.addVar(vtype=GRB.BINARY, name=f"lz_{carton['id']}"),
-            "wx": model.addVar(vtype=GRB.BINARY, name=f"wx_{carton['id']}"),
-            "wy": model.addVar(vtype=GRB.BINARY, name=f"wy_{carton['id']}"),
-            "wz": model.addVar(vtype=GRB.BINARY, name=f"wz_{carton['id']}"),
-            "hx": model.addVar(vtype=GRB.BINARY, name=f"hx_{carton['id']}"),
-            "hy": model.addVar(vtype=GRB.BINARY, name=f"hy_{carton['id']}"),
-            "hz": model.addVar(vtype=GRB.BINARY, name=f"hz_{carton['id']}"),
-        }
-
-    # Relative positioning variables: aik, bik, cik, dik, eik, fik
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            relative_position[(carton_i['id'], carton_k['id'])] = {
-                "aik": model.addVar(vtype=GRB.BINARY, name=f"aik_{carton_i['id']}_{carton_k['id']}"),
-                "bik": model.addVar(vtype=GRB.BINARY, name=f"bik_{carton_i['id']}_{carton_k['id']}"),
-                "cik": model.addVar(vtype=GRB.BINARY, name=f"cik_{carton_i['id']}_{carton_k['id']}"),
-                "dik": model.addVar(vtype=GRB.BINARY, name=f"dik_{carton_i['id']}_{carton_k['id']}"),
-                "eik": model.addVar(vtype=GRB.BINARY, name=f"eik_{carton_i['id']}_{carton_k['id']}"),
-                "fik": model.addVar(vtype=GRB.BINARY, name=f"fik_{carton_i['id']}_{carton_k['id']}"),
-            }
-
-    # Constraints
-    # 1. Assign each carton to exactly one container
-    for carton in cartons:
-        model.addConstr(sum(sij[(carton['id'], container['id'])] for container in containers) <= 1,
-                        name=f"assign_{carton['id']}")
-    # redundant constraints
-    # for container in containers:
-    #     model.addConstr(sum(sij[(carton['id'], container['id'])] for carton in cartons) <= M*nj[container['id']],
-    #  name=f"assign_{container['id']}")
-
-    # check for priority packages spread :
-    for container in containers:
-        for carton in cartons:
-            model.addConstr(pj[container['id']] >= (sij[(carton['id'], container['id'])] * carton['priority']),
-                            name=f"priority_{carton['id']}_{container['id']}")
-
-    # 2. Orientation consistency: Each dimension aligns with exactly one axis
-    for carton in cartons:
-        orients = orientation[carton['id']]
-        model.addConstr(orients["lx"] + orients["ly"] + orients["lz"] == 1, name=f"orient_length_{carton['id']}")
-        model.addConstr(orients["wx"] + orients["wy"] + orients["wz"] == 1, name=f"orient_width_{carton['id']}")
-        model.addConstr(orients["hx"] + orients["hy"] + orients["hz"] == 1, name=f"orient_height_{carton['id']}")
-
-        # Each axis has one dimension
-        model.addConstr(orients["lx"] + orients["wx"] + orients["hx"] == 1, name=f"axis_x_{carton['id']}")
-        model.addConstr(orients["ly"] + orients["wy"] + orients["hy"] == 1, name=f"axis_y_{carton['id']}")
-        model.addConstr(orients["lz"] + orients["wz"] + orients["hz"] == 1, name=f"axis_z_{carton['id']}")
-
-    # 3. Fit cartons within container dimensions
-    for carton in cartons:
-        for container in containers:
-            orients = orientation[carton['id']]
-            model.addConstr(xi[carton['id']] + carton['length'] * orients["lx"] +
-                            carton['width'] * orients["wx"] +
-                            carton['height'] * orients["hx"] <= container['length'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_x_{carton['id']}_{container['id']}")
-
-            model.addConstr(yi[carton['id']] + carton['length'] * orients["ly"] +
-                            carton['width'] * orients["wy"] +
-                            carton['height'] * orients["hy"] <= container['width'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_y_{carton['id']}_{container['id']}")
-
-            model.addConstr(zi[carton['id']] + carton['length'] * orients["lz"] +
-                            carton['width'] * orients["wz"] +
-                            carton['height'] * orients["hz"] <= container['height'] + (
-                                    1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_z_{carton['id']}_{container['id']}")
+    contains_priority = form.add_vars(len(containers), GRB.BINARY, labels(names, "contains_priority_", container_ids))
+    pj = dict(zip(container_ids, form.vars(contains_priority)))
 
-    # 4. Prevent overlapping of cartons with aik, bik, cik, dik, eik, fik
-    for container in containers:
-        # weight constraints
-        model.addConstr(
-            sum((sij[(carton['id'], container['id'])] * carton['weight']) for carton in cartons) <= container['weight'],
-            name=f"weight_limit_constr{container['id']}")
-        for i in range(len(cartons)):
-            for k in range(i + 1, len(cartons)):
-                carton_i = cartons[i]
-                carton_k = cartons[k]
-                rel = relative_position[(carton_i['id'], carton_k['id'])]
-                model.addConstr((rel["aik"] + rel["bik"] + rel["cik"] + rel["dik"] + rel["eik"] + rel["fik"] >=
-                                 sij[(carton_i['id'], container['id'])] + sij[(carton_k['id'], container['id'])] - x),
-                                name=f"relative_sum_{carton_i['id']}_{carton_k['id']}_{container['id']}")
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            rel = relative_position[(carton_i['id'], carton_k['id'])]
-            model.addConstr(
-                xi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lx"] + carton_i['width'] *
-                orientation[carton_i['id']]["wx"] + carton_i['height'] * orientation[carton_i['id']]["hx"] <= xi[
-                    carton_k['id']] + (1 - rel["aik"]) * M, name=f"no_overlap_x_a_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                xi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lx"] + carton_k['width'] *
-                orientation[carton_k['id']]["wx"] + carton_k['height'] * orientation[carton_k['id']]["hx"] <= xi[
-                    carton_i['id']] + (1 - rel["bik"]) * M, name=f"no_overlap_x_b_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["ly"] + carton_i['width'] *
-                orientation[carton_i['id']]["wy"] + carton_i['height'] * orientation[carton_i['id']]["hy"] <= yi[
-                    carton_k['id']] + (1 - rel["cik"]) * M, name=f"no_overlap_y_c_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["ly"] + carton_k['width'] *
-                orientation[carton_k['id']]["wy"] + carton_k['height'] * orientation[carton_k['id']]["hy"] <= yi[
-                    carton_i['id']] + (1 - rel["dik"]) * M, name=f"no_overlap_y_d_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lz"] + carton_i['width'] *
-                orientation[carton_i['id']]["wz"] + carton_i['height'] * orientation[carton_i['id']]["hz"] <= zi[
-                    carton_k['id']] + (1 - rel["eik"]) * M, name=f"no_overlap_z_e_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lz"] + carton_k['width'] *
-                orientation[carton_k['id']]["wz"] + carton_k['height'] * orientation[carton_k['id']]["hz"] <= zi[
-                    carton_i['id']] + (1 - rel["fik"]) * M, name=f"no_overlap_z_f_{carton_i['id']}_{carton_k['id']}")
+    # check for priority packages spread : pj >= sij * priority
+    priority = np.array([carton['priority'] for carton in cartons], dtype=float)
+    form.add_rows([(contains_priority[None, :], 1), (form.S, -priority[:, None])], GRB.GREATER_EQUAL, 0,
+                  labels(names, "priority_", [carton['id'] for carton in cartons], container_ids))
     temp = 0
     # init = get_from_greedy()
     #MIP
@@ -0,0 +1,96 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from MIP1.model import all_swaps
+from MIP1.package_to_carton import get_specific_from_greedy
+from utils.containers import containers_specific
+
+# Parallel all_swaps refinement for run_all. The models of different ULDs only share the pool of unassigned
+# packages, so the pool is split between the ULDs first and every ULD is then solved at once in its own process,
+# each until the same wall clock deadline. The solutions cover disjoint packages and are merged by concatenating them.
+
+
+def auction(packages, ulds, length = 40):
+    """
+    Split the unassigned packages between ULDs.
+    The packages are auctioned in order of cost density, the order cut_short_rem keeps them in, and every package
+    goes to the ULD with the most free volume left after the packages it already won. Free volume may go negative,
+    all_swaps can swap packed cartons out for the ones won, so the only hard limits are the weight limit and length.
+    Args:
+        packages (list): Package objects, the unassigned ones have ULD '-1'.
+        ulds (list): ULD objects taking part in the auction.
+        length (int, optional): Most packages a ULD takes, all_swaps keeps no more unassigned cartons than this.
+    Returns:
+        dict: ULD id -> list of the unassigned packages it was given. Packages no ULD can take are left out.
+    """
+    pool = [package for package in packages if str(package.ULD) == '-1']
+    pool.sort(key=lambda package: -(package.cost**2)/package.getVolume())
+    volumeLeft = {uld.id: uld.getVolume() - sum(package.getVolume() for package in uld.packages) for uld in ulds}
+    weightLimit = {uld.id: uld.weight_limit for uld in ulds}
+    shares = {uld.id: [] for uld in ulds}
+    for package in pool:
+        bids = [uld_id for uld_id in shares if len(shares[uld_id]) < length and weightLimit[uld_id] >= package.weight]
+        if not bids:
+            continue
+        winner = max(bids, key=lambda uld_id: volumeLeft[uld_id])
+        shares[winner].append(package)
+        volumeLeft[winner] -= package.getVolume()
+    return shares
+
+
+def refine(cartons, containers, init, deadline, threads):
+    """
+    Solve the all_swaps model of one ULD in a worker.
+    Args:
+        cartons (list): Cartons of the ULD and of its share of the unassigned packages.
+        containers (list): The ULD as a container.
+        init (dict): Start solution from get_specific_from_greedy.
+        deadline (float): Wall clock time the solve has to end by, the start-up of the worker and the model
+            building are taken out of its time limit.
+        threads (int): Gurobi threads of the solve.
+    Returns:
+        list or None: Solution of all_swaps over the given cartons only, None if no feasible solution was found.
+    """
+    timeout = max(0, deadline - time.time())
+    return all_swaps(cartons=cartons, containers=containers, init=init, assigned_solutions=[], timeout=timeout, threads=threads, deadline=deadline)
+
+
+def refine_parallel(packages, ulds, timeout, workers = 0, threads = 0):
+    """
+    Run all_swaps on several ULDs in parallel, after splitting the unassigned packages between them with auction.
+    Args:
+        packages (list): All Package objects.
+        ulds (list): ULD objects to refine.
+        timeout (float): Seconds from the call until every solve has to end, all of them run at the same time.
+        workers (int, optional): Number of worker processes. Defaults to one per ULD.
+        threads (int, optional): Gurobi threads of every solve. Defaults to the cores shared evenly between the workers.
+    Returns:
+        list: Merged solution, in the format of all_swaps, covering the packages of the ULDs and the unassigned
+        packages given to them. ULDs without a feasible solution or whose solve failed are left out. Pass it
+        through sol_to_package to updatePackages.
+    """
+    deadline = time.time() + timeout
+    if not ulds:
+        return []
+    workers = workers or len(ulds)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    shares = auction(packages, ulds)
+    jobs = []
+    for uld in ulds:
+        # only the ULD and its share are handed over, get_specific_from_greedy makes cartons of all of them
+        subset = uld.packages + shares[uld.id]
+        if len(subset) < 2:
+            continue
+        init, cartons, _, _ = get_specific_from_greedy([uld.id], packageArray=subset)
+        jobs.append((cartons, containers_specific(uld.id), init))
+
+    solution = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [(containers[0]['id'], pool.submit(refine, cartons, containers, init, deadline, threads)) for cartons, containers, init in jobs]
+        for uld_id, future in futures:
+            # a failed solve only loses its own ULD, its packages stay where they are
+            try:
+                solution += future.result() or []
+            except Exception as error:
+                print("all_swaps of ULD {0} failed: {1}".format(uld_id, error))
+    return solution
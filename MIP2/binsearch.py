@@ -1,7 +1,11 @@
 import csv
 from math import floor
 import time
-from MIP2.model_binsearch import container_loading_with_relative_constraints as solver
+from gurobipy import GRB
+from MIP2.model_binsearch import ContainerModel
+from MIP2.prescreen import prescreen
+from MIP2.parallel_probe import ContainerProber
+from MIP2.feasibility_cache import FeasibilityCache
 from MIP1.carton_to_package import sol_to_package
 from MIP1.package_to_carton import make_solution
 
@@ -42,7 +46,8 @@ def package_csv_to_sol(filename):
 file_path = 'output.csv'
 # get_containers()
 
-def binsearch(file_path = None, packageArray = None, uldArray = None, timeout = 30, time_split_1 = 6000):
+# workers > 1 probes the containers of every carton in parallel with that many processes, threads Gurobi threads each
+def binsearch(file_path = None, packageArray = None, uldArray = None, timeout = 30, time_split_1 = 6000, workers = 0, threads = 1):
 
     def get_more_packages(file_path = None, packageArray = None, uldArray = None):
 
@@ -160,38 +165,97 @@ def binsearch(file_path = None, packageArray = None, uldArray = None, timeout =
         prev = [-1] * len(new_cartons)
         ind=0
         counter=0
+        screened = {True: 0, False: 0, None: 0}   # pre-screen outcomes, None is left to the MIP
+        models = {}     # container id -> its ContainerModel, built on the first MIP call and kept across cartons
+        screens = {}    # container id -> its ContainerScreen for the pre-screen, kept until the placement of the container changes
+        prober = ContainerProber(workers, threads) if workers > 1 else None
+        cache = FeasibilityCache()      # cartons known not to fit, answers repeated MIP calls without solving
+
+        def commit(i, container, obtained_solution):
+            # the carton fits in the container, add it to the container_lists and update the free space of the container
+            nonlocal x, cost_reduction
+            x+=1
+            extra_fitted_cartons.append(i['id'])                                    # keep track of new cartons added
+            container_lists[container['id']].append(i)  
+            cost_reduction += i['cost']                                             # update cost reduction
+            container['free_space'] -= i['length'] * i['width'] * i['height']       # update free space
+            print()
+            print()
+            print("------------------")
+            print("------------------")
+            print(i["id"])
+            print(container['id'])
+            print("------------------")
+            print("------------------")
+            print()
+            print()
+            print("###")
+            print("###")
+            current_container = obtained_solution[0]['container_id']
+            container_wise_solution[current_container] = obtained_solution
+
         for i in new_cartons:                   # iterate over all cartons to try to fit them to containers
             containers=sorted(containers,key=lambda x: x['free_space'])         # sort containers based on free space
-            for container in containers:                    
+            if prober is not None:
+                # probe every container ranked up to the first one the pre-screen places the carton in at once,
+                # the best ranked feasible container is committed
                 starttime = time.time()
-                container_assigned[container['id']].append(i)                   # temporarily add carton to container 
-                obtained_solution = solver(container_assigned[container['id']], [container], timeout)
+                candidates = []
+                for container in containers:
+                    fits, entry = prescreen(i, container, container_assigned[container['id']], container_wise_solution[container['id']], screens)
+                    if fits is None and cache.rejects(container['id'], container_assigned[container['id']], i):
+                        fits = False
+                    screened[fits] += 1
+                    if fits is False:
+                        continue
+                    candidates.append((container, entry))
+                    if fits:
+                        break
+                undecided = [container for container, entry in candidates if entry is None]
+                best, obtained_solution, statuses = prober.probe([(container, container_assigned[container['id']] + [i]) for container in undecided], timeout)
+                for container, status in zip(undecided, statuses):
+                    # only proven infeasibility is cached, a time-out says nothing about the larger cartons
+                    if status == GRB.INFEASIBLE:
+                        cache.record(container['id'], container_assigned[container['id']], i, False)
+                if best is not None:
+                    container = undecided[best]
+                elif candidates and candidates[-1][1] is not None:
+                    container, entry = candidates[-1]
+                    obtained_solution = container_wise_solution[container['id']] + [entry]
                 if obtained_solution:
-                    # if the carton fits in the container, add it to the container_lists and update the free space of the container
-                    x+=1
-                    extra_fitted_cartons.append(i['id'])                                    # keep track of new cartons added
-                    container_lists[container['id']].append(i)  
-                    cost_reduction += i['cost']                                             # update cost reduction
-                    container['free_space'] -= i['length'] * i['width'] * i['height']       # update free space
-                    print()
-                    print()
-                    print("------------------")
-                    print("------------------")
-                    print(i["id"])
-                    print(container['id'])
-                    print("------------------")
-                    print("------------------")
-                    print()
-                    print()
-                    print("###")
-                    print("###")
-                    current_container = obtained_solution[0]['container_id']
-                    container_wise_solution[current_container] = obtained_solution
-                    break
-                else:                # infeasible solution is found, remove added from container
-                    container_assigned[container['id']].pop()
-
+                    container_assigned[container['id']].append(i)
+                    commit(i, container, obtained_solution)
                 counter+=(time.time()-starttime)
+            else:
+                for container in containers:
+                    starttime = time.time()
+                    # cheap checks first, the MIP is only built for the cartons they cannot decide
+                    fits, entry = prescreen(i, container, container_assigned[container['id']], container_wise_solution[container['id']], screens)
+                    if fits is None and cache.rejects(container['id'], container_assigned[container['id']], i):
+                        fits = False
+                    screened[fits] += 1
+                    if fits is False:
+                        counter+=(time.time()-starttime)
+                        continue
+                    model = models.get(container['id'])
+                    if fits is None and model is None:
+                        model = models[container['id']] = ContainerModel(container, container_assigned[container['id']], container_wise_solution[container['id']])
+                    container_assigned[container['id']].append(i)                   # temporarily add carton to container 
+                    if fits:
+                        obtained_solution = container_wise_solution[container['id']] + [entry]
+                        if model is not None:
+                            model.add(i, entry)
+                    else:
+                        obtained_solution, status = model.try_add(i, timeout)       # rolled back by the model if infeasible
+                        if status == GRB.INFEASIBLE:
+                            cache.record(container['id'], container_assigned[container['id']][:-1], i, False)
+                    if obtained_solution:
+                        commit(i, container, obtained_solution)
+                        break
+                    else:                # infeasible solution is found, remove added from container
+                        container_assigned[container['id']].pop()
+
+                    counter+=(time.time()-starttime)
 
             prev[ind]=x
             if((ind>=3 and prev[ind]==prev[ind-3]) or time_split_1<=counter):
@@ -200,6 +264,9 @@ def binsearch(file_path = None, packageArray = None, uldArray = None, timeout =
 
         for container_id, packages in container_lists.items():
             print(f"Container {container_id} contains packages: {packages}")
+        print(f"Pre-screen: {screened[False]} rejected ({cache.hits} by the feasibility cache), {screened[True]} placed without the MIP, {screened[None]} MIP calls")
+        if prober is not None:
+            prober.close()
 
 
         print(cost_reduction)
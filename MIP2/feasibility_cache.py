@@ -0,0 +1,59 @@
+# Memo of the feasibility MIP outcomes of binsearch. The MIP may move every carton of a container, so its answer
+# only depends on the container and the multiset of carton shapes and weights in it, not on their placement.
+# A carton proven not to fit also rules out every carton at least as large in each sorted dimension and as heavy.
+# Only GRB.INFEASIBLE outcomes are recorded, a solve that timed out proves nothing about the carton or larger ones.
+
+
+def shape(carton):
+    """
+    Get the canonical shape of a carton, its sorted dimensions followed by its weight.
+    """
+    return tuple(sorted((carton['length'], carton['width'], carton['height']))) + (carton['weight'],)
+
+
+class FeasibilityCache:
+    """
+    Cache of the cartons proven not to fit in a container, keyed on a canonical signature of the container contents.
+    """
+
+    def __init__(self):
+        self.failed = {}    # (container id, sorted shapes of its cartons) -> shapes of the cartons that did not fit
+        self.hits = 0
+
+    def signature(self, container_id, cartons):
+        """
+        Get the canonical signature of a container holding the given cartons.
+        """
+        return container_id, tuple(sorted(shape(carton) for carton in cartons))
+
+    def rejects(self, container_id, cartons, carton):
+        """
+        Check if a carton is known not to fit in a container holding the given cartons, because it or a carton it
+        dominates in every sorted dimension and weight was proven not to fit before.
+        Returns:
+            bool: True if the carton does not need to be solved.
+        """
+        failed = self.failed.get(self.signature(container_id, cartons))
+        if not failed:
+            return False
+        candidate = shape(carton)
+        if any(all(f <= c for f, c in zip(other, candidate)) for other in failed):
+            self.hits += 1
+            return True
+        return False
+
+    def record(self, container_id, cartons, carton, fits):
+        """
+        Record the outcome of the feasibility MIP of a carton in a container holding the given cartons.
+        Only the cartons that did not fit are kept, a carton that fits changes the contents of the container.
+        fits must only be False if the solve proved the carton infeasible, not if it timed out.
+        """
+        if fits:
+            return
+        failed = self.failed.setdefault(self.signature(container_id, cartons), [])
+        candidate = shape(carton)
+        # keep only the smallest failed shapes, the ones they dominate are implied
+        if any(all(f <= c for f, c in zip(other, candidate)) for other in failed):
+            return
+        failed[:] = [other for other in failed if not all(c <= f for c, f in zip(candidate, other))]
+        failed.append(candidate)
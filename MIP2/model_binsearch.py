@@ -1,7 +1,9 @@
+from itertools import permutations
 import gurobipy as gp
 from gurobipy import GRB, quicksum
+from MIP1.formulation import AXES, ORIENTATIONS, RELATIVE_POSITIONS, BigM, build_formulation, labels, sum_terms
 
-def container_loading_with_relative_constraints(cartons, containers,timeout = 30):
+def container_loading_with_relative_constraints(cartons, containers,timeout = 30, names = True, threads = 0, callback = None, return_status = False):
     """
     Solve the 3D container loading problem using mixed integer programming,
     incorporating relative positioning constraints (aik, bik, cik, dik, eik, fik).
@@ -11,9 +13,14 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
              Each carton is represented as {'id': int, 'length': float, 'width': float, 'height': float, 'weight': float}.
     containers: list of dictionaries with container dimensions.
              Each container is represented as {'id': int, 'length': float, 'width': float, 'height': float}.
+    names: name the variables and constraints, skipping it makes the model faster to build.
+    threads: number of threads of the solve, 0 lets Gurobi decide.
+    callback: Gurobi callback passed to optimize, e.g. to terminate the solve early.
+    return_status: also return the Gurobi status of the solve, to tell an infeasible model from a time-out.
 
     Returns:
     Optimal packing solution with carton placements, orientations, and container usage.
+    With return_status, a (solution, status) pair.
     """
 
     # Create a model
@@ -21,171 +28,24 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
     model.Params.LogToConsole = 0 # Show optimization logs
 
     # Define constants
-    M = 100000  # Large constant for "big-M" constraints
-
-    # Decision variables
-    sij = {}  # Binary: carton i assigned to container j
-    xi, yi, zi = {}, {}, {}  # Continuous: coordinates of FLB corner of carton i
-    nj = {}
-    orientation = {}  # Binary variables for carton orientation (rotation matrix)
-    relative_position = {}  # Binary variables for relative positions (aik, bik, cik, dik, eik, fik)
-    # Add variables
-    x = model.addVar(vtype=GRB.BINARY, name="1")
-    model.addConstr(x == 1)
-
-    for container in containers:        #nj variable is 1 if j-th container is used
-        nj[container['id']] = model.addVar(vtype=GRB.INTEGER, name=f"n_{container['id']}")
-
-    for carton in cartons:
-        for container in containers:
-            '''
-            sij[(carton['id'], container['id'])] is a binary variable that is 1 if the carton is assigned to the container
-            yi[carton['id']] is the y-coordinate of the front-left-bottom corner of the carton
-            xi[carton['id']] is the x-coordinate of the front-left-bottom corner of the carton
-            zi[carton['id']] is the z-coordinate of the front-left-bottom corner of the carton
-            '''
-
-            sij[(carton['id'], container['id'])] = model.addVar(vtype=GRB.BINARY,
-                                                                name=f"s_{carton['id']}_{container['id']}")
-        xi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"x_{carton['id']}")
-        yi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"y_{carton['id']}")
-        zi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"z_{carton['id']}")
-
-        # coordinates must be non-negative
-        model.addConstr(xi[carton['id']] >= 0)
-        model.addConstr(yi[carton['id']] >= 0)
-        model.addConstr(zi[carton['id']] >= 0)
-
-        # Add 9 binary orientation variables for each carton
-        orientation[carton['id']] = {
-            
-
-            "lx": model.addVar(vtype=GRB.BINARY, name=f"lx_{carton['id']}"),
-            "ly": model.addVar(vtype=GRB.BINARY, name=f"ly_{carton['id']}"),
-            "lz": model.addVar(vtype=GRB.BINARY, name=f"lz_{carton['id']}"),
-            "wx": model.addVar(vtype=GRB.BINARY, name=f"wx_{carton['id']}"),
-            "wy": model.addVar(vtype=GRB.BINARY, name=f"wy_{carton['id']}"),
-            "wz": model.addVar(vtype=GRB.BINARY, name=f"wz_{carton['id']}"),
-            "hx": model.addVar(vtype=GRB.BINARY, name=f"hx_{carton['id']}"),
-            "hy": model.addVar(vtype=GRB.BINARY, name=f"hy_{carton['id']}"),
-            "hz": model.addVar(vtype=GRB.BINARY, name=f"hz_{carton['id']}"),
-        }
-
-    # Relative positioning variables: aik, bik, cik, dik, eik, fik
-    '''
-        aik - carton i is to the left of carton k
-        bik - carton i is to the right of carton k
-        cik - carton i is behind carton k
-        dik - carton i is in front of carton k
-        eik - carton i is below carton k
-        fik - carton i is above carton k
-    '''
-    for i in range(len(cartons)):
-        for k in range(i + 1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            relative_position[(carton_i['id'], carton_k['id'])] = {
-                "aik": model.addVar(vtype=GRB.BINARY, name=f"aik_{carton_i['id']}_{carton_k['id']}"),
-                "bik": model.addVar(vtype=GRB.BINARY, name=f"bik_{carton_i['id']}_{carton_k['id']}"),
-                "cik": model.addVar(vtype=GRB.BINARY, name=f"cik_{carton_i['id']}_{carton_k['id']}"),
-                "dik": model.addVar(vtype=GRB.BINARY, name=f"dik_{carton_i['id']}_{carton_k['id']}"),
-                "eik": model.addVar(vtype=GRB.BINARY, name=f"eik_{carton_i['id']}_{carton_k['id']}"),
-                "fik": model.addVar(vtype=GRB.BINARY, name=f"fik_{carton_i['id']}_{carton_k['id']}"),
-            }
-
-    # Constraints
-    # 1. Assign each carton to exactly one container
-    for carton in cartons:
-        model.addConstr(sum(sij[(carton['id'], container['id'])] for container in containers) == 1,
-                        name=f"assign_{carton['id']}")
-    
-    # carton must be assigned to a used container 
-    for container in containers:
-       model.addConstr(sum(sij[(carton['id'], container['id'])] for carton in cartons) <= M*nj[container['id']],
-      name=f"assign_{container['id']}")
-
-
-    # 2. Orientation consistency: Each dimension aligns with exactly one axis
-    for carton in cartons:
-        orients = orientation[carton['id']]
-        model.addConstr(orients["lx"] + orients["ly"] + orients["lz"] == 1, name=f"orient_length_{carton['id']}")
-        model.addConstr(orients["wx"] + orients["wy"] + orients["wz"] == 1, name=f"orient_width_{carton['id']}")
-        model.addConstr(orients["hx"] + orients["hy"] + orients["hz"] == 1, name=f"orient_height_{carton['id']}")
-
-        # Each axis has one dimension
-        model.addConstr(orients["lx"] + orients["wx"] + orients["hx"] == 1, name=f"axis_x_{carton['id']}")
-        model.addConstr(orients["ly"] + orients["wy"] + orients["hy"] == 1, name=f"axis_y_{carton['id']}")
-        model.addConstr(orients["lz"] + orients["wz"] + orients["hz"] == 1, name=f"axis_z_{carton['id']}")
-
-    # 3. Fit cartons within container dimensions
-    for carton in cartons:
-        for container in containers:
-            orients = orientation[carton['id']]
-            model.addConstr(xi[carton['id']] + carton['length'] * orients["lx"] +
-                            carton['width'] * orients["wx"] +
-                            carton['height'] * orients["hx"] <= container['length'] + (
-                                        1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_x_{carton['id']}_{container['id']}")
-
-            model.addConstr(yi[carton['id']] + carton['length'] * orients["ly"] +
-                            carton['width'] * orients["wy"] +
-                            carton['height'] * orients["hy"] <= container['width'] + (
-                                        1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_y_{carton['id']}_{container['id']}")
-
-            model.addConstr(zi[carton['id']] + carton['length'] * orients["lz"] +
-                            carton['width'] * orients["wz"] +
-                            carton['height'] * orients["hz"] <= container['height'] + (
-                                        1 - sij[(carton['id'], container['id'])]) * M,
-                            name=f"fit_z_{carton['id']}_{container['id']}")
-
-    
-    for container in containers:
-        # weight constraints
-        model.addConstr(sum((sij[(carton['id'], container['id'])] * carton['weight']) for carton in cartons) <= container['weight'],
-                        name=f"weight_limit_constr{container['id']}")
-        for i in range(len(cartons)):
-            for k in range(i + 1, len(cartons)):
-                carton_i = cartons[i]
-                carton_k = cartons[k]
-                rel = relative_position[(carton_i['id'], carton_k['id'])]
-                model.addConstr((rel["aik"] + rel["bik"] + rel["cik"] + rel["dik"] + rel["eik"] + rel["fik"] >=
-                                 sij[(carton_i['id'], container['id'])] + sij[(carton_k['id'], container['id'])] - x),
-                                name=f"relative_sum_{carton_i['id']}_{carton_k['id']}_{container['id']}")
-    
-    # 4. Prevent overlapping of cartons with aik, bik, cik, dik, eik, fik constraints
-    for i in range(len(cartons)):
-        for k in range(i+1, len(cartons)):
-            carton_i = cartons[i]
-            carton_k = cartons[k]
-            rel = relative_position[(carton_i['id'], carton_k['id'])]
-            model.addConstr(
-                xi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lx"] + carton_i['width'] *
-                orientation[carton_i['id']]["wx"] + carton_i['height'] * orientation[carton_i['id']]["hx"] <= xi[
-                    carton_k['id']] + (1 - rel["aik"]) * M, name=f"no_overlap_x_a_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                xi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lx"] + carton_k['width'] *
-                orientation[carton_k['id']]["wx"] + carton_k['height'] * orientation[carton_k['id']]["hx"] <= xi[
-                    carton_i['id']] + (1 - rel["bik"]) * M, name=f"no_overlap_x_b_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["ly"] + carton_i['width'] *
-                orientation[carton_i['id']]["wy"] + carton_i['height'] * orientation[carton_i['id']]["hy"] <= yi[
-                    carton_k['id']] + (1 - rel["cik"]) * M, name=f"no_overlap_y_c_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                yi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["ly"] + carton_k['width'] *
-                orientation[carton_k['id']]["wy"] + carton_k['height'] * orientation[carton_k['id']]["hy"] <= yi[
-                    carton_i['id']] + (1 - rel["dik"]) * M, name=f"no_overlap_y_d_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lz"] + carton_i['width'] *
-                orientation[carton_i['id']]["wz"] + carton_i['height'] * orientation[carton_i['id']]["hz"] <= zi[
-                    carton_k['id']] + (1 - rel["eik"]) * M, name=f"no_overlap_z_e_{carton_i['id']}_{carton_k['id']}")
-            model.addConstr(
-                zi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lz"] + carton_k['width'] *
-                orientation[carton_k['id']]["wz"] + carton_k['height'] * orientation[carton_k['id']]["hz"] <= zi[
-                    carton_i['id']] + (1 - rel["fik"]) * M, name=f"no_overlap_z_f_{carton_i['id']}_{carton_k['id']}")
+    M = None  # Constant for "big-M" constraints, None derives the tightest one of each constraint (see BigM)
+
+    # Decision variables and the shared constraints: assignment, orientation, fit, weight and no overlap
+    form = build_formulation(model, cartons, containers, M, assign_sense=GRB.EQUAL, names=names)
+    sij = form.sij  # Binary: carton i assigned to container j
+    xi, yi, zi = form.xi, form.yi, form.zi  # Integer: coordinates of FLB corner of carton i
+    orientation = form.orientation  # Binary variables for carton orientation (rotation matrix)
+
+    # nj variable is 1 if j-th container is used, a carton must be assigned to a used container
+    container_ids = [container['id'] for container in containers]
+    nj = form.add_vars(len(containers), GRB.INTEGER, labels(names, "n_", container_ids))
+    used = form.big_m.value(len(cartons))     # a container holds at most every carton
+    form.add_rows(sum_terms(form.S.T) + [(nj, -used)], GRB.LESS_EQUAL, 0, labels(names, "assign_", container_ids))
     
     model.setParam('TimeLimit', timeout)    # Stop after timout seconds
-    model.optimize()
+    model.setParam('Threads', threads)
+    model.optimize(callback)
+    solution = None
     if model.status == GRB.OPTIMAL:
         solution = []                       # if optimal solution is found, update the result
         for container in containers:
@@ -201,4 +61,176 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
                             "DimY": carton['length'] * orientation[carton['id']]["ly"].X + carton['width'] * orientation[carton['id']]["wy"].X + carton['height'] * orientation[carton['id']]["hy"].X,
                             "DimZ": carton['length'] * orientation[carton['id']]["lz"].X + carton['width'] * orientation[carton['id']]["wz"].X + carton['height'] * orientation[carton['id']]["hz"].X
                         })
-        return solution
\ No newline at end of file
+    if return_status:
+        return solution, model.status
+    return solution
+
+class ContainerModel:
+    """
+    Feasibility model of a single container kept across binsearch iterations, instead of building
+    container_loading_with_relative_constraints from scratch for every candidate carton. Every carton of the model
+    lies in the container, so the assignment variables are fixed to one and left out. Adding a carton only adds its
+    own variables and its constraints against the cartons already in the model, the last feasible placement is
+    the MIP start of the next solve and a carton that does not fit is removed again.
+
+    Parameters:
+    container: dictionary with the container details, {'id', 'length', 'width', 'height', 'weight'}.
+    cartons: cartons already in the container, as in container_loading_with_relative_constraints.
+    solution: their current placement, entries with 'carton_id', 'x', 'y', 'z', 'DimX', 'DimY' and 'DimZ'.
+    names: name the variables and constraints.
+    """
+
+    def __init__(self, container, cartons = (), solution = (), names = True):
+        self.container = container
+        self.names = names
+        self.model = gp.Model("3D_Container_Loading_with_Relative_Positioning")
+        self.model.Params.LogToConsole = 0 # Show optimization logs
+        self.cartons = []
+        self.weight = 0
+        self.position = {}          # carton id -> (x, y, z) variables
+        self.orientation = {}       # carton id -> orientation name -> variable
+        self.relative_position = {} # (carton id, later carton id) -> relative position name -> variable
+        self.extent = {}            # carton id -> per axis expression of its dimension along the axis
+        self.reach = {}             # carton id -> per axis bound of x_i + dim_i, the big-M of its no overlap constraints
+        self.placement = {}         # carton id -> solution entry of the last feasible placement
+        entries = {entry['carton_id']: entry for entry in solution}
+        for carton in cartons:
+            self.add_carton(carton)
+            if carton['id'] in entries:
+                self.place(carton, entries[carton['id']])
+
+    def name(self, name):
+        return name if self.names else ""
+
+    def add_carton(self, carton):
+        """
+        Add the variables and constraints of a carton.
+        Returns:
+            list: The added variables and constraints, to remove them again.
+        """
+        model, container = self.model, self.container
+        id = carton['id']
+        big_m = BigM([carton], [container])
+        dims = {"l": carton['length'], "w": carton['width'], "h": carton['height']}
+        extents = (container['length'], container['width'], container['height'])
+        position = tuple(model.addVar(vtype=GRB.INTEGER, ub=big_m.upper[0, a], name=self.name(f"{axis}_{id}"))
+                         for a, axis in enumerate(AXES))
+        orientation = {orient: model.addVar(vtype=GRB.BINARY, name=self.name(f"{orient}_{id}")) for orient in ORIENTATIONS}
+        added = list(position) + list(orientation.values())
+
+        # orientation consistency and fit within the container
+        for d, dim in zip(dims, ("length", "width", "height")):
+            added.append(model.addConstr(gp.quicksum(orientation[d + axis] for axis in AXES) == 1, name=self.name(f"orient_{dim}_{id}")))
+        for axis in AXES:
+            added.append(model.addConstr(gp.quicksum(orientation[d + axis] for d in dims) == 1, name=self.name(f"axis_{axis}_{id}")))
+        extent = [gp.quicksum(size * orientation[d + axis] for d, size in dims.items()) for axis in AXES]
+        for a, axis in enumerate(AXES):
+            added.append(model.addConstr(position[a] + extent[a] <= extents[a], name=self.name(f"fit_{axis}_{id}_{container['id']}")))
+
+        # no overlap with every carton already in the model
+        reach = big_m.upper[0] + big_m.longest[0]
+        for other in self.cartons:
+            pair = f"{other['id']}_{id}"
+            rel = {r: model.addVar(vtype=GRB.BINARY, name=self.name(f"{r}_{pair}")) for r in RELATIVE_POSITIONS}
+            added += rel.values()
+            added.append(model.addConstr(gp.quicksum(rel.values()) >= 1, name=self.name(f"relative_sum_{pair}_{container['id']}")))
+            other_position, other_extent = self.position[other['id']], self.extent[other['id']]
+            for a, (axis, before, after) in enumerate(zip(AXES, RELATIVE_POSITIONS[0::2], RELATIVE_POSITIONS[1::2])):
+                added.append(model.addConstr(other_position[a] + other_extent[a] <= position[a] + (1 - rel[before]) * self.reach[other['id']][a],
+                                             name=self.name(f"no_overlap_{axis}_{before[0]}_{pair}")))
+                added.append(model.addConstr(position[a] + extent[a] <= other_position[a] + (1 - rel[after]) * reach[a],
+                                             name=self.name(f"no_overlap_{axis}_{after[0]}_{pair}")))
+            self.relative_position[(other['id'], id)] = rel
+
+        self.cartons.append(carton)
+        self.weight += carton['weight']
+        self.position[id], self.orientation[id], self.extent[id], self.reach[id] = position, orientation, extent, reach
+        return added
+
+    def remove_carton(self, carton, added):
+        """
+        Remove the last added carton with the variables and constraints returned by add_carton.
+        """
+        self.model.remove(added)
+        self.model.update()
+        id = carton['id']
+        self.cartons.pop()
+        self.weight -= carton['weight']
+        for other in self.cartons:
+            del self.relative_position[(other['id'], id)]
+        del self.position[id], self.orientation[id], self.extent[id], self.reach[id]
+        self.placement.pop(id, None)
+
+    def place(self, carton, entry):
+        """
+        Record a known placement of a carton and use it as the MIP start of its variables, including its relative
+        positions to the cartons added before it.
+        """
+        id = carton['id']
+        self.placement[id] = entry
+        box = [round(entry[axis]) for axis in AXES] + [round(entry[dim]) for dim in ("DimX", "DimY", "DimZ")]
+        for var, value in zip(self.position[id], box):
+            var.Start = value
+        dims = (carton['length'], carton['width'], carton['height'])
+        rotation = next((p for p in permutations(range(3)) if all(dims[p[a]] == box[3 + a] for a in range(3))), None)
+        if rotation is not None:
+            for orient, var in self.orientation[id].items():
+                var.Start = int(rotation["xyz".index(orient[1])] == "lwh".index(orient[0]))
+        for other in self.cartons:
+            rel = self.relative_position.get((other['id'], id))
+            placed = self.placement.get(other['id'])
+            if rel is None or placed is None:
+                continue
+            other_box = [round(placed[axis]) for axis in AXES] + [round(placed[dim]) for dim in ("DimX", "DimY", "DimZ")]
+            for a, (before, after) in enumerate(zip(RELATIVE_POSITIONS[0::2], RELATIVE_POSITIONS[1::2])):
+                rel[before].Start = int(other_box[a] + other_box[3 + a] <= box[a])
+                rel[after].Start = int(box[a] + box[3 + a] <= other_box[a])
+
+    def add(self, carton, entry):
+        """
+        Add a carton whose placement next to the current one is already known, without solving.
+        """
+        self.add_carton(carton)
+        self.place(carton, entry)
+
+    def try_add(self, carton, timeout = 30):
+        """
+        Add a carton and solve the model, warm started from the last feasible placement.
+        Returns:
+            tuple: (solution, status). solution is the placement of every carton of the container in the format of
+            container_loading_with_relative_constraints, or None if no placement was found, in which case the
+            carton is removed from the model again. status is the Gurobi status of the solve, GRB.INFEASIBLE
+            only if the carton is proven not to fit.
+        """
+        if self.weight + carton['weight'] > self.container['weight']:
+            return None, GRB.INFEASIBLE
+        added = self.add_carton(carton)
+        model = self.model
+        model.setParam('TimeLimit', timeout)    # Stop after timout seconds
+        model.optimize()
+        status = model.status
+        if status != GRB.OPTIMAL:
+            self.remove_carton(carton, added)   # resets the status of the model
+            return None, status
+        variables = model.getVars()
+        model.setAttr("Start", variables, model.getAttr("X", variables))
+        for other in self.cartons:
+            x, y, z = (var.X for var in self.position[other['id']])
+            dx, dy, dz = (extent.getValue() for extent in self.extent[other['id']])
+            self.placement[other['id']] = {
+                "carton_id": other['id'],
+                "container_id": self.container['id'],
+                "x": x,
+                "y": y,
+                "z": z,
+                "DimX": dx,
+                "DimY": dy,
+                "DimZ": dz,
+                "weight": other['weight'],
+                "cost": other['cost'],
+                "priority": other['priority']
+            }
+        return self.solution(), status
+
+    def solution(self):
+        return [self.placement[carton['id']] for carton in self.cartons if carton['id'] in self.placement]
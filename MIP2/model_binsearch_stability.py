@@ -1,5 +1,6 @@
 import gurobipy as gp
 from gurobipy import GRB, quicksum
+from MIP1.formulation import BigM
 
 stability_threshold = 0.6
 # maximum fraction of dimension of a carton allowed to be unsupported by another carton
@@ -23,8 +24,10 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
     model = gp.Model("3D_Container_Loading_with_Relative_Positioning")
     model.Params.LogToConsole = 0 # Show optimization logs
     
-    # Define constants
-    M = 100000  # Large constant for "big-M" constraints
+    # Define constants, the tightest valid big-M constant of every constraint (see BigM)
+    big_m = BigM(cartons, containers)
+    upper, shortest, longest = big_m.upper, big_m.shortest, big_m.longest
+    fit = [big_m.fit(axis) for axis in range(3)]
 
     # Decision variables
     sij = {}  # Binary: carton i assigned to container j
@@ -40,7 +43,7 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
     for container in containers:        #nj variable is 1 if j-th container is used
         nj[container['id']] = model.addVar(vtype=GRB.INTEGER, name=f"n_{container['id']}")
     
-    for carton in cartons:
+    for i, carton in enumerate(cartons):
         for container in containers:
             '''
             sij[(carton['id'], container['id'])] is a binary variable that is 1 if the carton is assigned to the container
@@ -50,9 +53,9 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
             '''
             sij[(carton['id'], container['id'])] = model.addVar(vtype=GRB.BINARY, name=f"s_{carton['id']}_{container['id']}")
         
-        xi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"x_{carton['id']}")
-        yi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"y_{carton['id']}")
-        zi[carton['id']] = model.addVar(vtype=GRB.INTEGER, name=f"z_{carton['id']}")
+        xi[carton['id']] = model.addVar(vtype=GRB.INTEGER, ub=upper[i, 0], name=f"x_{carton['id']}")
+        yi[carton['id']] = model.addVar(vtype=GRB.INTEGER, ub=upper[i, 1], name=f"y_{carton['id']}")
+        zi[carton['id']] = model.addVar(vtype=GRB.INTEGER, ub=upper[i, 2], name=f"z_{carton['id']}")
         
         # coordinates must be non-negative
         model.addConstr(xi[carton['id']] >= 0)
@@ -114,7 +117,7 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
     
     # carton must be assigned to a used container 
     for container in containers:
-       model.addConstr(sum(sij[(carton['id'], container['id'])] for carton in cartons) <= M*nj[container['id']],
+       model.addConstr(sum(sij[(carton['id'], container['id'])] for carton in cartons) <= len(cartons)*nj[container['id']],
       name=f"assign_{container['id']}")
 
 
@@ -131,25 +134,25 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
         model.addConstr(orients["lz"] + orients["wz"] + orients["hz"] == 1, name=f"axis_z_{carton['id']}")
 
     # 3. Fit cartons within container dimensions
-    for carton in cartons:
-        for container in containers:
+    for i, carton in enumerate(cartons):
+        for j, container in enumerate(containers):
             orients = orientation[carton['id']]
             model.addConstr(xi[carton['id']] + carton['length'] * orients["lx"] +
                             carton['width'] * orients["wx"] +
                             carton['height'] * orients["hx"] <= container['length'] + (
-                                        1 - sij[(carton['id'], container['id'])]) * M,
+                                        1 - sij[(carton['id'], container['id'])]) * fit[0][i, j],
                             name=f"fit_x_{carton['id']}_{container['id']}")
 
             model.addConstr(yi[carton['id']] + carton['length'] * orients["ly"] +
                             carton['width'] * orients["wy"] +
                             carton['height'] * orients["hy"] <= container['width'] + (
-                                        1 - sij[(carton['id'], container['id'])]) * M,
+                                        1 - sij[(carton['id'], container['id'])]) * fit[1][i, j],
                             name=f"fit_y_{carton['id']}_{container['id']}")
 
             model.addConstr(zi[carton['id']] + carton['length'] * orients["lz"] +
                             carton['width'] * orients["wz"] +
                             carton['height'] * orients["hz"] <= container['height'] + (
-                                        1 - sij[(carton['id'], container['id'])]) * M,
+                                        1 - sij[(carton['id'], container['id'])]) * fit[2][i, j],
                             name=f"fit_z_{carton['id']}_{container['id']}")
 
     
@@ -175,27 +178,27 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
             model.addConstr(
                 xi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lx"] + carton_i['width'] *
                 orientation[carton_i['id']]["wx"] + carton_i['height'] * orientation[carton_i['id']]["hx"] <= xi[
-                    carton_k['id']] + (1 - rel["aik"]) * M, name=f"no_overlap_x_a_{carton_i['id']}_{carton_k['id']}")
+                    carton_k['id']] + (1 - rel["aik"]) * (upper[i, 0] + longest[i]), name=f"no_overlap_x_a_{carton_i['id']}_{carton_k['id']}")
             model.addConstr(
                 xi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lx"] + carton_k['width'] *
                 orientation[carton_k['id']]["wx"] + carton_k['height'] * orientation[carton_k['id']]["hx"] <= xi[
-                    carton_i['id']] + (1 - rel["bik"]) * M, name=f"no_overlap_x_b_{carton_i['id']}_{carton_k['id']}")
+                    carton_i['id']] + (1 - rel["bik"]) * (upper[k, 0] + longest[k]), name=f"no_overlap_x_b_{carton_i['id']}_{carton_k['id']}")
             model.addConstr(
                 yi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["ly"] + carton_i['width'] *
                 orientation[carton_i['id']]["wy"] + carton_i['height'] * orientation[carton_i['id']]["hy"] <= yi[
-                    carton_k['id']] + (1 - rel["cik"]) * M, name=f"no_overlap_y_c_{carton_i['id']}_{carton_k['id']}")
+                    carton_k['id']] + (1 - rel["cik"]) * (upper[i, 1] + longest[i]), name=f"no_overlap_y_c_{carton_i['id']}_{carton_k['id']}")
             model.addConstr(
                 yi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["ly"] + carton_k['width'] *
                 orientation[carton_k['id']]["wy"] + carton_k['height'] * orientation[carton_k['id']]["hy"] <= yi[
-                    carton_i['id']] + (1 - rel["dik"]) * M, name=f"no_overlap_y_d_{carton_i['id']}_{carton_k['id']}")
+                    carton_i['id']] + (1 - rel["dik"]) * (upper[k, 1] + longest[k]), name=f"no_overlap_y_d_{carton_i['id']}_{carton_k['id']}")
             model.addConstr(
                 zi[carton_i['id']] + carton_i['length'] * orientation[carton_i['id']]["lz"] + carton_i['width'] *
                 orientation[carton_i['id']]["wz"] + carton_i['height'] * orientation[carton_i['id']]["hz"] <= zi[
-                    carton_k['id']] + (1 - rel["eik"]) * M, name=f"no_overlap_z_e_{carton_i['id']}_{carton_k['id']}")
+                    carton_k['id']] + (1 - rel["eik"]) * (upper[i, 2] + longest[i]), name=f"no_overlap_z_e_{carton_i['id']}_{carton_k['id']}")
             model.addConstr(
                 zi[carton_k['id']] + carton_k['length'] * orientation[carton_k['id']]["lz"] + carton_k['width'] *
                 orientation[carton_k['id']]["wz"] + carton_k['height'] * orientation[carton_k['id']]["hz"] <= zi[
-                    carton_i['id']] + (1 - rel["fik"]) * M, name=f"no_overlap_z_f_{carton_i['id']}_{carton_k['id']}")
+                    carton_i['id']] + (1 - rel["fik"]) * (upper[k, 2] + longest[k]), name=f"no_overlap_z_f_{carton_i['id']}_{carton_k['id']}")
     
     # Stability constraints
     '''
@@ -208,28 +211,28 @@ def container_loading_with_relative_constraints(cartons, containers,timeout = 30
         6. The y-coordinate of the RRT of i must be less than the y-coordinate of the FLB of j
     '''
     for i in range(len(cartons)):
-        model.addConstr(zi[cartons[i]['id']] <= (1 - orientation[cartons[i]['id']]["ground"]) * M, name=f"touching_ground_{carton['id']}")
+        model.addConstr(zi[cartons[i]['id']] <= (1 - orientation[cartons[i]['id']]["ground"]) * upper[i, 2], name=f"touching_ground_{carton['id']}")
         model.addConstr(orientation[carton['id']]['ground'] + sum(relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"] for j in range(len(cartons)) if i!=j) == 1)
         for j in range(len(cartons)):
             if (i==j):
                 continue
             model.addConstr(zi[cartons[i]['id']] <= zi[cartons[j]['id']] + cartons[j]['height'] * orientation[cartons[j]['id']]["hz"] + 
                             cartons[j]['length'] * orientation[cartons[j]['id']]["lz"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wz"] +
-                            (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]) * M)
-            model.addConstr(zi[cartons[i]['id']] + (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]) * M >= zi[cartons[j]['id']] + 
+                            (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]) * max(upper[i, 2] - shortest[j], 0))
+            model.addConstr(zi[cartons[i]['id']] + (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]) * (upper[j, 2] + longest[j]) >= zi[cartons[j]['id']] + 
                             cartons[j]['height'] * orientation[cartons[j]['id']]["hz"] + cartons[j]['length'] * orientation[cartons[j]['id']]["lz"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wz"])
             model.addConstr(xi[cartons[i]['id']] + cartons[i]['length'] * orientation[cartons[i]['id']]["lx"] + cartons[i]['width'] * orientation[cartons[i]['id']]["wx"] +
                             cartons[i]['height'] * orientation[cartons[i]['id']]["hx"] <= xi[cartons[j]['id']] + cartons[j]['length'] * orientation[cartons[j]['id']]["lx"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wx"] +
                             cartons[j]['height'] * orientation[cartons[j]['id']]["hx"] + stability_threshold * (xi[cartons[j]['id']] + cartons[j]['length'] * orientation[cartons[j]['id']]["lx"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wx"] +
-                            cartons[j]['height'] * orientation[cartons[j]['id']]["hx"] - xi[cartons[j]['id']]) + M * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]))
+                            cartons[j]['height'] * orientation[cartons[j]['id']]["hx"] - xi[cartons[j]['id']]) + max(upper[i, 0] + longest[i] - (1 + stability_threshold) * shortest[j], 0) * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]))
             model.addConstr(xi[cartons[i]['id']] <= xi[cartons[j]['id']] + stability_threshold * (xi[cartons[j]['id']] + cartons[j]['length'] * orientation[cartons[j]['id']]["lx"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wx"] +
-                            cartons[j]['height'] * orientation[cartons[j]['id']]["hx"] - xi[cartons[j]['id']]) + M * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"])) 
+                            cartons[j]['height'] * orientation[cartons[j]['id']]["hx"] - xi[cartons[j]['id']]) + max(upper[i, 0] - stability_threshold * shortest[j], 0) * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"])) 
             model.addConstr(yi[cartons[i]['id']] + cartons[i]['length'] * orientation[cartons[i]['id']]["ly"] + cartons[i]['width'] * orientation[cartons[i]['id']]["wy"] +
                             cartons[i]['height'] * orientation[cartons[i]['id']]["hy"] <= yi[cartons[j]['id']] + cartons[j]['length'] * orientation[cartons[j]['id']]["ly"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wy"] +
                             cartons[j]['height'] * orientation[cartons[j]['id']]["hy"] + stability_threshold * (yi[cartons[j]['id']] + cartons[j]['length'] * orientation[cartons[j]['id']]["ly"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wy"] +
-                            cartons[j]['height'] * orientation[cartons[j]['id']]["hy"] - yi[cartons[j]['id']]) + M * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]))
+                            cartons[j]['height'] * orientation[cartons[j]['id']]["hy"] - yi[cartons[j]['id']]) + max(upper[i, 1] + longest[i] - (1 + stability_threshold) * shortest[j], 0) * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"]))
             model.addConstr(yi[cartons[i]['id']] <= yi[cartons[j]['id']] + stability_threshold * (yi[cartons[j]['id']] + cartons[j]['length'] * orientation[cartons[j]['id']]["ly"] + cartons[j]['width'] * orientation[cartons[j]['id']]["wy"] +
-                            cartons[j]['height'] * orientation[cartons[j]['id']]["hy"] - yi[cartons[j]['id']]) + M * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"])) 
+                            cartons[j]['height'] * orientation[cartons[j]['id']]["hy"] - yi[cartons[j]['id']]) + max(upper[i, 1] - stability_threshold * shortest[j], 0) * (1 - relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"])) 
             model.addConstr(sum(sij[cartons[i]['id'],container['id']] * sij[cartons[j]['id'],container['id']] for container in containers) >= relative_position[(cartons[i]['id'], cartons[j]['id'])]["support"])
    
    
@@ -0,0 +1,105 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from gurobipy import GRB
+from MIP2.model_binsearch import container_loading_with_relative_constraints as solver
+
+# Parallel feasibility probing for binsearch. The containers a carton may go to are solved at once in a process
+# pool, each solve with a fixed number of Gurobi threads, and the best ranked feasible container is kept. Probes
+# that can no longer win are cancelled: the pending ones are dropped from the pool and the running ones stop at
+# their next MIP callback, as they see the shared round counter move past the round they were started in.
+
+round_counter = None    # shared round counter of the pool, set in every worker by init_worker
+
+
+def init_worker(counter):
+    global round_counter
+    round_counter = counter
+
+
+def probe(cartons, container, timeout, threads, round_id):
+    """
+    Solve the feasibility model of one container in a worker.
+    Args:
+        cartons (list): Cartons of the container, including the candidate carton.
+        container (dict): Container to solve.
+        timeout (float): Time limit of the solve.
+        threads (int): Gurobi threads of the solve.
+        round_id (int): Round the probe belongs to, the solve is terminated once the round is over.
+    Returns:
+        tuple: (solution, status). solution is the solution of container_loading_with_relative_constraints, None if
+        the carton does not fit, the solve timed out or the probe was cancelled. status is the Gurobi status of the solve.
+    """
+    def cancel(model, where):
+        if where == GRB.Callback.MIP and round_counter.value != round_id:
+            model.terminate()
+
+    return solver(cartons, [container], timeout, threads=threads, callback=cancel, return_status=True)
+
+
+class ContainerProber:
+    """
+    Process pool probing the candidate containers of a carton in parallel.
+    Args:
+        workers (int, optional): Number of worker processes. Defaults to the number of cores divided by threads.
+        threads (int, optional): Gurobi threads of every solve. Defaults to 1.
+    """
+
+    def __init__(self, workers = None, threads = 1):
+        self.threads = threads
+        self.workers = workers or max(1, (os.cpu_count() or 1) // threads)
+        self.counter = multiprocessing.Value('i', 0)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(self.counter,))
+
+    def probe(self, candidates, timeout):
+        """
+        Probe candidate containers in parallel.
+        Args:
+            candidates (list): (container, cartons) pairs in order of preference, cartons including the candidate carton.
+            timeout (float): Time limit of every solve.
+        Returns:
+            tuple: (index, solution, statuses). index and solution are those of the first candidate in order of
+            preference that is feasible, or None. statuses holds the Gurobi status of every candidate, None for the
+            probes that did not finish or failed. A failed probe, e.g. on a GurobiError, counts as not feasible.
+        """
+        if not candidates:
+            return None, None, []
+        round_id = self.counter.value
+        futures = [self.pool.submit(probe, cartons, container, timeout, self.threads, round_id) for container, cartons in candidates]
+        results = [None] * len(futures)
+        statuses = [None] * len(futures)
+        pending = set(futures)
+        best = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # a failed probe only loses its own candidate, its status stays None so it is never cached
+                    try:
+                        solution, status = future.result()
+                    except Exception as error:
+                        print("Probe of container {0} failed: {1}".format(candidates[futures.index(future)][0]['id'], error))
+                        solution, status = None, None
+                    results[futures.index(future)] = solution or False
+                    statuses[futures.index(future)] = status
+                # the first feasible candidate wins once every candidate ranked before it has finished without a solution
+                for index, result in enumerate(results):
+                    if result is None:
+                        break
+                    if result:
+                        best = index
+                        break
+                if best is not None:
+                    break
+        finally:
+            # end the round, running probes of it terminate and pending ones are not started
+            with self.counter.get_lock():
+                self.counter.value += 1
+            for future in pending:
+                future.cancel()
+        if best is None:
+            return None, None, statuses
+        return best, results[best], statuses
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
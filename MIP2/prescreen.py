@@ -0,0 +1,132 @@
+from utils.structs import ULD, Package
+from utils.extremePoints import ExtremePointSet
+
+# Cheap checks run before the feasibility MIP of binsearch. A carton is rejected if the container cannot hold
+# its weight or volume or no rotation fits, and accepted if an extreme point heuristic places it next to the
+# current placement. Only the cartons left undecided need a Gurobi model. The extreme points of a container are
+# kept in a ContainerScreen and reused for every carton until the placement of the container changes.
+
+
+def fits_rotation(carton, container):
+    """
+    Check if some rotation of the carton fits within the container extents.
+    Args:
+        carton (dict): Carton with 'length', 'width' and 'height'.
+        container (dict): Container with 'length', 'width' and 'height'.
+    Returns:
+        bool: True if the sorted carton dimensions fit within the sorted container dimensions.
+    """
+    carton_dims = sorted((carton['length'], carton['width'], carton['height']))
+    container_dims = sorted((container['length'], container['width'], container['height']))
+    return all(c <= d for c, d in zip(carton_dims, container_dims))
+
+
+class ContainerScreen:
+    """
+    The current placement of a container as a ULD with its extreme points, to try cartons against without moving
+    the cartons already placed. Trying a carton leaves the ULD and the points unchanged, so the screen is reused
+    until the placement of the container changes.
+    Args:
+        container (dict): Container with 'id', 'length', 'width', 'height' and 'weight'.
+        solution (list): Current placement of the container, entries with 'x', 'y', 'z', 'DimX', 'DimY' and 'DimZ'.
+    """
+
+    def __init__(self, container, solution):
+        self.container = container
+        self.solution = solution
+        self.size = len(solution)
+        uld = self.uld = ULD(container['length'], container['width'], container['height'], container['weight'], container['id'])
+        for placed in solution:
+            package = Package(placed['DimX'], placed['DimY'], placed['DimZ'], placed.get('weight', 0), placed['carton_id'], placed.get('priority'))
+            package.position = tuple(round(placed[axis]) for axis in ('x', 'y', 'z'))
+            package.rotation = -1
+            package.dimensions = tuple(round(placed[dim]) for dim in ('DimX', 'DimY', 'DimZ'))
+            package.ULD = uld.id
+            uld.packages.append(package)
+        uld.rebuildIndex()
+
+        self.points = ExtremePointSet([(0, 0, 0)], uld)
+        for package in uld.packages:
+            self.points.extend(uld.getNewCorners(package), uld)
+
+    def matches(self, container, solution):
+        """
+        Check if the screen still shows the given placement of the container.
+        """
+        return self.container is container and self.solution is solution and self.size == len(solution)
+
+    def place(self, carton):
+        """
+        Try to place a carton at the closest extreme point that fits it.
+        Args:
+            carton (dict): Carton to place, with 'id', 'length', 'width', 'height', 'weight', 'cost' and 'priority'.
+        Returns:
+            dict or None: Solution entry of the carton, in the format of the entries of the solution, or None if no
+            extreme point of the placement can host it.
+        """
+        package = Package(carton['length'], carton['width'], carton['height'], carton['weight'], carton['id'], carton['priority'])
+        if self.points.find(self.uld, package) is None:
+            return None
+        [x, y, z] = package.position
+        [dx, dy, dz] = package.getDimensions()
+        return {
+            "carton_id": carton['id'],
+            "container_id": self.container['id'],
+            "x": x,
+            "y": y,
+            "z": z,
+            "DimX": dx,
+            "DimY": dy,
+            "DimZ": dz,
+            "weight": carton['weight'],
+            "cost": carton['cost'],
+            "priority": carton['priority']
+        }
+
+
+def extreme_point_placement(carton, container, solution, screens = None):
+    """
+    Try to place a carton in a container without moving the cartons already placed in it.
+    Args:
+        carton (dict): Carton to place, with 'id', 'length', 'width', 'height', 'weight', 'cost' and 'priority'.
+        container (dict): Container with 'id', 'length', 'width', 'height' and 'weight'.
+        solution (list): Current placement of the container, entries with 'x', 'y', 'z', 'DimX', 'DimY' and 'DimZ'.
+        screens (dict, optional): Container id -> ContainerScreen, reused while the placement is unchanged and
+            rebuilt once it changes. Without it the screen is built for this carton only.
+    Returns:
+        dict or None: Solution entry of the carton, in the format of the entries of solution, or None if no
+        extreme point of the current placement can host it.
+    """
+    if screens is None:
+        return ContainerScreen(container, solution).place(carton)
+    screen = screens.get(container['id'])
+    if screen is None or not screen.matches(container, solution):
+        screen = screens[container['id']] = ContainerScreen(container, solution)
+    return screen.place(carton)
+
+
+def prescreen(carton, container, assigned, solution, screens = None):
+    """
+    Decide if a carton can be added to a container without solving the feasibility MIP when possible.
+    Args:
+        carton (dict): Carton to add.
+        container (dict): Container, with its remaining 'free_space' volume.
+        assigned (list): Cartons currently assigned to the container.
+        solution (list): Current placement of the assigned cartons.
+        screens (dict, optional): ContainerScreens kept across the cartons of a binsearch round, see extreme_point_placement.
+    Returns:
+        tuple: (fits, entry) where fits is False if the carton cannot be added, True if it was placed by the
+        extreme point heuristic, with entry its solution entry, and None if only the MIP can decide.
+    """
+    if carton['weight'] > container['weight'] - sum(other['weight'] for other in assigned):
+        return False, None
+    if carton['length'] * carton['width'] * carton['height'] > container['free_space']:
+        return False, None
+    if not fits_rotation(carton, container):
+        return False, None
+    # the heuristic needs the positions of every assigned carton
+    if len(solution) == len(assigned):
+        entry = extreme_point_placement(carton, container, solution, screens)
+        if entry is not None:
+            return True, entry
+    return None, None
@@ -0,0 +1,194 @@
+#LOCAL SEARCH OVER A PACKED SOLUTION, SIMULATED ANNEALING WITH A TABU LIST. WORKS ON THE ULD AND PACKAGE STRUCTURES ONLY, NO SOLVER NEEDED
+import math
+import random
+import time
+from utils.structs import Rotation
+
+
+#Get the state of a Package that the moves change
+def packageState(package):
+    return (package.ULD, package.position, package.rotation, package.getDimensions())
+
+
+class LocalSearch:
+
+    #Initialisation Function. The temperature falls geometrically from startTemperature, by default a tenth of the cost of the cheapest Economy Package,
+    #to endTemperature over the time limit. Packages moved by an accepted move are tabu for tabuTenure moves, pivots is the number of points tried to place a package
+    def __init__(self, packages, ulds, ledger, timeLimit = 10, seed = None, startTemperature = None, endTemperature = 1, tabuTenure = 20, pivots = 6):
+        self.packages = packages
+        self.ulds = ulds
+        self.ledger = ledger
+        self.timeLimit = timeLimit
+        self.random = random.Random(seed)
+        economy = [package.cost for package in packages if package.priority != "Priority"]
+        self.startTemperature = startTemperature if startTemperature is not None else max(1, min(economy, default = 10)/10)
+        self.endTemperature = min(endTemperature, self.startTemperature)
+        self.tabuTenure = tabuTenure
+        self.pivots = pivots
+        self.uldById = {uld.id: uld for uld in ulds}
+        self.unpacked = [package for package in packages if str(package.ULD) == '-1']
+        self.tabu = {}          # package -> move count until which it is tabu
+        self.moves = 0
+        self.accepted = {}      # move -> number of accepted moves of it
+
+    #Get the points a package is tried at in a ULD: the origin and the corners of random packages, addBox projects the package towards the origin from there
+    def getPivots(self, uld):
+        pivots = [(0,0,0)]
+        for package in self.random.sample(uld.packages, min(self.pivots, len(uld.packages))):
+            [x, y, z] = package.position
+            [dx, dy, dz] = package.getDimensions()
+            pivots.append(self.random.choice(((x+dx,y,z), (x,y+dy,z), (x,y,z+dz))))
+        return pivots
+
+    #Find where a package would go in a ULD, trying its pivots with the rotations given in random order. Returns the pivot, the cost delta and
+    #the rotation of the first feasible placement, or None
+    def findPlacement(self, uld, package, rotations = Rotation.ALL, skip = None):
+        rotations = list(rotations)
+        self.random.shuffle(rotations)
+        for pivot in self.getPivots(uld):
+            feasible, delta, placement = uld.evaluateInsert(package, pivot, rotations, skip)
+            if feasible:
+                return pivot, delta, placement[1]
+        return None
+
+    #Put a package back to a state of packageState, unregistering it from the ULD it is in
+    def restore(self, package, state):
+        if str(package.ULD) != '-1':
+            self.uldById[package.ULD].removePackage(package)
+        [uldId, position, rotation, dimensions] = state
+        package.rotation = rotation
+        package.dimensions = dimensions
+        if str(uldId) != '-1':
+            package.position = position
+            self.uldById[uldId].insertPackage(package)
+
+    #Get a random packed package of a random ULD
+    def pickPacked(self, economyOnly = False):
+        uld = self.random.choice(self.ulds)
+        if not uld.packages: return None, None
+        package = self.random.choice(uld.packages)
+        if economyOnly and package.priority == "Priority": return None, None
+        return uld, package
+
+    #MOVES. Every move is evaluated with the move evaluation of the ULDs without changing anything, and returns the packages it would move,
+    #the cost delta and the function making it, or None if it is not feasible. Packages only leave their place if they hold nothing up
+
+    #Insert an unpacked package into a random ULD
+    def insertMove(self):
+        if not self.unpacked: return None
+        package = self.random.choice(self.unpacked)
+        uld = self.random.choice(self.ulds)
+        found = self.findPlacement(uld, package)
+        if found is None: return None
+        pivot, delta, rotation = found
+        return [package], delta, lambda: uld.addBox(package, pivot, [rotation])
+
+    #Take an Economy package out of its ULD
+    def ejectMove(self):
+        uld, package = self.pickPacked(economyOnly = True)
+        if package is None: return None
+        feasible, delta, _ = uld.evaluateRemove(package)
+        if not feasible: return None
+        return [package], delta, lambda: uld.removePackage(package)
+
+    #Swap an unpacked package in for a packed package of the same priority and lower cost, pushing other packages out of the way
+    def swapMove(self):
+        if not self.unpacked: return None
+        package = self.random.choice(self.unpacked)
+        uld = self.random.choice(self.ulds)
+        candidates = uld.replaceCandidates(package, lpp = True)
+        if not candidates: return None
+        replaced = self.random.choice(candidates)
+        feasible, delta, _ = uld.evaluateSwap(replaced, package)
+        if not feasible: return None
+        return [package, replaced], delta, lambda: uld.tryReplace(package, replaced, lpp = True)
+
+    #Move a packed package to another ULD
+    def relocateMove(self):
+        if len(self.ulds) < 2: return None
+        uld, package = self.pickPacked()
+        if package is None: return None
+        feasible, removeDelta, _ = uld.evaluateRemove(package)
+        if not feasible: return None
+        target = self.random.choice([other for other in self.ulds if other is not uld])
+        found = self.findPlacement(target, package)
+        if found is None: return None
+        pivot, insertDelta, rotation = found
+        def apply():
+            uld.removePackage(package)
+            target.addBox(package, pivot, [rotation])
+        # leaving makes the package unplaced, so the cost it adds back is taken off again when it arrives
+        return [package], removeDelta + insertDelta - package.cost, apply
+
+    #Turn a packed package in place and project it towards the origin again
+    def rotateMove(self):
+        uld, package = self.pickPacked()
+        if package is None: return None
+        position = package.position
+        if not uld.evaluateRemove(package)[0]: return None
+        rotations = [rotation for rotation in Rotation.ALL if Rotation.AXES[rotation]((package.length,package.width,package.height)) != package.getDimensions()]
+        self.random.shuffle(rotations)
+        feasible, delta, placement = uld.evaluateInsert(package, position, rotations, skip = package)
+        if not feasible: return None
+        rotation = placement[1]
+        def apply():
+            uld.removePackage(package)
+            uld.addBox(package, position, [rotation])
+        return [package], delta, apply
+
+    moveNames = ["insert", "eject", "swap", "relocate", "rotate"]
+
+    #Take a snapshot of every package
+    def snapshot(self):
+        return [(package, packageState(package)) for package in self.packages]
+
+    #Put every package back to a snapshot, rebuilding the ULDs from it
+    def restoreSnapshot(self, snapshot):
+        for uld in self.ulds:
+            for package in list(uld.packages):
+                uld.removePackage(package)
+        for package, state in snapshot:
+            self.restore(package, state)
+        self.unpacked = [package for package in self.packages if str(package.ULD) == '-1']
+
+    #Run the search until the time limit. Moves are only made once accepted: moves that make the cost worse by delta with probability exp(-delta/temperature),
+    #moves touching a tabu package only if they reach a new best cost. The best solution found is restored at the end. Returns the best cost
+    def solve(self):
+        moves = [self.insertMove, self.ejectMove, self.swapMove, self.relocateMove, self.rotateMove]
+        start = time.time()
+        cost = self.ledger.cost
+        bestCost = cost
+        best = self.snapshot()
+        ratio = self.endTemperature/self.startTemperature
+        elapsed = 0
+        while elapsed < self.timeLimit:
+            self.moves += 1
+            if self.moves % 64 == 0:
+                elapsed = time.time() - start
+            temperature = self.startTemperature*ratio**(elapsed/self.timeLimit)
+
+            choice = self.random.randrange(len(moves))
+            result = moves[choice]()
+            if result is None: continue
+            moved, delta, apply = result
+            isTabu = any(self.tabu.get(package, 0) > self.moves for package in moved)
+            if (isTabu and cost + delta >= bestCost) or (delta > 0 and self.random.random() >= math.exp(-delta/temperature)):
+                continue
+
+            apply()
+            cost = self.ledger.cost
+            name = self.moveNames[choice]
+            self.accepted[name] = self.accepted.get(name, 0) + 1
+            for package in moved:
+                self.tabu[package] = self.moves + self.tabuTenure
+                if str(package.ULD) == '-1': self.unpacked.append(package)
+                elif package in self.unpacked: self.unpacked.remove(package)
+            if cost < bestCost:
+                bestCost = cost
+                best = self.snapshot()
+
+        if cost > bestCost:
+            self.restoreSnapshot(best)
+        elapsed = time.time() - start
+        print("Local Search: {0} moves in {1:.1f}s ({2:.0f}/s), accepted {3}, best cost {4}".format(self.moves, elapsed, self.moves/max(elapsed, 1e-9), self.accepted, bestCost))
+        return bestCost
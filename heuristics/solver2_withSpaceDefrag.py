@@ -1,6 +1,11 @@
 import math
-from utils.metrics import calculateCost
-from utils.structs import Axis, calculateEuclideanDistance
+import copy
+import time
+import multiprocessing
+from utils.metrics import CostLedger, calculateCost
+from utils.structs import Axis
+from utils.extremePoints import ExtremePointSet
+from heuristics.uldOrdering import ULDOrdering
 
 class Solver2:
 
@@ -12,6 +17,9 @@ class Solver2:
         self.economy = []
         self.takenPackages = []
         self.priorityULDs =  0
+        self.ledger = CostLedger(packages, ulds, 5000)
+        self.minSize = min((min(package.length, package.width, package.height) for package in packages), default = 0)   # smallest side of any package, see ExtremePointSet
+        self.unfitted = set()   # packages that did not fit the last time fitPackages tried them, see sortPackagesFitting
 
         for package in packages:
             if package.priority == "Priority":
@@ -21,54 +29,70 @@ class Solver2:
     
     # SORTING FUNCTIONS
     
+    # Cost functions Economy Packages can be sorted by for Assignment, the first one is the default and the others are tried by solve_multistart
+    economyKeys = [lambda x: x.cost**3/(x.getVolume()**2 + x.weight**2), lambda x: x.cost/x.getVolume(), lambda x: x.cost]
+
     # Sort Packages For Assignment. Priority Packages first, sorted by Volume and Economy Packages sorted by a cost function
-    def sortPackagesAssignment(self, packages):
+    def sortPackagesAssignment(self, packages, variant = 0):
 
         priority_packages = [p for p in packages if p.priority == "Priority"]
         non_priority_packages = [p for p in packages if p.priority != "Priority"]
         
         priority_packages.sort(key=lambda x: x.getVolume(), reverse=True)
-        non_priority_packages.sort(key=lambda x: x.cost**3/(x.getVolume()**2 + x.weight**2) , reverse=True)
+        non_priority_packages.sort(key=self.economyKeys[variant] , reverse=True)
         packages[:] = priority_packages + non_priority_packages
    
     
-    # Sort Packages for Fitting. Sort by Clustered Height-Area
+    # Sort Packages for Fitting. Sort by Clustered Height-Area, in the rotation the package was last placed in. Packages that did not fit the last time
+    # they were tried are sorted lying on their largest face, with their smallest side as height
     def sortPackagesFitting(self, packages):
-        packages.sort(key=lambda x: (math.floor(x.getDimensions()[2]/10),(x.getVolume())/(x.getDimensions()[2])), reverse=True)
+        def height(x):
+            return x.length if x in self.unfitted else x.getDimensions()[2]
+        packages.sort(key=lambda x: (math.floor(height(x)/10),(x.getVolume())/height(x)), reverse=True)
 
-    # Sort ULDs. Either Sort By Volume of Brute Force all permutations to find most optimal sorting
+    # Sort ULDs. Six ULD fleets use the tuned permutations, other fleets the topOrderings best orders of the ULD ordering engine
     permuationsAll = [[6,4,5,2,1,3],[4, 5, 6, 2, 3, 1],[6, 4, 5, 2, 3, 1],[5, 6, 4, 2, 3, 1],[4, 6, 5, 2, 3, 1],[6, 5, 4, 2, 3, 1], [5, 4, 6, 3, 2, 1], [4, 5, 6, 3, 2, 1], [6, 4, 5, 3, 2, 1], [5, 6, 4, 3, 2, 1], [4, 6, 5, 3, 2, 1], [6, 5, 4, 3, 2, 1], [5, 4, 6, 2, 1, 3], [4, 5, 6, 2, 1, 3], [6, 4, 5, 2, 1, 3], [5, 6, 4, 2, 1, 3], [4, 6, 5, 2, 1, 3], [6, 5, 4, 2, 1, 3], [5, 4, 6, 3, 1, 2], [4, 5, 6, 3, 1, 2], [6, 4, 5, 3, 1, 2], [5, 6, 4, 3, 1, 2], [4, 6, 5, 3, 1, 2], [6, 5, 4, 3, 1, 2]]
+    topOrderings = 8
     def sortULDs(self,permutation):
-        currPermutation=self.permuationsAll[permutation]
-       
         if(len(self.ulds)==6):
+            currPermutation=self.permuationsAll[permutation]
             newUld = []
             for i in range(6):
                 newUld.append(self.ulds[currPermutation[i]-1])
             self.ulds = newUld
         else:
-            self.ulds.sort(key=lambda x: x.getVolume(), reverse=True)
+            orderings = ULDOrdering(self.ulds, self.packages, self.ledger.k).orderings(self.topOrderings)
+            self.ulds = orderings[min(permutation, len(orderings)-1)]
     
     #FITTING PACKAGES
 
-    #Try to fit given packages in a ULD by sorting extreme points by Euclidean Distance and trying to fit the package in the corner
+    #Try to fit given packages in a ULD by taking extreme points in order of Euclidean Distance and trying to fit the package in the corner
     def fitPackages(self, packages, uld, corners, isassigning = 0):
         takenPackages = []
+        if not isinstance(corners, ExtremePointSet):
+            corners = ExtremePointSet(corners, uld, self.minSize)
       
+        # Packages that did not fit since the last placement. The extreme points do not change until a package is placed, so a package
+        # at least as large in every dimension as one of them cannot fit either, and one larger than the free volume never fits
+        failed = []
+        volumeLeft = uld.getVolume() - sum(package.getVolume() for package in uld.packages)
         for package in packages:            
             if str(package.ULD) == '-1': 
-                done = False
-
-                corners.sort(key=lambda corner: calculateEuclideanDistance(corner)) 
-                for corner in corners:
-                    if uld.addBox(package, corner):
-                        # Remove this corner and add the other 7 new corners
-                        corners.remove(corner)
-                        new_corners = uld.getNewCorners(package)
-                        corners.extend(new_corners)                        
-                        takenPackages.append(package)
-                        done = True
-                        break
+                dimensions = (package.length, package.width, package.height)
+                if package.getVolume() > volumeLeft or any(all(f <= d for f, d in zip(other, dimensions)) for other in failed):
+                    # A skipped package counts as tried whenever a placement would have been tried, i.e. with corners left and weight to spare
+                    if len(corners) and uld.weightLeft() >= package.weight: self.unfitted.add(package)
+                    continue
+                # The used corner is consumed and the new corners of the package are added
+                if corners.place(uld, package):
+                    takenPackages.append(package)
+                    self.unfitted.discard(package)
+                    volumeLeft -= package.getVolume()
+                    failed = []
+                elif uld.weightLeft() >= package.weight:
+                    if len(corners): self.unfitted.add(package)
+                    failed = [other for other in failed if not all(d <= f for d, f in zip(dimensions, other))]
+                    failed.append(dimensions)
 
         print(len(takenPackages))        
         return corners, takenPackages
@@ -87,13 +111,15 @@ class Solver2:
             for unpacked_package in packages:
                 if str(unpacked_package.ULD) == '-1':
                     for jj in range(ii+1):
-                        ulds[jj].calculatePushLimit()
-                        for poss_replace in ulds[jj].packages:
+                        candidates = ulds[jj].replaceSequence(unpacked_package)
+                        if candidates: ulds[jj].calculatePushLimit()
+                        for poss_replace in candidates:
                             if(ulds[jj].inflate_and_replace(unpacked_package,poss_replace)):
+                                self.unfitted.discard(unpacked_package)
                                 if(takenPackages.count(poss_replace) > 0):
                                     takenPackages.remove(poss_replace)
                                 takenPackages.append(unpacked_package)
-                                cornermap[uld.id] = ulds[jj].recalculate_corners()
+                                cornermap[uld.id] = ExtremePointSet(ulds[jj].recalculate_corners(), ulds[jj], self.minSize)
                                 done = True
                                 break
                         if done:
@@ -150,8 +176,8 @@ class Solver2:
             for package in uld.packages:
                 for axis in Axis.ALL:
                     if uld.project(package,axis) != -1:
-                        package.position[axis] = uld.project(package,axis)
-        cost = calculateCost(self.packages,self.ulds,5000)
+                        uld.movePackage(package, axis, uld.project(package,axis))
+        cost = self.ledger.cost
         oldCost = 10000000000
         while cost != oldCost:
             oldCost = cost
@@ -160,8 +186,9 @@ class Solver2:
                 if str(unpacked_package.ULD) == '-1':
                     done = False
                     for jj in range(len(self.ulds)):
-                        self.ulds[jj].calculatePushLimit()
-                        for poss_replace in self.ulds[jj].packages:
+                        candidates = self.ulds[jj].replaceSequence(unpacked_package)
+                        if candidates: self.ulds[jj].calculatePushLimit()
+                        for poss_replace in candidates:
                             if(self.ulds[jj].inflate_and_replace(unpacked_package,poss_replace)):
                             
                                 done = True
@@ -171,23 +198,21 @@ class Solver2:
 
             #Projecting Packages
             for uld in self.ulds:
-                for axis in Axis.ALL:
-                    uld.packages.sort(key=lambda x: x.position[axis])
-                    for package in uld.packages:
-                        if uld.projectFinal(package,axis) != -1:
-                            package.position[axis] = uld.projectFinal(package,axis)
+                uld.projectAll()
 
-            cost = calculateCost(self.packages,self.ulds,5000)
+            cost = self.ledger.cost
 
     
 
-    def solve(self):
+    #Run the heuristic for a ULD permutation (index in permuationsAll) and Economy Package order (index in economyKeys)
+    def solve(self, permutation = 0, variant = 0):
+        self.unfitted = set()
         
         #Sort the packages in the order we want to assign them
-        self.sortPackagesAssignment(self.packages)
+        self.sortPackagesAssignment(self.packages, variant)
         
         #Sort ULDS in appropriate Order
-        self.sortULDs(0)
+        self.sortULDs(permutation)
 
         #Assign Packages to Priority ULDs
         self.assignPackagesPriority()
@@ -195,7 +220,7 @@ class Solver2:
         #CornerMap maintains list of extreme points of each ULDs, initialised from origin [0,0,0]
         cornermap = {}
         for uld in self.ulds:
-            cornermap[uld.id] = [[0, 0, 0]]
+            cornermap[uld.id] = ExtremePointSet([(0, 0, 0)], minSize = self.minSize)
 
         #Assigned Packages are fitted in the ULDs sorted by the fitting order
         self.sortPackagesFitting(self.takenPackages)
@@ -217,3 +242,73 @@ class Solver2:
         #Applying Space Defragmentation and Projection 
         self.defragAndProject()
         
+
+
+    #MULTISTART
+
+    #Run the heuristic for several (ULD permutation, Economy Package order) starts, each on its own deep copy of the packages and ULDs,
+    #in a pool of worker processes. The start with the lowest calculateCost is copied onto the packages and ULDs of the solver, ties going to
+    #the earlier start. With a budget in seconds, starts not finished when it runs out are dropped, once at least one start finished
+    def solve_multistart(self, starts = None, workers = None, budget = None, k = 5000):
+        if starts is None:
+            if len(self.ulds) == 6:
+                permutations = range(len(self.permuationsAll))
+            else:
+                permutations = range(len(ULDOrdering(self.ulds, self.packages, k).orderings(self.topOrderings)))
+            starts = [(permutation, variant) for variant in range(len(self.economyKeys)) for permutation in permutations]
+        workers = workers or multiprocessing.cpu_count()
+        deadline = None if budget is None else time.time() + budget
+        finished = {}
+
+        if workers == 1:
+            for index, (permutation, variant) in enumerate(starts):
+                if finished and deadline is not None and time.time() >= deadline:
+                    break
+                finished[index] = runStart(self.packages, self.ulds, permutation, variant, k)
+        else:
+            with multiprocessing.Pool(min(workers, len(starts))) as pool:
+                results = [pool.apply_async(runStart, (self.packages, self.ulds, permutation, variant, k)) for permutation, variant in starts]
+                for index, result in enumerate(results):
+                    try:
+                        timeout = None if deadline is None or not finished else max(0, deadline - time.time())
+                        finished[index] = result.get(timeout)
+                    except multiprocessing.TimeoutError:
+                        break
+                for index, result in enumerate(results):
+                    if index not in finished and result.ready():
+                        finished[index] = result.get()
+                # leaving the pool terminates the starts still running
+
+        index = min(finished, key=lambda index: (finished[index][0], index))
+        cost, packages, ulds, priorityULDs = finished[index]
+        self.adopt(packages, ulds)
+        self.priorityULDs = priorityULDs
+        print("Multistart: ", len(finished), "of", len(starts), "starts finished, best start", starts[index], "cost", cost)
+        return cost
+
+    #Copy the placement of solved copies of the packages and ULDs onto the packages and ULDs of the solver, keeping the ULD order of the copies
+    def adopt(self, packages, ulds):
+        packageById = {package.id: package for package in self.packages}
+        uldById = {uld.id: uld for uld in self.ulds}
+        for solved in packages:
+            package = packageById[solved.id]
+            package.ULD = solved.ULD
+            package.position = tuple(solved.position)
+            package.rotation = -1
+            package.dimensions = solved.getDimensions()
+        ordered = []
+        for solved in ulds:
+            uld = uldById[solved.id]
+            uld.packages = [packageById[package.id] for package in solved.packages]
+            uld.rebuildIndex()
+            uld.isPriority = solved.isPriority
+            ordered.append(uld)
+        self.ulds = ordered
+
+
+#Run one start of solve_multistart on a deep copy of the packages and ULDs, at module level so worker processes can run it
+def runStart(packages, ulds, permutation, variant, k):
+    packages, ulds = copy.deepcopy((packages, ulds))
+    solver = Solver2(packages, ulds)
+    solver.solve(permutation, variant)
+    return calculateCost(packages, ulds, k), packages, solver.ulds, solver.priorityULDs
@@ -0,0 +1,72 @@
+#ULD ORDERING ENGINE, GENERATES ORDERS OF A FLEET OF ANY SIZE FOR THE HEURISTIC AND RANKS THEM WITH A CHEAP VOLUME/WEIGHT BOUND
+
+
+#Type of a ULD, ULDs of the same type are interchangeable and only the order of the types matters
+def uldType(uld):
+    return (uld.length, uld.width, uld.height, uld.weight_limit)
+
+
+class ULDOrdering:
+
+    #Initialisation Function. Packages are taken in the order the heuristic assigns them, fill is the fraction of the volume of a ULD the bound assumes usable
+    def __init__(self, ulds, packages, k = 5000, fill = 0.8):
+        self.k = k
+        self.fill = fill
+        self.types = []     # ULD types in order of first appearance
+        self.members = {}   # type -> ULDs of the type, in input order
+        for uld in ulds:
+            t = uldType(uld)
+            if t not in self.members:
+                self.members[t] = []
+                self.types.append(t)
+            self.members[t].append(uld)
+        self.packages = [p for p in packages if p.priority == "Priority"] + [p for p in packages if p.priority != "Priority"]
+
+    #Fill one ULD of a type with the packages left, in order, as long as their volume and weight fit. Returns the packages left and if a Priority Package was taken
+    def fillULD(self, t, packages):
+        volume = t[0]*t[1]*t[2]*self.fill
+        weight = t[3]
+        left = []
+        priority = False
+        for package in packages:
+            if package.getVolume() <= volume and package.weight <= weight:
+                volume -= package.getVolume()
+                weight -= package.weight
+                priority = priority or package.priority == "Priority"
+            else:
+                left.append(package)
+        return left, priority
+
+    #Estimated cost of a sequence of ULD types: cost of the packages the ULDs do not take plus k for every ULD holding a Priority Package
+    def bound(self, sequence):
+        packages = self.packages
+        cost = 0
+        for t in sequence:
+            packages, priority = self.fillULD(t, packages)
+            if priority: cost += self.k
+        return cost + sum(package.cost for package in packages)
+
+    #Get up to topK orders of the ULDs, lowest bound first. Type sequences are built one ULD at a time keeping the beamWidth best prefixes,
+    #which enumerates every distinct sequence of small fleets and keeps large fleets from blowing up
+    def orderings(self, topK = 8, beamWidth = 64):
+        counts = {t: len(self.members[t]) for t in self.types}
+        size = sum(counts.values())
+        # state: (bound of the prefix, prefix, packages left, cost of its priority ULDs)
+        beam = [(sum(package.cost for package in self.packages), (), self.packages, 0)]
+        for _ in range(size):
+            extended = []
+            for _, prefix, packages, priorityCost in beam:
+                for t in self.types:
+                    if prefix.count(t) == counts[t]: continue
+                    left, priority = self.fillULD(t, packages)
+                    cost = priorityCost + (self.k if priority else 0)
+                    extended.append((cost + sum(package.cost for package in left), prefix + (t,), left, cost))
+            # ties go to the larger ULDs first, as in the volume order, then to the order of the types, keeping the result deterministic
+            extended.sort(key=lambda state: (state[0], [(-t[0]*t[1]*t[2], self.types.index(t)) for t in state[1]]))
+            beam = extended[:max(beamWidth, topK)]
+
+        orderings = []
+        for _, sequence, _, _ in beam[:topK]:
+            members = {t: iter(self.members[t]) for t in self.types}
+            orderings.append([next(members[t]) for t in sequence])
+        return orderings
@@ -1,122 +1,131 @@
 import csv
 from heuristics.solver2_withSpaceDefrag import Solver2
+from heuristics.localSearch import LocalSearch
 from utils.generateOutput import generateOutput
 from utils.inputGetter import getPackages, getULD
 from utils.cartons import cartons
 from MIP1.carton_to_package import sol_to_package
 from utils.containers import containers, containers_specific, containers_specific_multiple
 from MIP1.model import all_swaps as solver, complete_LPP
+from MIP1.parallel_refine import refine_parallel
+from MIP1.lns import LargeNeighbourhoodSearch
 from MIP1.package_to_carton import get_from_greedy, get_specific_from_greedy, get_specific_from_greedy_multi, package_csv_to_sol
 from MIP2.binsearch import binsearch
-from utils.metrics import calculateCost, metrics, uldPlot
+from utils.metrics import metrics, uldPlot
 from utils.updatePackages import updatePackages
+from utils.scheduler import StageScheduler
 import sys
 import time
 
 
 
 
-def run_all(ulds, packages,timeout = 300, stabilityThreshold = 0.5, k = 5000):
+def run_all(ulds, packages,timeout = 300, stabilityThreshold = 0.5, k = 5000, parallel = False, lns = False, localSearch = 0):
 
     """
     Executes the optimization process for loading packages into ULDs (Unit Load Devices).
     Args:
         ulds (list): List of ULD objects representing the containers.
         packages (list): List of package objects to be loaded into ULDs.
-        timeout (int, optional): Total time allowed for the optimization process. Defaults to 300 seconds.
+        timeout (int, optional): Total wall clock time allowed for the optimization process. Defaults to 300 seconds.
         stabilityThreshold (float, optional): Threshold for stability in the optimization process. Defaults to 0.5.
         k (int, optional): Parameter for the cost calculation. Defaults to 5000.
+        parallel (bool, optional): Run all_swaps on the last ULDs at the same time in separate processes, each with
+            all of the time left and its own share of the unassigned packages. Defaults to False.
+        lns (bool, optional): Spend the second half of the time left after binsearch on a LargeNeighbourhoodSearch
+            instead of all_swaps. Defaults to False.
+        localSearch (float, optional): Seconds of LocalSearch run on the heuristic solution before binsearch, it needs no
+            solver. Defaults to 0.
     Returns:
         float: The final cost after the optimization process.
-    The function performs the following steps:
-    1. Initializes the solver with the given packages and ULDs.
-    2. Updates the packages and generates the initial output.
-    3. Calculates and prints the initial metrics.
-    4. Performs a binary search optimization if the initial time split is greater than 0.
+    The function performs the following steps, each as a stage of a StageScheduler that owns the deadline:
+    1. Initializes the solver with the given packages and ULDs and solves the heuristic.
+    2. Updates the packages until the cost stabilizes and keeps the result as the incumbent, written to output.csv.
+    3. Runs the LocalSearch for up to localSearch seconds if set, then calculates and prints the initial metrics.
+    4. Performs a binary search optimization with a share of the time left, if the budget allows it.
     5. Iteratively updates the packages and recalculates the cost until it stabilizes.
-    6. If the remaining time is sufficient, performs further optimization on specific ULDs.
-    7. Generates the final output and returns the final cost.
+    6. Runs all_swaps on the last ULDs, each with an equal share of the time left, while time remains. In parallel
+       mode all of them run at once until the same deadline, set by the time left (see refine_parallel).
+    7. With lns set, runs a LargeNeighbourhoodSearch until the deadline and prints its improvement trace.
+    8. Puts the incumbent back if the last stages made the solution worse and returns its cost. output.csv
+       holds the best solution found at every point, so the process can be stopped at the deadline.
     """
 
+    scheduler = StageScheduler(timeout)
 
-    solver2 = Solver2(packages,ulds)
-    solver2.solve()
-
-    updatePackages(packages,packages,ulds)
-    generateOutput(packages)
+    def settle():
+        # update the packages until the cost is stable or the deadline is reached
+        cost = ledger.cost
+        oldCost = 10000000000
+        while cost != oldCost and scheduler.remaining() > 0:
+            oldCost = cost
+            updatePackages(packages,packages,ulds)
+            cost = ledger.cost
+            print(cost,oldCost)
+        scheduler.offer(packages, ulds, cost)
+        return cost
 
+    solver2 = Solver2(packages,ulds)
+    scheduler.run("heuristic", solver2.solve)
+    ledger = solver2.ledger
+
+    scheduler.run("settle", settle)
+    if localSearch > 0:
+        search = LocalSearch(packages, ulds, ledger, timeLimit = min(localSearch, scheduler.budget(1, scheduler.reserve("settle"))))
+        scheduler.run("local search", search.solve)
+        scheduler.run("settle", settle)
     metrics(packages,ulds,k)
-    cartonss = cartons()
-    containerss = containers()
-    cost = calculateCost(packages,ulds,5000)
-    oldCost = 10000000000
-    while cost != oldCost:
-        oldCost = cost
-        updatePackages(packages,packages,ulds)
-        cost = calculateCost(packages,ulds,5000)
-        print(cost,oldCost)
-    time_split_1 = min(100,timeout/5)
-    bin_timeout = 5
-    if time_split_1 > 0:
-        binsearchSolution = binsearch(packageArray=packages, uldArray=ulds,timeout=bin_timeout, time_split_1=time_split_1)
-        newPackages = sol_to_package(binsearchSolution)
-
-
-        updatePackages(packages,newPackages,ulds)  
-        generateOutput(packages)
 
+    # the rest of the time is split between binsearch and all_swaps, binsearch takes a fifth of it up to 100s
+    time_split_1 = min(100, scheduler.budget(1/5, scheduler.reserve("settle")))
+    bin_timeout = min(5, time_split_1)
+    if time_split_1 > 1:
+        binsearchSolution = scheduler.run("binsearch", binsearch, packageArray=packages, uldArray=ulds,timeout=bin_timeout, time_split_1=time_split_1, budget=time_split_1)
+        newPackages = sol_to_package(binsearchSolution)
+        updatePackages(packages,newPackages,ulds)
+        scheduler.run("settle", settle)
         metrics(packages,ulds,k)
         # uldPlot(ulds)
-    solution = []
-    time_split_2 = timeout - time_split_1
-    cost = calculateCost(packages,ulds,5000)
-    oldCost = 10000000000
-    while cost != oldCost:
-        oldCost = cost
-        updatePackages(packages,packages,ulds)
-        cost = calculateCost(packages,ulds,5000)
-        print(cost,oldCost)
-    if time_split_2 > 2:
-        num_uld = 2
-        if time_split_2 >= 600:
-            num_uld = 3
-        if time_split_2 >= 1200:
-            num_uld = 4
-        if time_split_2 >= 1800:
-            num_uld = 5
-        if time_split_2 >= 2400:
-            num_uld = 6
-
-        for uld in reversed(ulds[len(ulds)-num_uld:]):
+
+    # one more ULD for every 600s left, up to all of them. The time left is split again before every ULD, so a stage that
+    # overruns its budget is paid for by the later ones
+    num_uld = min(len(ulds), 2 + int(scheduler.remaining()//600))
+    lnsReserve = scheduler.remaining()/2 if lns else 0
+    if parallel:
+        # the ULDs only share the unassigned packages, refine_parallel splits them and solves all ULDs at once. Its deadline covers
+        # starting the workers and building the models, the worst overrun so far is held back for the rest as in the sequential case
+        budget = scheduler.budget(1, scheduler.reserve("settle") + lnsReserve) - scheduler.overrun("all_swaps")
+        if budget > 2:
+            solution = scheduler.run("all_swaps", refine_parallel, packages, ulds[len(ulds)-num_uld:], timeout=budget, budget=budget)
+            updatePackages(packages,sol_to_package(solution),ulds)
+            scheduler.run("settle", settle)
+    else:
+        for left, uld in enumerate(reversed(ulds[len(ulds)-num_uld:])):
+            # the time limit of all_swaps does not cover building its model, the worst overrun so far is held back for it
+            budget = scheduler.budget(1/(num_uld-left), scheduler.reserve("settle") + lnsReserve) - scheduler.overrun("all_swaps")
+            if budget <= 2:
+                break
             init,cartonss,assigned_solutions,_ = get_specific_from_greedy(uld.id,packageArray=packages)
             containerss = containers_specific(uld.id)
-            solution = solver(cartons=cartonss, containers=containerss, init=init, assigned_solutions=assigned_solutions,timeout=time_split_2//num_uld)
-            temp = sol_to_package(solution)
-            updatePackages(packages,temp,ulds)
-            cost = calculateCost(packages,ulds,5000)
-            oldCost = 10000000000
-            while cost != oldCost:
-                oldCost = cost
-                updatePackages(packages,packages,ulds)
-                cost = calculateCost(packages,ulds,5000)
-                print(cost,oldCost)
-
-    generateOutput(sol_to_package(solution))
-    finalsol = sol_to_package(solution)
-
-
-    updatePackages(packages,finalsol,ulds)
-        
-    cost = calculateCost(packages,ulds,5000)
-    oldCost = 10000000000
-    while cost != oldCost:
-        oldCost = cost
-        updatePackages(packages,packages,ulds)
-        cost = calculateCost(packages,ulds,5000)
-        print(cost,oldCost)
+            solution = scheduler.run("all_swaps", solver, cartons=cartonss, containers=containerss, init=init, assigned_solutions=assigned_solutions,timeout=budget, budget=budget)
+            updatePackages(packages,sol_to_package(solution),ulds)
+            scheduler.run("settle", settle)
+
+    if lns:
+        budget = scheduler.budget(1, scheduler.reserve("settle"))
+        if budget > 2:
+            search = LargeNeighbourhoodSearch(packages, ulds, ledger)
+            trace = scheduler.run("lns", search.run, budget)
+            print("LNS improvement trace: ", [(round(elapsed, 1), cost, name) for elapsed, cost, name in trace])
+            scheduler.run("settle", settle)
+
+    # the incumbent is put back as it was written to output.csv, so the cost reported is the one of that file
+    scheduler.restore(ulds, ledger.cost)
+    cost = ledger.cost
     print("----------------------------------------------------------------------------")
     print("Successfully Ran the Optimization Process, check output.csv for the results")
     print("Final Cost: ",cost)
+    print("Time spent per stage: ", {name: round(spent, 1) for name, spent in scheduler.spent.items()})
     print("----------------------------------------------------------------------------")
     return cost
 
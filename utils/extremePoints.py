@@ -0,0 +1,134 @@
+import heapq
+from utils.structs import calculateEuclideanDistance
+
+#EXTREME POINT MANAGER, KEEPS THE CANDIDATE CORNERS OF A ULD IN A HEAP ORDERED BY DISTANCE FROM THE ORIGIN. A POINT IS DROPPED ONCE NO PACKAGE
+#CAN BE PLACED THERE ANY MORE: EVERY PACKAGE PLACED AT A POINT COVERS THE CUBE OF SIDE minSize THERE, SO A POINT WHOSE CUBE LEAVES THE ULD OR
+#OVERLAPS A PACKAGE IS DEAD
+
+
+#Check if a point lies on or beyond the far faces of the ULD, or closer to them than size, where no package of at least that size can be placed
+def isOutside(uld, point, size = 0):
+    if size:
+        return point[0] + size > uld.length or point[1] + size > uld.width or point[2] + size > uld.height
+    return point[0] >= uld.length or point[1] >= uld.width or point[2] >= uld.height
+
+#Check if a point lies inside a package, or with size given, if the package overlaps the cube of that side at the point.
+#Any box of at least that size placed there would intersect it
+def isInside(package, point, size = 0):
+    [x, y, z] = package.position
+    [dx, dy, dz] = package.getDimensions()
+    if size:
+        return (x < point[0] + size and point[0] < x + dx and y < point[1] + size and point[1] < y + dy and
+                z < point[2] + size and point[2] < z + dz)
+    return x <= point[0] < x + dx and y <= point[1] < y + dy and z <= point[2] < z + dz
+
+#Check if a point is occupied by any package of the ULD, using its spatial index
+def isOccupied(uld, point, size = 0):
+    return any(isInside(package, point, size) for package in uld.index.query(point, (size or 1,)*3))
+
+
+class ExtremePointSet:
+
+    #Initialisation Function, points outside the ULD or occupied by its packages are dropped if a ULD is given. minSize is the smallest
+    #dimension of any package that will be placed, 0 if it is not known
+    def __init__(self, points = (), uld = None, minSize = 0):
+        self.heap = []      # heap of (distance, insertion order, point), ties are broken by insertion order
+        self.entries = {}   # point -> its live heap entry, entries missing here are stale in the heap
+        self.counter = 0
+        self.minSize = minSize
+        self.extend(points, uld)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, point):
+        return tuple(point) in self.entries
+
+    #Iterate over the points in increasing distance from the origin
+    def __iter__(self):
+        return iter([entry[2] for entry in sorted(self.entries.values())])
+
+    #Add a point if it is new and can still host a package
+    def add(self, point, uld = None):
+        point = tuple(point)
+        if point in self.entries:
+            return False
+        if uld is not None and (isOutside(uld, point, self.minSize) or isOccupied(uld, point, self.minSize)):
+            return False
+        entry = (calculateEuclideanDistance(point), self.counter, point)
+        self.counter += 1
+        self.entries[point] = entry
+        heapq.heappush(self.heap, entry)
+        return True
+
+    def extend(self, points, uld = None):
+        for point in points:
+            self.add(point, uld)
+
+    #Remove a point, its heap entry is dropped lazily
+    def discard(self, point):
+        self.entries.pop(tuple(point), None)
+        if len(self.heap) > 2*len(self.entries) + 16:
+            self.heap = list(self.entries.values())
+            heapq.heapify(self.heap)
+
+    #Remove all points that a newly placed package now occupies
+    def pruneOccupied(self, package):
+        for point in [point for point in self.entries if isInside(package, point, self.minSize)]:
+            self.discard(point)
+
+    #Find the closest point that fits a package, leaving the ULD and the points as they were. The package keeps the position and rotation
+    #it would get there. Returns the point, or None if no point fits it
+    def find(self, uld, package, minOverlapReq = None):
+        if uld.weightLeft() < package.weight:
+            return None
+        heap = self.heap
+        entries = self.entries
+        tried = []
+        found = None
+        while heap:
+            entry = heapq.heappop(heap)
+            if entries.get(entry[2]) is not entry: continue
+            tried.append(entry)
+            if uld.addBox(package, entry[2], minOverlapReq = minOverlapReq):
+                found = entry[2]
+                break
+        for entry in tried:
+            heapq.heappush(heap, entry)
+
+        if found is not None:
+            state = (package.position, package.rotation, package.getDimensions())
+            uld.removePackage(package)
+            [package.position, package.rotation, package.dimensions] = state
+        return found
+
+    #Try to place a package at the closest point that fits it. On success the point is consumed and the new corners of the package are added.
+    #With minOverlapReq set, only stable placements are accepted, see ULD.addBoxStable
+    def place(self, uld, package, minOverlapReq = None):
+        if uld.weightLeft() < package.weight:
+            return False
+        heap = self.heap
+        entries = self.entries
+        tried = []
+        placed = None
+        while heap:
+            entry = heapq.heappop(heap)
+            if entries.get(entry[2]) is not entry: continue
+            if uld.addBox(package, entry[2], minOverlapReq = minOverlapReq):
+                placed = entry[2]
+                break
+            tried.append(entry)
+
+        # tried entries were popped in order, so they form a valid heap on their own
+        if not heap:
+            self.heap = tried
+        else:
+            for entry in tried:
+                heapq.heappush(heap, entry)
+
+        if placed is None:
+            return False
+        self.discard(placed)
+        self.pruneOccupied(package)
+        self.extend(uld.getNewCorners(package), uld)
+        return True
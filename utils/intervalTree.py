@@ -0,0 +1,71 @@
+#SEGMENT TREE OVER THE SORTED COORDINATES OF AN AXIS, RAISING INTERVALS TO A VALUE AND ANSWERING THE MAXIMUM OVER THE INTERVALS OVERLAPPING A QUERY
+
+
+class MaxIntervalTree:
+
+    #Initialisation Function for the tree over the given coordinates, every interval between two consecutive coordinates is a leaf
+    def __init__(self, coordinates):
+        self.coordinates = sorted(set(coordinates))
+        self.rank = {c: i for i, c in enumerate(self.coordinates)}
+        self.size = 1
+        while self.size < len(self.coordinates): self.size *= 2
+        self.best = [0]*(2*self.size)   # maximum raised anywhere within the node
+        self.tag = [0]*(2*self.size)    # maximum raised over the whole node
+
+    #Raise every point of the interval [low, high) to at least value
+    def raiseInterval(self, low, high, value):
+        l = self.rank[low] + self.size
+        r = self.rank[high] + self.size
+        if l >= r: return
+        best = self.best
+        tag = self.tag
+        first, last = l >> 1, (r-1) >> 1
+        while l < r:
+            if l & 1:
+                if best[l] < value: best[l] = value
+                if tag[l] < value: tag[l] = value
+                l += 1
+            if r & 1:
+                r -= 1
+                if best[r] < value: best[r] = value
+                if tag[r] < value: tag[r] = value
+            l >>= 1
+            r >>= 1
+        # nodes covering part of the interval all lie above its first and last leaves, the two paths join below the root
+        while first != last:
+            if best[first] < value: best[first] = value
+            if best[last] < value: best[last] = value
+            first >>= 1
+            last >>= 1
+        while first:
+            if best[first] < value: best[first] = value
+            first >>= 1
+
+    #Get the maximum value raised over any point of the interval [low, high), 0 if none
+    def query(self, low, high):
+        l = self.rank[low] + self.size
+        r = self.rank[high] + self.size
+        if l >= r: return 0
+        best = self.best
+        tag = self.tag
+        result = 0
+        first, last = l >> 1, (r-1) >> 1
+        while l < r:
+            if l & 1:
+                if best[l] > result: result = best[l]
+                l += 1
+            if r & 1:
+                r -= 1
+                if best[r] > result: result = best[r]
+            l >>= 1
+            r >>= 1
+        # intervals raised over a node above the query cover part of it too
+        while first != last:
+            if tag[first] > result: result = tag[first]
+            if tag[last] > result: result = tag[last]
+            first >>= 1
+            last >>= 1
+        while first:
+            if tag[first] > result: result = tag[first]
+            first >>= 1
+        return result
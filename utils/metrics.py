@@ -73,6 +73,52 @@ def calculateCost(packages, ulds, k):
     return cost
 
 
+class CostLedger:
+    """
+    Incrementally maintained version of calculateCost.
+    The ledger attaches itself to the packages and ULDs, which report every change of a package's ULD
+    and of a ULD's isPriority flag, so the current cost is available in O(1) instead of a scan of all packages.
+    Args:
+        packages (list): A list of package objects, where each package has attributes 'ULD', 'cost' and 'ledger'.
+        ulds (list): A list of ULD objects, where each ULD has attributes 'isPriority' and 'ledger'.
+        k (int): The fixed cost added for each priority ULD.
+    """
+
+    def __init__(self, packages, ulds, k):
+        self.k = k
+        self.unassignedCost = 0
+        self.priorityULDs = 0
+        for package in packages:
+            package.ledger = self
+            if str(package.ULD) == '-1': self.unassignedCost += package.cost
+        for uld in ulds:
+            uld.ledger = self
+            if uld.isPriority: self.priorityULDs += 1
+
+    @property
+    def cost(self):
+        """
+        int: The total cost, equal to calculateCost(packages, ulds, k).
+        """
+        return self.unassignedCost + self.priorityULDs*self.k
+
+    def assign(self, package, oldULD, newULD):
+        """
+        Record a package moving from oldULD to newULD, either of which may be '-1' for unassigned.
+        """
+        wasUnassigned = str(oldULD) == '-1'
+        isUnassigned = str(newULD) == '-1'
+        if wasUnassigned and not isUnassigned: self.unassignedCost -= package.cost
+        elif isUnassigned and not wasUnassigned: self.unassignedCost += package.cost
+
+    def setPriority(self, wasPriority, isPriority):
+        """
+        Record a ULD's isPriority flag changing from wasPriority to isPriority.
+        """
+        if isPriority and not wasPriority: self.priorityULDs += 1
+        elif wasPriority and not isPriority: self.priorityULDs -= 1
+
+
 
 def metrics(packages, ulds,k):
 
@@ -116,7 +162,7 @@ def metrics(packages, ulds,k):
     print("{0} out of {1} economy packages taken".format(packagesEconomyTaken,packagesEconomy))
 
     for uld in ulds:
-        uld.checkStability()
+        uld.checkStability(verbose = True)
     
     
     cost = 0
@@ -0,0 +1,149 @@
+import numpy as np
+
+#CONTIGUOUS POSITION AND DIMENSION ARRAYS OF THE PACKAGES IN A ULD, USED TO ANSWER GEOMETRIC QUERIES IN ONE NUMPY PASS
+
+
+class PackageArrays:
+
+    #Initialisation Function, rows are stored as int32 until a non integral position or dimension shows up
+    def __init__(self, capacity = 32):
+        self.positions = np.zeros((capacity, 3), dtype=np.int32)
+        self.dims = np.zeros((capacity, 3), dtype=np.int32)
+        self.packages = []  # row -> package
+        self.rows = {}      # package -> row
+
+    def __len__(self):
+        return len(self.packages)
+
+    #Get the used part of the position and dimension arrays
+    def view(self):
+        n = len(self.packages)
+        return self.positions[:n], self.dims[:n]
+
+    #Write the current position and dimensions of a package to its row
+    def store(self, row, package):
+        position = package.position
+        dimensions = package.getDimensions()
+        if self.positions.dtype == np.int32 and any(v != int(v) for v in (*position, *dimensions)):
+            self.positions = self.positions.astype(np.float64)
+            self.dims = self.dims.astype(np.float64)
+        self.positions[row] = position
+        self.dims[row] = dimensions
+
+    def insert(self, package):
+        row = len(self.packages)
+        if row == len(self.positions):
+            self.positions = np.concatenate([self.positions, np.zeros_like(self.positions)])
+            self.dims = np.concatenate([self.dims, np.zeros_like(self.dims)])
+        self.packages.append(package)
+        self.rows[package] = row
+        self.store(row, package)
+
+    #Remove a package by moving the last row into its place
+    def remove(self, package):
+        row = self.rows.pop(package, None)
+        if row is None: return
+        last = len(self.packages) - 1
+        if row != last:
+            moved = self.packages[last]
+            self.packages[row] = moved
+            self.rows[moved] = row
+            self.positions[row] = self.positions[last]
+            self.dims[row] = self.dims[last]
+        self.packages.pop()
+
+    def update(self, package):
+        row = self.rows.get(package)
+        if row is not None:
+            self.store(row, package)
+
+    def clear(self):
+        self.packages = []
+        self.rows = {}
+
+    def rebuild(self, packages):
+        self.clear()
+        for package in packages:
+            self.insert(package)
+
+    #Check if the box [position, position+dimensions) intersects any stored package
+    def isIntersecting(self, position, dimensions):
+        P, D = self.view()
+        mask = (P[:, 0] < position[0] + dimensions[0]) & (P[:, 0] + D[:, 0] > position[0])
+        mask &= (P[:, 1] < position[1] + dimensions[1]) & (P[:, 1] + D[:, 1] > position[1])
+        mask &= (P[:, 2] < position[2] + dimensions[2]) & (P[:, 2] + D[:, 2] > position[2])
+        return bool(mask.any())
+
+    #Get the highest face along an axis of the packages fully below the box whose orthogonal faces overlap it, default if there are none
+    def project(self, position, dimensions, axis, default):
+        P, D = self.view()
+        a1 = (axis+1)%3
+        a2 = (axis+2)%3
+        top = P[:, axis] + D[:, axis]
+        mask = top <= position[axis]
+        mask &= (P[:, a1] < position[a1] + dimensions[a1]) & (P[:, a1] + D[:, a1] > position[a1])
+        mask &= (P[:, a2] < position[a2] + dimensions[a2]) & (P[:, a2] + D[:, a2] > position[a2])
+        if not mask.any(): return default
+        return max(default, top[mask].max().item())
+
+    #Get the highest face along an axis, not beyond value, of the packages whose extents along axis1 and axis2 contain value1 and value2
+    def extent(self, axis, value, axis1, value1, axis2, value2):
+        P, D = self.view()
+        top = P[:, axis] + D[:, axis]
+        mask = top <= value
+        mask &= (P[:, axis1] <= value1) & (value1 < P[:, axis1] + D[:, axis1])
+        mask &= (P[:, axis2] <= value2) & (value2 < P[:, axis2] + D[:, axis2])
+        if not mask.any(): return 0
+        return max(0, top[mask].max().item())
+
+    #Get the total base area of a package resting on the top faces of the other stored packages
+    def supportArea(self, package):
+        P, D = self.view()
+        position = package.position
+        dimensions = package.getDimensions()
+        mask = P[:, 2] + D[:, 2] == position[2]
+        row = self.rows.get(package)
+        if row is not None: mask[row] = False
+        if not mask.any(): return 0
+        P = P[mask]
+        D = D[mask]
+        ox = np.minimum(P[:, 0] + D[:, 0], position[0] + dimensions[0]) - np.maximum(P[:, 0], position[0])
+        oy = np.minimum(P[:, 1] + D[:, 1], position[1] + dimensions[1]) - np.maximum(P[:, 1], position[1])
+        return (np.maximum(ox, 0)*np.maximum(oy, 0)).sum().item()
+
+    #Evaluate a box at a pivot in several orientations in one pass, one row of dimensions per orientation. Every orientation is checked against
+    #the limits of the ULD and the stored packages, projected towards the origin along height, width and length as ULD.addBox does, and the area
+    #of its base resting on the top faces of the stored packages is summed. Returns the fit mask, the projected positions and the supported areas
+    def placements(self, pivot, dimensions, limits):
+        P, D = self.view()
+        dims = np.array(dimensions)
+        pos = np.tile(np.array(pivot), (len(dims), 1))
+        areas = np.zeros(len(dims), dtype=P.dtype)
+
+        fits = (pos + dims <= np.array(limits)).all(axis=1)
+        if not fits.any(): return fits, pos, areas
+        # only the packages within reach of the largest orientation can intersect one
+        reach = (P + D > pos[0]).all(axis=1) & (P < pos[0] + dims.max(axis=0)).all(axis=1)
+        if reach.any():
+            near = ((P[None, reach] < pos[:, None] + dims[:, None]) & (P[None, reach] + D[None, reach] > pos[:, None])).all(axis=2).any(axis=1)
+            fits &= ~near
+        if not fits.any(): return fits, pos, areas
+
+        # the fitting orientations are projected and measured, over (orientations, packages) masks of the open overlap along an axis
+        fitPos = pos[fits]
+        fitDims = dims[fits]
+        def overlap(axis):
+            return (P[None, :, axis] < fitPos[:, axis, None] + fitDims[:, axis, None]) & (P[None, :, axis] + D[None, :, axis] > fitPos[:, axis, None])
+
+        for axis in (2, 1, 0):
+            top = P[:, axis] + D[:, axis]
+            mask = (top[None, :] <= fitPos[:, axis, None]) & overlap((axis+1)%3) & overlap((axis+2)%3)
+            value = np.where(mask, top[None, :], -1).max(axis=1, initial=-1)
+            fitPos[:, axis] = np.where(value != -1, value, fitPos[:, axis])
+
+        ox = np.minimum(P[None, :, 0] + D[None, :, 0], fitPos[:, 0, None] + fitDims[:, 0, None]) - np.maximum(P[None, :, 0], fitPos[:, 0, None])
+        oy = np.minimum(P[None, :, 1] + D[None, :, 1], fitPos[:, 1, None] + fitDims[:, 1, None]) - np.maximum(P[None, :, 1], fitPos[:, 1, None])
+        resting = P[None, :, 2] + D[None, :, 2] == fitPos[:, 2, None]
+        pos[fits] = fitPos
+        areas[fits] = np.where(resting, np.maximum(ox, 0)*np.maximum(oy, 0), 0).sum(axis=1)
+        return fits, pos, areas
@@ -0,0 +1,65 @@
+#STAGE SCHEDULER OF run_all. OWNS THE GLOBAL DEADLINE, GIVES EVERY STAGE A SHARE OF THE TIME LEFT AND KEEPS THE BEST SOLUTION FOUND SO FAR
+import time
+from utils.structs import CartonPackage
+from utils.generateOutput import generateOutput
+from utils.updatePackages import snapshotPackages, restorePackages
+
+
+class StageScheduler:
+
+    #Initialisation Function, the deadline is timeout seconds of wall clock from now
+    def __init__(self, timeout):
+        self.start = time.time()
+        self.deadline = self.start + timeout
+        self.spent = {}             # stage -> wall clock seconds spent in it
+        self.longest = {}           # stage -> longest single run of it
+        self.overruns = {}          # stage -> most seconds a run of it went past its budget
+        self.incumbent = None       # best solution found so far, as CartonPackages
+        self.incumbentState = None  # exact snapshot of it, see snapshotPackages
+        self.incumbentCost = None
+
+    #Get the seconds left until the deadline
+    def remaining(self):
+        return max(0, self.deadline - time.time())
+
+    #Get the budget of a stage, its share of the time left once the time held back for the later stages is taken out
+    def budget(self, share, reserve = 0):
+        return max(0, (self.remaining() - reserve)*share)
+
+    #Get the time to hold back for one more run of a stage, the longest it took so far
+    def reserve(self, name):
+        return self.longest.get(name, 0)
+
+    #Get the most seconds a run of a stage went past its budget, for stages whose time limit does not cover all their work
+    def overrun(self, name):
+        return self.overruns.get(name, 0)
+
+    #Run a stage and account for its wall clock time, and for how far it went past its budget if given. Returns what the stage returns
+    def run(self, name, stage, *args, budget = None, **kwargs):
+        start = time.time()
+        result = stage(*args, **kwargs)
+        elapsed = time.time() - start
+        self.spent[name] = self.spent.get(name, 0) + elapsed
+        self.longest[name] = max(self.longest.get(name, 0), elapsed)
+        if budget is not None:
+            self.overruns[name] = max(self.overrun(name), elapsed - budget)
+        print("Stage {0} took {1:.1f}s, {2:.1f}s left".format(name, elapsed, self.remaining()))
+        return result
+
+    #Offer the current solution. If it beats the incumbent it becomes the incumbent and is written to output.csv right away,
+    #so the file always holds the best solution found so far. Returns if the solution was kept
+    def offer(self, packages, ulds, cost):
+        if self.incumbentCost is not None and cost >= self.incumbentCost:
+            return False
+        self.incumbent = [CartonPackage(package.id, package.ULD, package.position, package.getDimensions(), package.weight, package.cost, package.rotation) for package in packages]
+        self.incumbentState = snapshotPackages(packages, ulds)
+        self.incumbentCost = cost
+        generateOutput(list(self.incumbent))
+        return True
+
+    #Put the incumbent back into the packages and ULDs exactly as it was offered, if the current solution is worse. Returns if it was put back
+    def restore(self, ulds, cost):
+        if self.incumbentState is None or cost <= self.incumbentCost:
+            return False
+        restorePackages(self.incumbentState, ulds)
+        return True
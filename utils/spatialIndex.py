@@ -0,0 +1,84 @@
+#UNIFORM 3D GRID HASH USED BY A ULD TO ANSWER COLLISION QUERIES AGAINST NEARBY PACKAGES ONLY
+
+
+class SpatialIndex:
+
+    #Initialisation Function for an empty grid, cells are cubes of side cellSize
+    def __init__(self, cellSize = 48):
+        self.cellSize = cellSize
+        self.cells = {}         # (i,j,k) -> {package: None}, dict used as an insertion ordered set
+        self.packageCells = {}  # package -> cells it was registered in
+
+    #Get the keys of all cells touched by the box [position, position+dimensions)
+    def getCells(self, position, dimensions):
+        c = self.cellSize
+        x0 = int(position[0] // c)
+        y0 = int(position[1] // c)
+        z0 = int(position[2] // c)
+        x1 = max(x0, int((position[0] + dimensions[0] - 1) // c))
+        y1 = max(y0, int((position[1] + dimensions[1] - 1) // c))
+        z1 = max(z0, int((position[2] + dimensions[2] - 1) // c))
+        return [(i, j, k) for i in range(x0, x1 + 1) for j in range(y0, y1 + 1) for k in range(z0, z1 + 1)]
+
+    #Register a package in every cell its current box touches
+    def insert(self, package):
+        keys = self.getCells(package.position, package.getDimensions())
+        for key in keys:
+            bucket = self.cells.get(key)
+            if bucket is None:
+                bucket = self.cells[key] = {}
+            bucket[package] = None
+        self.packageCells[package] = keys
+
+    #Unregister a package from the cells it was inserted in
+    def remove(self, package):
+        keys = self.packageCells.pop(package, None)
+        if keys is None: return
+        for key in keys:
+            bucket = self.cells[key]
+            del bucket[package]
+            if not bucket: del self.cells[key]
+
+    #Re-register a package after its position or rotation changed
+    def update(self, package):
+        self.remove(package)
+        self.insert(package)
+
+    def clear(self):
+        self.cells = {}
+        self.packageCells = {}
+
+    #Rebuild the whole grid from a list of packages
+    def rebuild(self, packages):
+        self.clear()
+        for package in packages:
+            self.insert(package)
+
+    #Get the packages registered in the cells touched by a box, each package reported once
+    def query(self, position, dimensions):
+        found = {}
+        cells = self.cells
+        for key in self.getCells(position, dimensions):
+            bucket = cells.get(key)
+            if bucket: found.update(bucket)
+        return list(found)
+
+    #Check if a package intersects any package in the grid, only looking at the ones sharing a cell with it
+    def isIntersecting(self, package):
+        [x, y, z] = package.position
+        [dx, dy, dz] = package.getDimensions()
+        seen = set()
+        cells = self.cells
+        for key in self.getCells(package.position, (dx, dy, dz)):
+            bucket = cells.get(key)
+            if not bucket: continue
+            for other in bucket:
+                if other in seen: continue
+                seen.add(other)
+                [ox, oy, oz] = other.position
+                [odx, ody, odz] = other.getDimensions()
+                if (x < ox + odx and ox < x + dx and
+                    y < oy + ody and oy < y + dy and
+                    z < oz + odz and oz < z + dz):
+                    return True
+        return False
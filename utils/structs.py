@@ -1,8 +1,14 @@
 import math
+from bisect import bisect_right
+from operator import itemgetter
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import numpy as np
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from utils.spatialIndex import SpatialIndex
+from utils.intervalTree import MaxIntervalTree
+from utils.supportGraph import SupportGraph
+from utils.packageArrays import PackageArrays
 
 #CONTAIN CLASSES FOR PACKAGES AND ULDs ALONG WITH UTILITY CLASSES (ROTATION, AXIS) AND FUNCTIONS
 
@@ -20,6 +26,10 @@ def isIntersecting(package1,package2,d1,d2,x):
 
     return max(x1,x3) < min(x2,x4)
 
+#Check Intersection of two boxes given by position and dimensions
+def boxesIntersect(position1, dimensions1, position2, dimensions2):
+    return all(max(position1[x], position2[x]) < min(position1[x]+dimensions1[x], position2[x]+dimensions2[x]) for x in range(3))
+
 #Get the overlap of two rectangles
 def getOverlap(rect1,rect2):
     x1 = max(rect1[0],rect2[0])
@@ -56,6 +66,9 @@ class Rotation:
 
     ALL = [LWH,LHW,WLH,WHL,HLW,HWL]
 
+    #Lookup table picking the dimensions along each axis out of (length, width, height), indexed by Rotation
+    AXES = [itemgetter(0,1,2), itemgetter(0,2,1), itemgetter(1,0,2), itemgetter(1,2,0), itemgetter(2,0,1), itemgetter(2,1,0)]
+
  
 #Class for Axis of a package
 class Axis:
@@ -66,13 +79,24 @@ class Axis:
     ALL = [HEIGHT, WIDTH, LENGTH]
 
 
+#Get a copy of a position tuple with the coordinate along one axis replaced
+def replaceAxis(position, axis, value):
+    if axis == 0: return (value, position[1], position[2])
+    if axis == 1: return (position[0], value, position[2])
+    return (position[0], position[1], value)
+
+
 #Package Class
 class Package:
 
+    __slots__ = ("position", "_ULD", "ledger", "length", "width", "height", "weight", "id", "priority", "cost",
+                 "pqPriority", "stable", "pushLim", "_rotation", "_dimensions")
+
     #Initialisation Function for a Package
     def __init__(self, length, width, height, weight,id,priority,cost = 10000000):
-        self.position = [-1,-1,-1] #default if not placed
-        self.ULD = -1 #default when ULD not chosen
+        self.position = (-1,-1,-1) #default if not placed
+        self.ledger = None #CostLedger notified of assignment changes, if any
+        self._ULD = -1 #default when ULD not chosen
         self.length = int(length)
         self.width = int(width)
         self.height = int(height)
@@ -81,11 +105,40 @@ class Package:
         self.id = id
         self.priority = priority
         self.cost = int(cost)
-        self.rotation = Rotation.LWH
         self.pqPriority = 0
         self.stable = True
         self.pushLim = [-1,-1,-1]
-        self.dimensions = [self.length,self.width,self.height]
+        self._rotation = Rotation.LWH
+        self._dimensions = (self.length,self.width,self.height)
+
+    #ULD the Package is assigned to, -1 if none. Changes are reported to the CostLedger
+    @property
+    def ULD(self):
+        return self._ULD
+
+    @ULD.setter
+    def ULD(self, uld):
+        if self.ledger is not None: self.ledger.assign(self, self._ULD, uld)
+        self._ULD = uld
+
+    #Rotation of the Package, changing it invalidates the cached dimensions. Rotation -1 keeps the dimensions that were set directly
+    @property
+    def rotation(self):
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+        if rotation == self._rotation: return
+        self._rotation = rotation
+        if rotation != -1: self._dimensions = None
+
+    @property
+    def dimensions(self):
+        return self.getDimensions()
+
+    @dimensions.setter
+    def dimensions(self, dimensions):
+        self._dimensions = tuple(dimensions)
 
     #Get the Base Area of the Package
     def getMaxBase(self):
@@ -101,19 +154,11 @@ class Package:
         d2 = other.getDimensions()
         return (isIntersecting(self,other,d1,d2,0) and isIntersecting(self,other,d1,d2,1) and isIntersecting(self,other,d1,d2,2))
 
-    #Get Dimensions Based on Rotation
+    #Get Dimensions Based on Rotation, cached until the rotation changes
     def getDimensions(self):
-        dim = []
-        if self.rotation == -1: return self.dimensions
-        if self.rotation == Rotation.LWH: dim = [self.length,self.width,self.height]
-        if self.rotation == Rotation.WLH: dim = [self.width,self.length,self.height]
-        if self.rotation == Rotation.HLW: dim = [self.height,self.length,self.width]
-        if self.rotation == Rotation.HWL: dim = [self.height,self.width,self.length]
-        if self.rotation == Rotation.LHW: dim = [self.length,self.height,self.width]
-        if self.rotation == Rotation.WHL: dim = [self.width,self.height,self.length]
-
-        self.dimensions = dim
-
+        dim = self._dimensions
+        if dim is None:
+            dim = self._dimensions = Rotation.AXES[self._rotation]((self.length,self.width,self.height))
         return dim
     
     #Get the Center of Mass of the Package
@@ -124,16 +169,38 @@ class Package:
 #ULD CLASS   
 class ULD:
 
-    #Initialisation Function for a ULD
-    def __init__(self,length,width,height,weight_limit,id):
+    #Initialisation Function for a ULD. With vectorized set, package positions and dimensions are also kept in NumPy arrays and geometric queries run on them
+    def __init__(self,length,width,height,weight_limit,id,vectorized = False):
         self.length = int(length)
         self.width = int(width)
         self.height = int(height)
         self.weight_limit = int(weight_limit)
         self.id = id
-        self.isPriority = False
+        self.ledger = None
+        self._isPriority = False
         self.packages = []
+        self.index = SpatialIndex()
+        self.support = SupportGraph()
+        self.arrays = PackageArrays() if vectorized else None
+
+        #Change epoch, bumped on every change to the packages or their positions. Passes remember the epoch they last ran at
+        self.epoch = 0
+        self.projectedEpoch = -1
+        self.pushLimEpoch = -1
+        self.stabilityCache = None
+        self.replaceIndex = None
+        self.placementArrays = None
     
+    #Whether the ULD holds a Priority Package. Changes are reported to the CostLedger
+    @property
+    def isPriority(self):
+        return self._isPriority
+
+    @isPriority.setter
+    def isPriority(self, isPriority):
+        if self.ledger is not None: self.ledger.setPriority(self._isPriority, isPriority)
+        self._isPriority = isPriority
+
     #Get the Weight Left in the ULD before exceeding Weight Limit
     def weightLeft(self):
         curr = self.weight_limit
@@ -152,9 +219,34 @@ class ULD:
     def clearBin(self):
         for package in self.packages:
             package.ULD = -1
-            package.position = [-1,-1,-1]
+            package.position = (-1,-1,-1)
         self.packages = []
+        self.index.clear()
+        self.support.clear()
+        if self.arrays is not None: self.arrays.clear()
         self.isPriority = False
+        self.touch()
+
+    #Mark the ULD as modified so cached passes are recomputed
+    def touch(self):
+        self.epoch += 1
+
+    #Rebuild the Spatial Index and Package Arrays, to be called whenever the package list or positions are changed from outside the ULD.
+    #The Support Graph is only rebuilt once it is next queried
+    def rebuildIndex(self):
+        self.index.rebuild(self.packages)
+        self.support.invalidate()
+        if self.arrays is not None: self.arrays.rebuild(self.packages)
+        self.touch()
+
+    #Move a packed package along an axis, keeping the Spatial Index and Package Arrays in sync
+    def movePackage(self, package, axis, value):
+        if package.position[axis] == value: return
+        package.position = replaceAxis(package.position, axis, value)
+        self.index.update(package)
+        self.support.update(package)
+        if self.arrays is not None: self.arrays.update(package)
+        self.touch()
 
     #Plot the ULD packages in 3D
     def plotULD(self):
@@ -181,10 +273,13 @@ class ULD:
 
     #INSERTION
 
-    #Add a Package to the ULD
-    def addBox(self, currPackage, pivot, rotations = Rotation.ALL):
+    #Add a Package to the ULD. With minOverlapReq set, the package is only placed in an orientation that is stable with the semantics of
+    #checkStabilityPackage, see addBoxStable
+    def addBox(self, currPackage, pivot, rotations = Rotation.ALL, minOverlapReq = None):
+        if minOverlapReq is not None:
+            return self.addBoxStable(currPackage, pivot, rotations, minOverlapReq)
         prevPosition = currPackage.position
-        currPackage.position = list(pivot)
+        currPackage.position = tuple(pivot)
 
         # Check weight limits
         if self.weightLeft() < currPackage.weight:
@@ -203,26 +298,79 @@ class ULD:
             ):
                 continue
 
-	        # Check for intersections
-            if any(package.isIntersecting(currPackage) for package in self.packages):
+            # Check for intersections, only against packages sharing a grid cell
+            if self.index.isIntersecting(currPackage):
                 continue
         
             for axis in Axis.ALL:
                 project = self.project(currPackage,axis)
                 if project != -1:
-                    currPackage.position[axis] = project
+                    currPackage.position = replaceAxis(currPackage.position, axis, project)
 
-            
-            currPackage.ULD = self.id
-            self.packages.append(currPackage)
-            if(currPackage.priority == "Priority"): self.isPriority = True
+            self.insertPackage(currPackage)
             return True
         
         currPackage.position = prevPosition
         return False
-    
-    
-    
+
+    #Add a Package to the ULD in the stable orientation with the largest share of its base supported. All orientations are fitted, projected
+    #and measured against the support surface in one vectorized pass. An orientation is stable on the floor, or when at least minOverlapReq of
+    #its base is supported, or when it is supported at all and touches a wall, as in checkStabilityPackage. Ties go to the first orientation
+    def addBoxStable(self, currPackage, pivot, rotations = Rotation.ALL, minOverlapReq = 0.5):
+        if self.weightLeft() < currPackage.weight:
+            return False
+        arrays = self.arrays
+        if arrays is None:
+            # ULDs that are not vectorized keep arrays of their packages for this pass until they change
+            if self.placementArrays is None or self.placementArrays[0] != self.epoch:
+                arrays = PackageArrays()
+                arrays.rebuild(self.packages)
+                self.placementArrays = (self.epoch, arrays)
+            arrays = self.placementArrays[1]
+        dimensions = [Rotation.AXES[rotation]((currPackage.length,currPackage.width,currPackage.height)) for rotation in rotations]
+        fits, positions, areas = arrays.placements(pivot, dimensions, (self.length, self.width, self.height))
+
+        best = None
+        for i in range(len(dimensions)):
+            if not fits[i]: continue
+            [x, y, z] = positions[i].tolist()
+            [dx, dy, _] = dimensions[i]
+            ratio = 1 if z == 0 else areas[i].item()/(dx*dy)
+            if ratio == 0: continue
+            if ratio < minOverlapReq and not (x == 0 or y == 0 or x + dx == self.length or y + dy == self.width): continue
+            if best is None or ratio > best[0]:
+                best = (ratio, i)
+        if best is None:
+            return False
+
+        currPackage.rotation = rotations[best[1]]
+        currPackage.position = tuple(positions[best[1]].tolist())
+        self.insertPackage(currPackage)
+        return True
+
+    #Register a placed Package in the ULD and its indexes
+    def insertPackage(self, currPackage):
+        currPackage.ULD = self.id
+        self.packages.append(currPackage)
+        self.index.insert(currPackage)
+        self.support.insert(currPackage)
+        if self.arrays is not None: self.arrays.insert(currPackage)
+        self.touch()
+        if(currPackage.priority == "Priority"): self.isPriority = True
+
+    #Unregister a packed Package from the ULD and its indexes, leaving it unplaced. The ULD stays Priority while it holds another Priority Package
+    def removePackage(self, currPackage):
+        self.packages.remove(currPackage)
+        self.index.remove(currPackage)
+        self.support.remove(currPackage)
+        if self.arrays is not None: self.arrays.remove(currPackage)
+        self.touch()
+        currPackage.ULD = -1
+        currPackage.position = (-1,-1,-1)
+        if(currPackage.priority == "Priority"): self.isPriority = any(package.priority == "Priority" for package in self.packages)
+
+
+
     #Get the New Extreme Points of the ULD after adding a Package, by projecting 3 corners of the package along the 3 axes
     def getNewCorners(self,package):
         extreme_points = set()
@@ -250,6 +398,8 @@ class ULD:
             else:
                 raise ValueError("Invalid axis!")
 
+            if self.arrays is not None:
+                return self.arrays.extent(fd, fixed, "xyz".index(variable_axis1), var1, "xyz".index(variable_axis2), var2)
            
             max_extent =  0
 
@@ -298,17 +448,8 @@ class ULD:
     #Check if a Package is Stable in the ULD by checking overlap of its base with other packages
     def checkStabilityPackage(self, package, minOverlapReq = 0.5):
         packageDimensions = package.getDimensions()
-        packageRectangle = [package.position[0],package.position[1],package.position[0]+packageDimensions[0],package.position[1]+packageDimensions[1]]
-        packageBase = package.position[2]
         packageBaseArea = packageDimensions[0]*packageDimensions[1]
-        maxOverlap = 0
-        for otherPackage in self.packages:
-            if package == otherPackage: continue
-            otherPackageDimensions = otherPackage.getDimensions()
-            if packageBase != otherPackage.position[2] + otherPackageDimensions[2]: continue
-            otherPackageRectangle = [otherPackage.position[0],otherPackage.position[1],otherPackage.position[0]+otherPackageDimensions[0],otherPackage.position[1]+otherPackageDimensions[1]]
-            maxOverlap += getOverlap(packageRectangle,otherPackageRectangle)
-        
+        maxOverlap = self.supportGraph().supportArea(package)
         maxOverlap = maxOverlap/packageBaseArea
         if package.position[2] == 0:
             package.stable = True
@@ -330,28 +471,40 @@ class ULD:
         package.stable = True
         return True
     
-    #Get stability of the ULD by checking stability of all packages
-    def checkStability(self, minOverlapReq = 0.5, unstableAllowed = 0):    
+    #Get stability of the ULD by checking stability of all packages. The pass is cached until the ULD changes.
+    #With verbose set, intersecting packages and the number of unstable packages are also printed
+    def checkStability(self, minOverlapReq = 0.5, unstableAllowed = 0, verbose = False):
         numUnstable = 0
         totalPackages = len(self.packages)
 
-        for package in self.packages:
-            for otherPackage in self.packages:
-                if package == otherPackage: continue
-                if package.isIntersecting(otherPackage):
-                    print("Package ",package.id," is intersecting with ",otherPackage.id)
-                    print("Coordinates ",package.position)
-                    print("Dimensions ",package.getDimensions())
-                    print("Coordinates ",otherPackage.position)
-                    print("Dimensions ",otherPackage.getDimensions())
-                    
-
-        for package in self.packages:
-            if not self.checkStabilityPackage(package, minOverlapReq):
-                numUnstable+=1
-        print("ULD ",self.id," has ",numUnstable,"out of ",totalPackages," unstable packages")
+        if verbose:
+            # Only packages sharing a cell of the Spatial Index can intersect
+            for package in self.packages:
+                for otherPackage in self.index.query(package.position, package.getDimensions()):
+                    if package == otherPackage: continue
+                    if package.isIntersecting(otherPackage):
+                        print("Package ",package.id," is intersecting with ",otherPackage.id)
+                        print("Coordinates ",package.position)
+                        print("Dimensions ",package.getDimensions())
+                        print("Coordinates ",otherPackage.position)
+                        print("Dimensions ",otherPackage.getDimensions())
+
+        if self.stabilityCache is not None and self.stabilityCache[:2] == (self.epoch, minOverlapReq):
+            numUnstable = self.stabilityCache[2]
+        else:
+            for package in self.packages:
+                if not self.checkStabilityPackage(package, minOverlapReq):
+                    numUnstable+=1
+            self.stabilityCache = (self.epoch, minOverlapReq, numUnstable)
+        if verbose:
+            print("ULD ",self.id," has ",numUnstable,"out of ",totalPackages," unstable packages")
         return (numUnstable <= unstableAllowed)
 
+    #Get the Support Graph of the packages, rebuilt if it is out of date
+    def supportGraph(self):
+        if not self.support.valid: self.support.rebuild(self.packages)
+        return self.support
+
     #Get Centre of Mass of ULD by averaging the Centre of Mass of all packages
     def getLoadCenterOfMass(self):
         x = 0
@@ -370,20 +523,29 @@ class ULD:
     #PROJECT ALONG ORIGIN TO INCREASE STABILITY
 
     def project(self, package, axis = Axis.HEIGHT):
+        return self.projectBox(package.position, package.getDimensions(), axis)
+
+    #Project a box that is not registered in the ULD, ignoring skip if given. Returns the furthest end along the axis of the packages before the box
+    #that overlap it on the two other axes, -1 if there are none
+    def projectBox(self, position, dimensions, axis = Axis.HEIGHT, skip = None):
+        if self.arrays is not None and skip is None:
+            return self.arrays.project(position, dimensions, axis, -1)
         maxxx = -1
         axis1 = (axis+1)%3
         axis2 = (axis+2)%3
-        packageDimensions = package.getDimensions()
-        packageRectangle = [package.position[axis1],package.position[axis2],package.position[axis1]+packageDimensions[axis1],package.position[axis2]+packageDimensions[axis2]]
+        packageRectangle = [position[axis1],position[axis2],position[axis1]+dimensions[axis1],position[axis2]+dimensions[axis2]]
         for otherPackage in self.packages:
+            if otherPackage is skip: continue
             otherPackageDimensions = otherPackage.getDimensions()
             otherPackageRectangle = [otherPackage.position[axis1],otherPackage.position[axis2],otherPackage.position[axis1]+otherPackageDimensions[axis1],otherPackage.position[axis2]+otherPackageDimensions[axis2]]
-            if (package.position[axis] >= otherPackage.position[axis]+ otherPackageDimensions[axis]):
+            if (position[axis] >= otherPackage.position[axis]+ otherPackageDimensions[axis]):
                 if (getOverlap(packageRectangle,otherPackageRectangle) > 0):
                     maxxx = max(maxxx,otherPackage.position[axis]+otherPackageDimensions[axis])
         return maxxx    
     
     def projectFinal(self, package, axis = Axis.HEIGHT):
+        if self.arrays is not None:
+            return self.arrays.project(package.position, package.getDimensions(), axis, 0)
         maxxx = 0
         axis1 = (axis+1)%3
         axis2 = (axis+2)%3
@@ -396,12 +558,28 @@ class ULD:
                 if (getOverlap(packageRectangle,otherPackageRectangle) > 0):
                     maxxx = max(maxxx,otherPackage.position[axis]+otherPackageDimensions[axis])
         return maxxx   
+
+    #Project all packages towards the origin along each axis, returns whether any package moved.
+    #Skipped when nothing changed since the last pass that moved no package, as that pass would move nothing again
+    def projectAll(self):
+        if self.projectedEpoch == self.epoch: return False
+        epoch = self.epoch
+        for axis in Axis.ALL:
+            self.packages.sort(key=lambda x: x.position[axis])
+            for package in self.packages:
+                self.movePackage(package, axis, self.projectFinal(package,axis))
+        if self.epoch == epoch:
+            self.projectedEpoch = epoch
+            return False
+        return True
     
 
     #SPACE DEFRAGMENTATION FUNCTIONS
 
-    # Calculate the amount a package can be pushed in each direction without ever intersecting with any other package
+    # Calculate the amount a package can be pushed in each direction without ever intersecting with any other package, cached until the ULD changes
     def calculatePushLimit(self):
+        if self.pushLimEpoch == self.epoch: return
+        self.pushLimEpoch = self.epoch
         for i in range(3):
             sortedPos = []
             for j in self.packages:
@@ -426,47 +604,51 @@ class ULD:
     #Push out the packages beyond x,y,z in the ULD to make space for a new package according to their PushLim
     def pushOut(self,x,y,z):
         for i in self.packages:
-            if(i.position[0]>=x):
-                i.position[0]+= i.pushLim[0]
-            if(i.position[1]>=y):
-                i.position[1]+= i.pushLim[1]
-            if(i.position[2]>=z):
-                i.position[2]+= i.pushLim[2]
+            [px, py, pz] = i.position
+            if(px>=x):
+                px+= i.pushLim[0]
+            if(py>=y):
+                py+= i.pushLim[1]
+            if(pz>=z):
+                pz+= i.pushLim[2]
+            i.position = (px, py, pz)
     
-    #Normalize the ULD back after PushOut when finished inerting a package
+    #Normalize the ULD back after PushOut when finished inerting a package. Compacting an axis twice in a row moves nothing,
+    #so an axis is compacted again only once another axis moved a package, until all three are compacted
     def normalize(self):
-        packages = self.packages
-        moved = True
-
-        while moved:
-            moved = False
+        compacted = set()
+        axis = 0
+        while len(compacted) < 3:
+            if self.compactAxis(axis):
+                compacted = {axis}
+            else:
+                compacted.add(axis)
+            axis = (axis+1)%3
 
-            for axis in range(3):
-        
-                packages.sort(key=lambda package: package.position[axis])
-
-                for i, package in enumerate(packages):
-                    # Find the minimum position the packet can move to along the current axis
-                    min_position = 0
-
-                    for j in range(i):
-                        op = packages[j].position
-                        pp = package.position
-                        od = packages[j].getDimensions()
-                        pd = package.getDimensions()
-
-                        # Ensure no overlap: check the other two axes
-                        a1 = (axis+1)%3
-                        a2 = (axis+2)%3
-                        if(((pp[a1]+pd[a1]<=op[a1]) or (op[a1]+od[a1]<=pp[a1])) and ((pp[a2]+pd[a2]<=op[a2]) or (op[a2]+od[a2]<=pp[a2]))):
-                            continue
-                            # No overlap, update minimum position if needed
-                        min_position = max(min_position, op[axis] + od[axis])
-
-                    # Move the packet if possible
-                    if package.position[axis] > min_position:
-                        package.position[axis] = min_position
-                        moved = True
+    #Compact the packages towards the origin along an axis. Sweeping the packages in order of position, each one moves down to the furthest end
+    #of the packages before it that overlap it on either of the two other axes. The ends are kept in an interval tree per other axis. Returns if any package moved
+    def compactAxis(self, axis):
+        packages = self.packages
+        packages.sort(key=lambda package: package.position[axis])
+        a1 = (axis+1)%3
+        a2 = (axis+2)%3
+        tree1 = MaxIntervalTree([p.position[a1] for p in packages] + [p.position[a1] + p.getDimensions()[a1] for p in packages])
+        tree2 = MaxIntervalTree([p.position[a2] for p in packages] + [p.position[a2] + p.getDimensions()[a2] for p in packages])
+
+        moved = False
+        for package in packages:
+            position = package.position
+            dimensions = package.getDimensions()
+            low1, high1 = position[a1], position[a1] + dimensions[a1]
+            low2, high2 = position[a2], position[a2] + dimensions[a2]
+            minPosition = max(tree1.query(low1, high1), tree2.query(low2, high2))
+            if position[axis] > minPosition:
+                package.position = replaceAxis(position, axis, minPosition)
+                moved = True
+            end = package.position[axis] + dimensions[axis]
+            tree1.raiseInterval(low1, high1, end)
+            tree2.raiseInterval(low2, high2, end)
+        return moved
 
     #Recalculate the Extreme Points of the ULD after Normalising
     def recalculate_corners(self):
@@ -479,42 +661,92 @@ class ULD:
             
     #Replace a Higher Cost, Higher Volume unplaced package with a packed package, by pushing out other packages and normalising back
     def inflate_and_replace(self,pck,rep,lpp = False):
-
+        return self.tryReplace(pck, rep, lpp) is not None
+
+    #Get the packed packages an unplaced package may replace, in the order of the package list: packages of the same priority, of lower or equal cost,
+    #of lower or equal volume unless lpp is set, and heavy enough to leave room for its weight unless checkWeight is off. Packages are indexed by priority and cost until the ULD changes
+    def replaceCandidates(self, pck, lpp = False, checkWeight = True):
+        if self.replaceIndex is None or self.replaceIndex[0] != self.epoch:
+            index = {}
+            for package in sorted(self.packages, key=lambda package: package.cost):
+                costs, packages = index.setdefault(package.priority, ([], []))
+                costs.append(package.cost)
+                packages.append(package)
+            self.replaceIndex = (self.epoch, index)
+        costs, packages = self.replaceIndex[1].get(pck.priority, ([], []))
+        weightLeft = self.weightLeft()
+        volume = pck.getVolume()
+        candidates = [package for package in packages[:bisect_right(costs, pck.cost)]
+                      if (lpp or package.getVolume() <= volume) and (not checkWeight or weightLeft + package.weight >= pck.weight)]
+        if len(candidates) > 1:
+            order = {package: i for i, package in enumerate(self.packages)}
+            candidates.sort(key=order.get)
+        return candidates
+
+    #Get the packed packages the replacement loops try an unplaced package against, in the sequence they have always used: the package list in order,
+    #where the first failed try also passes over the package right after it. Packages too light to make room are still tried and fail on the weight check
+    def replaceSequence(self, pck, lpp = False):
+        candidates = self.replaceCandidates(pck, lpp, checkWeight = False)
+        if len(candidates) < 2: return candidates
+        passedOver = self.packages.index(candidates[0]) + 1
+        if passedOver < len(self.packages) and self.packages[passedOver] is candidates[1]:
+            del candidates[1]
+        return candidates
+
+    #Try to replace a packed package with an unplaced one, placing it at the position of the replaced package by pushing out other packages and normalising back.
+    #Nothing is changed unless the package fits, the push limits are brought up to date first. Returns the undo log of the replacement, rolled back by undoReplace, or None if it does not fit
+    def tryReplace(self, pck, rep, lpp = False):
         if(pck.priority != rep.priority):
-            return False
+            return None
         if(pck.cost < rep.cost):
-            return False
+            return None
         if((not lpp)and(pck.getVolume() < rep.getVolume())):
-            return False
-        
-        currpack = self.packages.copy()
+            return None
+        if self.weightLeft() + rep.weight < pck.weight:
+            return None
 
-        self.packages.remove(rep)
+        pckState = (pck.position, pck.rotation, pck.getDimensions())
+        pivot = rep.position
+        self.calculatePushLimit()
+        if not self.canPushAdd(pck, pivot, skip = rep):
+            return None
 
-        if(self.pushAddBox(pck,rep.position)):
-            rep.ULD = -1
-            rep.pos = [-1,-1,-1]
-            rep.pushLim = [-1,-1,-1]
-            self.packages.remove(pck)
-            for i,p in enumerate(currpack):
-                if(p == rep):
-                    currpack[i] = pck
-                    break
-            self.packages = currpack
-            # print("YAYY")
-            return True
-        
-        self.packages = currpack
-        return False
-    
+        positions = [(package, package.position) for package in self.packages]
+        log = (rep, rep.pushLim, pck, pckState, self.isPriority, positions)
 
-    #Check is its possible to insert a package at a pivot point by pushing all other boxes as far as possible
-    def pushAddBox(self, currPackage, pivot, rotations = Rotation.ALL):
+        self.packages.remove(rep)
+        self.pushOut(pivot[0],pivot[1],pivot[2])
+        pck.ULD = self.id
+        self.packages.append(pck)
+        self.normalize()
+        # the new package takes the place of the replaced one in the package list
+        self.packages = [pck if package is rep else package for package, _ in positions]
+        self.rebuildIndex()
+        if(pck.priority == "Priority"): self.isPriority = True
+
+        rep.ULD = -1
+        rep.position = (-1,-1,-1)
+        rep.pushLim = [-1,-1,-1]
+        return log
+
+    #Roll back a replacement of tryReplace, putting the replaced package and every pushed package back where they were
+    def undoReplace(self, log):
+        rep, pushLim, pck, pckState, isPriority, positions = log
+        for package, position in positions:
+            package.position = position
+        self.packages = [package for package, _ in positions]
+        rep.ULD = self.id
+        rep.pushLim = pushLim
+        [pck.position, pck.rotation, pck.dimensions] = pckState
+        pck.ULD = -1
+        self.isPriority = isPriority
+        self.rebuildIndex()
+
+    #Check if a package fits at a pivot point once all other boxes are pushed as far as possible, ignoring skip if given.
+    #On success the package is left at the pivot in the first rotation that fits, the ULD itself is not changed
+    def canPushAdd(self, currPackage, pivot, rotations = Rotation.ALL, skip = None):
         prevPosition = currPackage.position
-        currPackage.position = list(pivot)
-        valid = False
-        if (self.weightLeft() < currPackage.weight) : 
-            return valid
+        currPackage.position = tuple(pivot)
         for rotation in rotations:
             currPackage.rotation = rotation
             dimensions = currPackage.getDimensions()
@@ -527,15 +759,19 @@ class ULD:
            
             valid = True
 
-            for pck in self.packages:
+            # A pushed package only moves away from the pivot, so it can only hit the new package if it already overlaps its box
+            for pck in self.index.query(pivot, dimensions):
+                if pck is skip: continue
                 
-                pos = pck.position.copy()
-                if(pck.position[0]>=pivot[0]):
-                    pck.position[0] = pck.position[0] + pck.pushLim[0]
-                if(pck.position[1]>=pivot[1]):
-                    pck.position[1] = pck.position[1] + pck.pushLim[1]
-                if(pck.position[2]>=pivot[2]):
-                    pck.position[2] = pck.position[2] + pck.pushLim[2]
+                pos = pck.position
+                [px, py, pz] = pos
+                if(px>=pivot[0]):
+                    px = px + pck.pushLim[0]
+                if(py>=pivot[1]):
+                    py = py + pck.pushLim[1]
+                if(pz>=pivot[2]):
+                    pz = pz + pck.pushLim[2]
+                pck.position = (px, py, pz)
                     
                 if pck.isIntersecting(currPackage):
                     pck.position = pos
@@ -544,27 +780,115 @@ class ULD:
                 pck.position = pos
 
             if valid:
-                self.pushOut(pivot[0],pivot[1],pivot[2])
-                currPackage.ULD = self.id
-                self.packages.append(currPackage)
-                self.normalize()
-
-                if(currPackage.priority == "Priority"): self.isPriority = True
-                return valid                           
+                return True
                 
         currPackage.position = prevPosition
-        return valid
+        return False
+
+    #Check is its possible to insert a package at a pivot point by pushing all other boxes as far as possible
+    def pushAddBox(self, currPackage, pivot, rotations = Rotation.ALL):
+        if (self.weightLeft() < currPackage.weight) : 
+            return False
+        if not self.canPushAdd(currPackage, pivot, rotations):
+            return False
+        self.pushOut(pivot[0],pivot[1],pivot[2])
+        currPackage.ULD = self.id
+        self.packages.append(currPackage)
+        self.normalize()
+        self.rebuildIndex()
 
+        if(currPackage.priority == "Priority"): self.isPriority = True
+        return True
+
+
+    #MOVE EVALUATION. The evaluate functions tell if a move is feasible and how much it changes the cost by, without changing the ULD or the packages.
+    #They return (feasible, delta, placement), placement being the (position, rotation) the arriving package would get, None if no package arrives
+    #or, for swaps, as the packages are normalised back after the swap and the arriving package only gets its place then.
+    #Packages leaving the ULD become unplaced, unless they arrive in another ULD, whose side of the move is evaluated on that ULD
+
+    #Get the change of the cost by the Priority flag of the ULD once the packages leaving have left and the package arriving has arrived
+    def priorityDelta(self, leaving = (), arriving = None):
+        if self.ledger is None: return 0
+        if arriving is not None and arriving.priority == "Priority":
+            isPriority = True
+        elif any(package.priority == "Priority" for package in leaving):
+            isPriority = any(package.priority == "Priority" for package in self.packages if package not in leaving)
+        else:
+            isPriority = self.isPriority
+        return self.ledger.k*(int(isPriority) - int(self.isPriority))
+
+    #Evaluate adding a Package at a pivot as addBox would: the first rotation that fits, projected towards the origin. skip is left out of the ULD,
+    #e.g. the package itself to evaluate turning it in place
+    def evaluateInsert(self, currPackage, pivot, rotations = Rotation.ALL, skip = None):
+        weightLeft = self.weightLeft() + (skip.weight if skip is not None and skip.ULD == self.id else 0)
+        if weightLeft < currPackage.weight:
+            return False, 0, None
+        for rotation in rotations:
+            dimensions = Rotation.AXES[rotation]((currPackage.length,currPackage.width,currPackage.height))
+            if (
+                pivot[0] + dimensions[0] > self.length or
+                pivot[1] + dimensions[1] > self.width or
+                pivot[2] + dimensions[2] > self.height
+            ):
+                continue
+            if any(other is not skip and other is not currPackage and boxesIntersect(pivot, dimensions, other.position, other.getDimensions())
+                   for other in self.index.query(pivot, dimensions)):
+                continue
+
+            position = tuple(pivot)
+            for axis in Axis.ALL:
+                project = self.projectBox(position, dimensions, axis, skip)
+                if project != -1:
+                    position = replaceAxis(position, axis, project)
+
+            if currPackage.ULD == self.id:
+                delta = 0
+            else:
+                delta = (-currPackage.cost if str(currPackage.ULD) == '-1' else 0) + self.priorityDelta(arriving = currPackage)
+            return True, delta, (position, rotation)
+        return False, 0, None
+
+    #Evaluate taking a packed Package out of the ULD. Only packages holding no other package up can leave, so nothing is left floating
+    def evaluateRemove(self, currPackage):
+        if currPackage.ULD != self.id or self.supportGraph().supported.get(currPackage):
+            return False, 0, None
+        return True, currPackage.cost + self.priorityDelta(leaving = (currPackage,)), None
+
+    #Evaluate swapping a packed Package for another one placed at its position as tryReplace would, by pushing out the other packages
+    #as far as their push limits allow. The other package comes from outside the ULD, unplaced or from another ULD. Gives no placement.
+    #Push limits computed for the evaluation are put back afterwards, along with the epoch of the push limit cache
+    def evaluateSwap(self, currPackage, other):
+        if currPackage.ULD != self.id or other.ULD == self.id:
+            return False, 0, None
+        if self.weightLeft() + currPackage.weight < other.weight:
+            return False, 0, None
+        pushLimState = None
+        if self.pushLimEpoch != self.epoch:
+            pushLimState = (self.pushLimEpoch, [(package, list(package.pushLim)) for package in self.packages])
+            self.calculatePushLimit()
+        otherState = (other.position, other.rotation, other.getDimensions())
+        fits = self.canPushAdd(other, currPackage.position, skip = currPackage)
+        [other.position, other.rotation, other.dimensions] = otherState
+        if pushLimState is not None:
+            self.pushLimEpoch = pushLimState[0]
+            for package, pushLim in pushLimState[1]:
+                package.pushLim = pushLim
+        if not fits:
+            return False, 0, None
+        delta = (currPackage.cost - other.cost if str(other.ULD) == '-1' else 0) + self.priorityDelta(leaving = (currPackage,), arriving = other)
+        return True, delta, None
 
 
 # Package Class for MIPSolver
 class CartonPackage:
+
+    __slots__ = ("id", "ULD", "position", "dimensions", "weight", "cost", "rotation", "priority")
     
     def __init__(self, id, uldid, position, dimensions, weight, cost, rotation):
         self.id = id
         self.ULD = uldid
-        self.position = position
-        self.dimensions = dimensions
+        self.position = tuple(position)
+        self.dimensions = tuple(dimensions)
         self.weight = weight
         self.cost = cost
         self.rotation = rotation
@@ -0,0 +1,92 @@
+#SUPPORT GRAPH OF A ULD, LINKING EVERY PACKAGE TO THE PACKAGES WHOSE TOP FACE ITS BASE RESTS ON, WITH THE AREA OF EACH CONTACT
+
+
+#Get the area shared by the horizontal faces of two boxes
+def contactArea(position1, dimensions1, position2, dimensions2):
+    x = min(position1[0] + dimensions1[0], position2[0] + dimensions2[0]) - max(position1[0], position2[0])
+    if x <= 0: return 0
+    y = min(position1[1] + dimensions1[1], position2[1] + dimensions2[1]) - max(position1[1], position2[1])
+    if y <= 0: return 0
+    return x*y
+
+
+class SupportGraph:
+
+    #Initialisation Function for an empty graph. An invalidated graph ignores updates until it is rebuilt
+    def __init__(self):
+        self.tops = {}          # height -> {package: None} of the packages whose top face is at that height
+        self.bases = {}         # height -> {package: None} of the packages whose base is at that height
+        self.boxes = {}         # package -> (position, dimensions) it was registered with
+        self.supporters = {}    # package -> {package below: contact area}
+        self.supported = {}     # package -> {package above: contact area}
+        self.valid = True
+
+    #Register a package, linking it to the packages it rests on and the packages resting on it
+    def insert(self, package):
+        if not self.valid: return
+        position = package.position
+        dimensions = package.getDimensions()
+        base = position[2]
+        top = position[2] + dimensions[2]
+        below = self.supporters[package] = {}
+        above = self.supported[package] = {}
+        for other in self.tops.get(base, ()):
+            area = contactArea(position, dimensions, *self.boxes[other])
+            if area > 0:
+                below[other] = area
+                self.supported[other][package] = area
+        for other in self.bases.get(top, ()):
+            area = contactArea(position, dimensions, *self.boxes[other])
+            if area > 0:
+                above[other] = area
+                self.supporters[other][package] = area
+        self.tops.setdefault(top, {})[package] = None
+        self.bases.setdefault(base, {})[package] = None
+        self.boxes[package] = (position, dimensions)
+
+    def remove(self, package):
+        if not self.valid: return
+        box = self.boxes.pop(package, None)
+        if box is None: return
+        for other in self.supporters.pop(package):
+            del self.supported[other][package]
+        for other in self.supported.pop(package):
+            del self.supporters[other][package]
+        [position, dimensions] = box
+        del self.tops[position[2] + dimensions[2]][package]
+        del self.bases[position[2]][package]
+
+    def update(self, package):
+        if not self.valid: return
+        self.remove(package)
+        self.insert(package)
+
+    def clear(self):
+        self.tops = {}
+        self.bases = {}
+        self.boxes = {}
+        self.supporters = {}
+        self.supported = {}
+        self.valid = True
+
+    def rebuild(self, packages):
+        self.clear()
+        for package in packages:
+            self.insert(package)
+
+    #Mark the graph out of date, when packages were moved without updating it
+    def invalidate(self):
+        self.valid = False
+
+    #Get the total base area of a package resting on the top faces of other packages. Packages not registered with their current box are
+    #checked against the registered top faces at their base height
+    def supportArea(self, package):
+        position = package.position
+        dimensions = package.getDimensions()
+        if self.boxes.get(package) == (position, dimensions):
+            return sum(self.supporters[package].values())
+        area = 0
+        for other in self.tops.get(position[2], ()):
+            if other is not package:
+                area += contactArea(position, dimensions, *self.boxes[other])
+        return area
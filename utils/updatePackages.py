@@ -1,56 +1,109 @@
-from utils.structs import Axis
-
 def updatePackages(packages,newPackages,ulds):
-    def updatePackages(packages, newPackages, ulds):
-        """
-        Update the list of packages with new package information and adjust their positions within ULDs (Unit Load Devices).
-        Args:
-            packages (list): A list of current package objects.
-            newPackages (list): A list of new package objects with updated information.
-            ulds (list): A list of ULD objects.
-        The function performs the following steps:
-        1. Updates the attributes of packages in the `packages` list with the corresponding attributes from `newPackages`.
-        2. Adds packages to the appropriate ULD's package list if they are not already present.
-        3. Removes packages from ULDs if their ULD attribute is set to '-1'.
-        4. Attempts to replace unpacked packages (ULD attribute is '-1') into ULDs by inflating and replacing existing packages.
-        5. Sorts the packages within each ULD based on their position along each axis and adjusts their positions using the `projectFinal` method.
-        """
+    """
+    Update the list of packages with new package information and adjust their positions within ULDs (Unit Load Devices).
+    Args:
+        packages (list): A list of current package objects.
+        newPackages (list): A list of new package objects with updated information.
+        ulds (list): A list of ULD objects.
+    Returns:
+        list: The ULDs whose contents or package positions changed, in the order of `ulds`.
+    The function performs the following steps:
+    1. Updates the attributes of packages in the `packages` list with the corresponding attributes from `newPackages`, matched by id.
+    2. Adds packages to the appropriate ULD's package list if they are not already present.
+    3. Removes packages from ULDs if their ULD attribute no longer matches.
+    4. Attempts to replace unpacked packages (ULD attribute is '-1') into ULDs by inflating and replacing existing packages.
+    5. Projects the packages of every ULD modified since its last settled projection, using `ULD.projectAll`.
+    """
+
+    uldById = {uld.id: uld for uld in ulds}
+    members = {uld.id: set(uld.packages) for uld in ulds}
+    changed = set()
+
+    # first occurrence of an id wins, as in a linear search
+    newById = {}
+    for finalpackage in newPackages:
+        newById.setdefault(finalpackage.id, finalpackage)
 
     for package in packages:
-        for finalpackage in newPackages:
-            if package.id == finalpackage.id:
-                package.ULD = finalpackage.ULD
-                if str(package.ULD) != '-1':
-                    for uld in ulds:
-                        if uld.id == package.ULD and package not in uld.packages:
-                            uld.packages.append(package)
-                package.position = finalpackage.position
-                package.dimensions = finalpackage.dimensions
-                package.rotation = -1
-                break
+        finalpackage = newById.get(package.id)
+        if finalpackage is None:
+            continue
+        oldULD = package.ULD
+        oldPosition = package.position
+        oldDimensions = package.getDimensions()
+        package.ULD = finalpackage.ULD
+        if str(package.ULD) != '-1':
+            uld = uldById.get(package.ULD)
+            if uld is not None and package not in members[uld.id]:
+                uld.packages.append(package)
+                members[uld.id].add(package)
+        package.position = tuple(finalpackage.position)
+        package.dimensions = finalpackage.dimensions
+        package.rotation = -1
+        if oldULD != package.ULD or oldPosition != package.position or oldDimensions != package.getDimensions():
+            changed.add(oldULD)
+            changed.add(package.ULD)
 
 
     for uld in ulds:
         newpackages = [package for package in uld.packages if package.ULD == uld.id]
-        uld.packages = newpackages
+        if uld.id in changed or len(newpackages) != len(uld.packages):
+            changed.add(uld.id)
+            uld.packages = newpackages
+            uld.rebuildIndex()
 
     for unpacked_package in packages:
         if str(unpacked_package.ULD) == '-1':
             done = False
             for jj in range(len(ulds)):
-                ulds[jj].calculatePushLimit()
-                for poss_replace in ulds[jj].packages:
+                candidates = ulds[jj].replaceSequence(unpacked_package, lpp=True)
+                if candidates: ulds[jj].calculatePushLimit()
+                for poss_replace in candidates:
                     if(ulds[jj].inflate_and_replace(unpacked_package,poss_replace,lpp=True)):
-                       
+                        changed.add(ulds[jj].id)
                         done = True
                         break
                 if done:
-                    break   
+                    break
+
+
+    # ULDs that did not change since their last settled projection are skipped by projectAll
+    for uld in ulds:
+        if uld.projectAll():
+            changed.add(uld.id)
+
+    return [uld for uld in ulds if uld.id in changed]
+
+
+def snapshotPackages(packages, ulds):
+    """
+    Take an exact snapshot of a packing, to be put back with `restorePackages`.
+    Args:
+        packages (list): A list of package objects.
+        ulds (list): A list of ULD objects.
+    Returns:
+        tuple: The ULD, position, rotation and dimensions of every package, and the packages of every ULD in their order.
+    """
+    states = [(package, package.ULD, package.position, package.rotation, package.getDimensions()) for package in packages]
+    contents = {uld.id: list(uld.packages) for uld in ulds}
+    return states, contents
 
 
+def restorePackages(snapshot, ulds):
+    """
+    Put a packing back exactly as `snapshotPackages` took it. Unlike `updatePackages`, no package is replaced or projected.
+    Args:
+        snapshot (tuple): A snapshot from `snapshotPackages`.
+        ulds (list): The ULD objects of the snapshot.
+    The Priority flag of every ULD is recomputed from its packages, so the CostLedger follows the restored packing.
+    """
+    states, contents = snapshot
+    for package, uldId, position, rotation, dimensions in states:
+        package.ULD = uldId
+        package.position = position
+        package.rotation = rotation
+        package.dimensions = dimensions
     for uld in ulds:
-        for axis in Axis.ALL:
-            uld.packages.sort(key=lambda x: x.position[axis])
-            for package in uld.packages:
-                if uld.projectFinal(package,axis) != -1:
-                    package.position[axis] = uld.projectFinal(package,axis)
\ No newline at end of file
+        uld.packages = list(contents.get(uld.id, []))
+        uld.rebuildIndex()
+        uld.isPriority = any(package.priority == "Priority" for package in uld.packages)